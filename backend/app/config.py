@@ -7,6 +7,27 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./controlled_anonymity.db")
 # Redis
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 
+# Sharded matchmaking - comma-separated unix socket paths of match shard
+# processes (see services/match_shard.py). Empty = in-process queues.
+MATCH_SHARDS = [p.strip() for p in os.getenv("MATCH_SHARDS", "").split(",") if p.strip()]
+# How long a worker waits for a shard's reply before giving up on the request
+MATCH_SHARD_TIMEOUT_SECONDS = float(os.getenv("MATCH_SHARD_TIMEOUT_SECONDS", "5"))
+
+# Priority matching (in-memory queues, see services/match_priority.py) - match
+# the compatible waiter with the best wait time + karma tier - rejoin penalty
+# instead of the first one found.
+MATCH_PRIORITY = os.getenv("MATCH_PRIORITY", "False").lower() == "true"
+# Queue credit in seconds per karma tier (access level)
+MATCH_PRIORITY_TIER_BOOST_SECONDS = {
+    "full": float(os.getenv("MATCH_PRIORITY_FULL_BOOST_SECONDS", "10")),
+    "standard": 0.0,
+    "warning": -float(os.getenv("MATCH_PRIORITY_WARNING_PENALTY_SECONDS", "10")),
+}
+# Each re-join within the window costs this much credit, up to the max
+MATCH_PRIORITY_REJOIN_PENALTY_SECONDS = float(os.getenv("MATCH_PRIORITY_REJOIN_PENALTY_SECONDS", "2"))
+MATCH_PRIORITY_REJOIN_WINDOW_SECONDS = float(os.getenv("MATCH_PRIORITY_REJOIN_WINDOW_SECONDS", "60"))
+MATCH_PRIORITY_MAX_REJOIN_PENALTY_SECONDS = float(os.getenv("MATCH_PRIORITY_MAX_REJOIN_PENALTY_SECONDS", "10"))
+
 # Karma settings
 KARMA_INITIAL = 100
 KARMA_CHAT_COMPLETE = 0
@@ -14,6 +35,7 @@ KARMA_REPORTED = -15
 KARMA_REPORT_VERIFIED = -30
 KARMA_FALSE_REPORT = -10
 KARMA_DAILY_LOGIN = 0
+KARMA_SPAM = -10
 
 # Karma thresholds
 KARMA_FULL_ACCESS = 100
@@ -22,9 +44,46 @@ KARMA_WARNING = 25
 KARMA_TEMP_BAN = 25
 KARMA_PERMANENT_BAN = 0
 
+# Cross-partner spam detection (in memory, see services/spam.py) - a message
+# near-identical (estimated Jaccard similarity of its character shingles) to
+# ones the device recently sent to SPAM_MIN_PARTNERS different partners
+# within SPAM_WINDOW_SECONDS is not relayed, and the first one costs KARMA_SPAM.
+SPAM_DETECTION_ENABLED = os.getenv("SPAM_DETECTION_ENABLED", "True").lower() == "true"
+SPAM_SIMILARITY = float(os.getenv("SPAM_SIMILARITY", "0.6"))
+SPAM_MIN_PARTNERS = int(os.getenv("SPAM_MIN_PARTNERS", "4"))
+SPAM_WINDOW_SECONDS = float(os.getenv("SPAM_WINDOW_SECONDS", "600"))
+# Shorter messages ("hi", "hey how are you?") are never checked
+SPAM_MIN_LENGTH = int(os.getenv("SPAM_MIN_LENGTH", "30"))
+# Recent messages remembered per device, and devices remembered (LRU)
+SPAM_HISTORY = int(os.getenv("SPAM_HISTORY", "8"))
+SPAM_TRACKED_DEVICES = int(os.getenv("SPAM_TRACKED_DEVICES", "10000"))
+
+# Report-burst auto-moderation (in memory, see services/report_score.py) - a
+# decaying score per reported device, +1 per distinct reporter. Crossing the
+# threshold soft-suspends the device: its socket is closed and reconnects are
+# refused for the suspension period. With the defaults, three distinct
+# reporters within about four minutes trigger a suspension.
+REPORT_SCORE_HALF_LIFE_SECONDS = float(os.getenv("REPORT_SCORE_HALF_LIFE_SECONDS", "600"))
+REPORT_SCORE_SUSPEND_THRESHOLD = float(os.getenv("REPORT_SCORE_SUSPEND_THRESHOLD", "2.5"))
+REPORT_SCORE_MIN_REPORTERS = int(os.getenv("REPORT_SCORE_MIN_REPORTERS", "3"))
+# Distinct reporters remembered per device
+REPORT_SCORE_MAX_REPORTERS = int(os.getenv("REPORT_SCORE_MAX_REPORTERS", "16"))
+REPORT_SCORE_SUSPEND_SECONDS = float(os.getenv("REPORT_SCORE_SUSPEND_SECONDS", "900"))
+
+# Banned-device denylist (see services/denylist.py) - temp-ban entries are
+# re-checked against the database after this long
+DENYLIST_TEMP_BAN_SECONDS = float(os.getenv("DENYLIST_TEMP_BAN_SECONDS", "86400"))
+# Share ban changes between workers over Redis pub/sub (REDIS_URL)
+DENYLIST_REDIS = os.getenv("DENYLIST_REDIS", "False").lower() == "true"
+
+# Conditional GETs for /api/auth/me and /api/reports/karma (see
+# services/user_versions.py) - how long a validated ETag is answered with 304
+# from memory before the database is consulted again
+USER_ETAG_TTL_SECONDS = float(os.getenv("USER_ETAG_TTL_SECONDS", "30"))
+
 # Rate limits
 DAILY_SPECIFIC_FILTER_LIMIT = 5
-QUEUE_COOLDOWN_SECONDS = 10
+QUEUE_COOLDOWN_SECONDS = int(os.getenv("QUEUE_COOLDOWN_SECONDS", "10"))
 
 # CORS - Allow all localhost ports during development
 CORS_ORIGINS = [
@@ -38,3 +97,105 @@ CORS_ORIGINS = [
     "http://127.0.0.1:5500",
     "null",  # For file:// protocol
 ]
+
+# Demo Mode - Disables ML verification for lightweight deployment
+DEMO_MODE = os.getenv("DEMO_MODE", "True").lower() == "true"
+
+# Verification result cache (perceptual hash -> result, never pixels).
+# Near-duplicates within MAX_DISTANCE bits only match the same device.
+VERIFICATION_CACHE_SIZE = int(os.getenv("VERIFICATION_CACHE_SIZE", "1024"))
+VERIFICATION_CACHE_TTL_SECONDS = int(os.getenv("VERIFICATION_CACHE_TTL_SECONDS", "600"))
+VERIFICATION_CACHE_MAX_DISTANCE = int(os.getenv("VERIFICATION_CACHE_MAX_DISTANCE", "4"))
+
+# Logging - records are written by a background thread (see services/tracing.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of find_match calls traced when LOG_LEVEL=DEBUG
+MATCH_TRACE_SAMPLE_RATE = float(os.getenv("MATCH_TRACE_SAMPLE_RATE", "0.1"))
+
+# Event-loop health monitor (see services/loop_monitor.py) - lag histogram
+# plus stack samples of callbacks that block the loop; /debug/loop
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "True").lower() == "true"
+LOOP_MONITOR_INTERVAL_SECONDS = float(os.getenv("LOOP_MONITOR_INTERVAL_SECONDS", "0.1"))
+# The loop counts as blocked once the heartbeat is this late
+LOOP_SLOW_CALLBACK_SECONDS = float(os.getenv("LOOP_SLOW_CALLBACK_SECONDS", "0.1"))
+# Blocking call sites listed by /debug/loop
+LOOP_MONITOR_TOP = int(os.getenv("LOOP_MONITOR_TOP", "20"))
+
+# On-demand sampling profiler (see services/profiler.py) - mounts
+# POST /admin/profile. Off by default; requests must send ADMIN_TOKEN in the
+# X-Admin-Token header (with no token set, every request is refused).
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "False").lower() == "true"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+
+# Typing indicators / read receipts - max one relayed update per interval per sender
+TYPING_COALESCE_SECONDS = float(os.getenv("TYPING_COALESCE_SECONDS", "1.0"))
+READ_RECEIPT_COALESCE_SECONDS = float(os.getenv("READ_RECEIPT_COALESCE_SECONDS", "1.0"))
+
+# Inbound websocket rate limits (per connection, see services/rate_limit.py)
+RATE_LIMIT_MAX_FRAME_CHARS = int(os.getenv("RATE_LIMIT_MAX_FRAME_CHARS", "4096"))
+RATE_LIMIT_FRAMES_PER_SECOND = float(os.getenv("RATE_LIMIT_FRAMES_PER_SECOND", "20"))
+RATE_LIMIT_FRAME_BURST = float(os.getenv("RATE_LIMIT_FRAME_BURST", "40"))
+RATE_LIMIT_MESSAGES_PER_SECOND = float(os.getenv("RATE_LIMIT_MESSAGES_PER_SECOND", "3"))
+RATE_LIMIT_MESSAGE_BURST = float(os.getenv("RATE_LIMIT_MESSAGE_BURST", "10"))
+# join_queue and next_match each get their own bucket
+RATE_LIMIT_JOINS_PER_MINUTE = float(os.getenv("RATE_LIMIT_JOINS_PER_MINUTE", "20"))
+RATE_LIMIT_JOIN_BURST = float(os.getenv("RATE_LIMIT_JOIN_BURST", "5"))
+# RPC calls over the chat socket (profile, karma, reports)
+RATE_LIMIT_RPCS_PER_SECOND = float(os.getenv("RATE_LIMIT_RPCS_PER_SECOND", "2"))
+RATE_LIMIT_RPC_BURST = float(os.getenv("RATE_LIMIT_RPC_BURST", "5"))
+# Dropped frames tolerated per window before the socket is closed (code 4008)
+RATE_LIMIT_STRIKES = int(os.getenv("RATE_LIMIT_STRIKES", "50"))
+RATE_LIMIT_STRIKE_WINDOW_SECONDS = float(os.getenv("RATE_LIMIT_STRIKE_WINDOW_SECONDS", "10"))
+
+# Session resumption - a chat survives a dropped socket for this long (0 = off)
+RESUME_GRACE_SECONDS = float(os.getenv("RESUME_GRACE_SECONDS", "20"))
+# Most recent frames kept per device for replay on resume
+RESUME_BUFFER_FRAMES = int(os.getenv("RESUME_BUFFER_FRAMES", "64"))
+
+# Content filter on relayed messages (see services/content_filter.py).
+# Blocked terms come from CONTENT_FILTER_TERMS (comma-separated) and
+# CONTENT_FILTER_FILE (one per line), which is re-read when it changes.
+CONTENT_FILTER_ENABLED = os.getenv("CONTENT_FILTER_ENABLED", "True").lower() == "true"
+CONTENT_FILTER_TERMS = os.getenv("CONTENT_FILTER_TERMS", "")
+CONTENT_FILTER_FILE = os.getenv("CONTENT_FILTER_FILE", "")
+CONTENT_FILTER_RELOAD_SECONDS = float(os.getenv("CONTENT_FILTER_RELOAD_SECONDS", "5"))
+CONTENT_FILTER_BLOCK_PHONES = os.getenv("CONTENT_FILTER_BLOCK_PHONES", "True").lower() == "true"
+CONTENT_FILTER_BLOCK_LINKS = os.getenv("CONTENT_FILTER_BLOCK_LINKS", "True").lower() == "true"
+
+# Report evidence - the last messages of each active chat are kept in memory
+# (see services/transcripts.py) and saved with a report only when one is filed.
+# 0 disables transcripts.
+TRANSCRIPT_MAX_MESSAGES = int(os.getenv("TRANSCRIPT_MAX_MESSAGES", "50"))
+TRANSCRIPT_MAX_BYTES = int(os.getenv("TRANSCRIPT_MAX_BYTES", "16384"))
+
+# Production server (python -m app.serve). WEB_WORKERS unset picks one worker
+# for SQLite or without MATCH_SHARDS, otherwise one per CPU.
+WEB_HOST = os.getenv("HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("PORT", "8000"))
+WEB_WORKERS = os.getenv("WEB_WORKERS", "")
+# Proxies whose X-Forwarded-For/-Proto headers are trusted (comma-separated
+# IPs, or "*" only when nothing but the proxy can reach the workers)
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+# On SIGTERM websockets are closed with 1012 right away (clients resume);
+# this is how long in-flight HTTP requests get to finish before workers exit
+GRACEFUL_SHUTDOWN_SECONDS = float(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "20"))
+
+# Static frontend served by the API (see services/static_assets.py) - set
+# FRONTEND_DIST to a bundle built with `python -m app.services.static_assets`
+FRONTEND_DIST = os.getenv("FRONTEND_DIST", "")
+FRONTEND_PATH = "/" + os.getenv("FRONTEND_PATH", "/app").strip("/")
+
+# Matchmaking state snapshots (in-memory backend, see services/snapshot.py).
+# Queues, chat pairs and resume sessions are checkpointed to this file and
+# restored on startup, so clients resume instead of re-queueing. Empty = off.
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "")
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "5"))
+# Older snapshots are ignored on startup
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", "120"))
+
+# Websocket wire protocol - offer the compact MessagePack protocol (chat.msgpack.v1,
+# see services/ws_protocol.py) to clients that ask for it; JSON is always available.
+# Permessage-deflate is negotiated by uvicorn: --ws-per-message-deflate=false
+# (or UVICORN_WS_PER_MESSAGE_DEFLATE=false) turns it off for a deployment.
+WS_BINARY_PROTOCOL = os.getenv("WS_BINARY_PROTOCOL", "True").lower() == "true"
@@ -5,9 +5,17 @@ Main application entry point.
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.config import CORS_ORIGINS
-from app.database import init_db
-from app.routers import auth, reports, ws_chat, debug
+from app.config import CORS_ORIGINS, FRONTEND_DIST, PROFILER_ENABLED
+from app.database import init_db, SessionLocal
+from app.routers import auth, reports, ws_chat, debug, metrics
+from app.services.denylist import denylist
+from app.services.karma import load_denylist
+from app.services.loop_monitor import loop_monitor, start_loop_monitor
+from app.services.metrics import RouteLabelMiddleware
+from app.services.tracing import setup_logging, shutdown_logging
+
+# Write logs from a background thread so stdout never blocks the event loop
+setup_logging()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -23,19 +31,51 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the frontend read validators for conditional GETs
+    expose_headers=["ETag"],
 )
 
+# Label DB metrics with the route being served
+app.add_middleware(RouteLabelMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(reports.router)
 app.include_router(ws_chat.router)
 app.include_router(debug.router)
+app.include_router(metrics.router)
+
+if PROFILER_ENABLED:
+    from app.routers import profiler
+    app.include_router(profiler.router)
+
+if FRONTEND_DIST:
+    from app.routers import frontend
+    app.include_router(frontend.router)
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup."""
+    """Initialize database, load banned devices and restore matchmaking state."""
+    start_loop_monitor()
     init_db()
+    db = SessionLocal()
+    try:
+        load_denylist(db)
+    finally:
+        db.close()
+    denylist.start()
+    await ws_chat.restore_state()
+    ws_chat.start_snapshots()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Snapshot matchmaking state and flush queued log records."""
+    await ws_chat.stop_snapshots()
+    await denylist.stop()
+    await loop_monitor.stop()
+    shutdown_logging()
 
 
 @app.get("/")
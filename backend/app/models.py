@@ -1,6 +1,6 @@
 """Database models - No PII stored."""
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, Date, DateTime, Text, Enum as SQLEnum, UniqueConstraint
 import enum
 
 from app.database import Base
@@ -44,3 +44,35 @@ class Report(Base):
     status = Column(SQLEnum(ReportStatus), default=ReportStatus.PENDING)
     created_at = Column(DateTime, default=datetime.utcnow)
     resolved_at = Column(DateTime, nullable=True)
+
+
+class ReportTranscript(Base):
+    """
+    The last messages of the reported chat, captured when the report was
+    filed (JSON list of {"from": "reporter"|"reported", "timestamp", "content"}).
+    """
+    __tablename__ = "report_transcripts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    report_id = Column(Integer, index=True, nullable=False)
+    messages = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ReportDailyRollup(Base):
+    """
+    Per-device, per-day report counters (see services/report_rollup.py).
+    Days are the UTC day a report was filed; verified/rejected count the
+    device's received reports by outcome, filed_rejected its false reports.
+    """
+    __tablename__ = "report_daily_rollups"
+    __table_args__ = (UniqueConstraint("device_id", "day", name="uq_report_rollup_device_day"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String(64), nullable=False)
+    day = Column(Date, nullable=False)
+    received = Column(Integer, default=0, nullable=False)
+    filed = Column(Integer, default=0, nullable=False)
+    verified = Column(Integer, default=0, nullable=False)
+    rejected = Column(Integer, default=0, nullable=False)
+    filed_rejected = Column(Integer, default=0, nullable=False)
@@ -1,6 +1,6 @@
 """Authentication and user management routes."""
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 
@@ -13,6 +13,7 @@ from app.services.karma import (
     award_daily_login,
     reset_daily_limits,
 )
+from app.services.user_versions import user_versions
 from app.services.verification import verify_gender_from_image
 from app.config import DAILY_SPECIFIC_FILTER_LIMIT
 
@@ -97,7 +98,7 @@ async def verify_gender(
     image_bytes = await image.read()
     
     # Verify gender (image deleted inside this function)
-    gender, error = verify_gender_from_image(image_bytes)
+    gender, error = verify_gender_from_image(image_bytes, device_id)
     
     # Clear memory reference
     del image_bytes
@@ -148,8 +149,21 @@ def update_profile(request: ProfileUpdateRequest, db: Session = Depends(get_db))
 
 
 @router.get("/me", response_model=UserResponse)
-def get_current_user(device_id: str, db: Session = Depends(get_db)):
-    """Get current user info."""
+def get_current_user(
+    device_id: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    Get current user info.
+    Supports If-None-Match: unchanged users get a 304 without a DB query.
+    """
+    cached = user_versions.not_modified(request, device_id, "me")
+    if cached:
+        return cached
+    version = user_versions.version(device_id)
+    
     user = db.query(UserSession).filter(
         UserSession.device_id == device_id
     ).first()
@@ -159,7 +173,7 @@ def get_current_user(device_id: str, db: Session = Depends(get_db)):
     
     access_level = check_access_level(db, device_id)
     
-    return UserResponse(
+    body = UserResponse(
         device_id=user.device_id,
         gender=user.gender_result,
         nickname=user.nickname,
@@ -169,3 +183,4 @@ def get_current_user(device_id: str, db: Session = Depends(get_db)):
         daily_matches_remaining=DAILY_SPECIFIC_FILTER_LIMIT - user.daily_specific_filter_count,
         is_verified=user.gender_result is not None,
     )
+    return user_versions.respond(request, response, device_id, "me", version, body)
@@ -1,51 +1,64 @@
 """
 Debug endpoints for troubleshooting
 """
-from fastapi import APIRouter
-from app.services.matching import matching_service, _memory_queues
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from app.services.loop_monitor import loop_monitor
+from app.services.matching import matching_service
+from app.services.queue_index import parse_bucket
+from app.services.verification_cache import verification_cache
 
 router = APIRouter()
 
 @router.get("/debug/queues")
 async def get_queue_state():
-    """Get current queue state and user stats for debugging"""
+    """
+    Queue sizes and oldest wait per (gender, looking_for) bucket, plus user stats.
+    Cheap enough to poll: reads running totals, never lists entries.
+    """
     from app.routers.ws_chat import manager
     
     online_count = len(manager.active_connections)
     # active_chats stores specific pairings twice (A->B, B->A), so we divide by 2 for unique chats
-    # However for 'Active Chats' display usually total people in chat is fine, or pairs. 
-    # Let's count unique pairs or just return total active chat sessions.
-    # Actually, let's just use len(active_chats) // 2 for unique conversations.
     active_chat_pairs = len(manager.active_chats) // 2
 
     return {
-        "queues": {
-            "male": [
-                {
-                    "device_id": q["device_id"][:12] + "...",
-                    "gender": q["gender"],
-                    "looking_for": q["looking_for"]
-                }
-                for q in _memory_queues.get("male", [])
-            ],
-            "female": [
-                {
-                    "device_id": q["device_id"][:12] + "...",
-                    "gender": q["gender"],
-                    "looking_for": q["looking_for"]
-                }
-                for q in _memory_queues.get("female", [])
-            ],
-            "any": [
-                {
-                    "device_id": q["device_id"][:12] + "...",
-                    "gender": q["gender"],
-                    "looking_for": q["looking_for"]
-                }
-                for q in _memory_queues.get("any", [])
-            ],
-        },
+        "buckets": await matching_service.queue_summary(),
         "stats": matching_service.get_queue_stats(),
         "online_users": online_count,
         "active_chats": active_chat_pairs
     }
+
+
+@router.get("/debug/queues/entries")
+async def get_queue_entries(
+    bucket: str = Query(..., description="gender:looking_for, e.g. male:any"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+):
+    """Page through one bucket's waiters, oldest first. Pass next_cursor to continue."""
+    parsed = parse_bucket(bucket)
+    if parsed is None:
+        raise HTTPException(status_code=400, detail="bucket must look like 'male:any'")
+    return await matching_service.queue_page(parsed, cursor, limit)
+
+
+@router.get("/debug/verification-cache")
+async def get_verification_cache_stats():
+    """Get verification result cache size and hit rate"""
+    return verification_cache.get_stats()
+
+
+@router.get("/debug/loop")
+async def get_loop_health(reset: bool = False):
+    """
+    Event loop lag distribution and the call sites that blocked it longest,
+    with a sample stack each. reset=true clears the offender list afterwards.
+    """
+    if not loop_monitor.running:
+        raise HTTPException(status_code=404, detail="Loop monitor is disabled")
+    report = loop_monitor.report()
+    if reset:
+        loop_monitor.reset()
+    return report
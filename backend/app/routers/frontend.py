@@ -0,0 +1,57 @@
+"""
+The static frontend, served from the prebuilt bundle (FRONTEND_DIST).
+
+Hashed assets are cached by browsers for a year as immutable; index.html is
+revalidated with its ETag. Every response uses the best precompressed
+variant the client accepts (see services/static_assets.py).
+"""
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import RedirectResponse
+
+from app.config import FRONTEND_DIST, FRONTEND_PATH
+from app.services.static_assets import INDEX, etag_matches, load, pick_encoding
+
+router = APIRouter(prefix=FRONTEND_PATH, include_in_schema=False)
+
+assets = load(FRONTEND_DIST)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def serve(request: Request, name: str) -> Response:
+    asset = assets.get(name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    encoding = pick_encoding(asset, request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": asset.etag(encoding),
+        "Cache-Control": IMMUTABLE if asset.immutable else REVALIDATE,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    body = asset.bodies[encoding]
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(body))
+        body = b""
+    return Response(body, headers=headers, media_type=asset.media_type)
+
+
+@router.api_route("", methods=["GET", "HEAD"])
+async def frontend_root():
+    # Relative asset URLs in index.html need the trailing slash
+    return RedirectResponse(f"{FRONTEND_PATH}/", status_code=308)
+
+
+@router.api_route("/", methods=["GET", "HEAD"])
+async def frontend_index(request: Request):
+    return serve(request, INDEX)
+
+
+@router.api_route("/{name}", methods=["GET", "HEAD"])
+async def frontend_asset(name: str, request: Request):
+    return serve(request, name)
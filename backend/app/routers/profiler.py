@@ -0,0 +1,40 @@
+"""
+Admin-only sampling profiler for the running worker (PROFILER_ENABLED).
+"""
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.config import ADMIN_TOKEN, PROFILER_MAX_SECONDS
+from app.services.profiler import ProfilerBusy, profiler
+
+router = APIRouter(prefix="/admin", include_in_schema=False)
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    route: Optional[str] = Query(None, description="route template, e.g. /api/auth/me"),
+    message_type: Optional[str] = Query(None, description="websocket frame type, e.g. send_message"),
+    include_idle: bool = False,
+    x_admin_token: str = Header(""),
+):
+    """
+    Profile this worker for `seconds` and return collapsed stacks
+    (feed to flamegraph.pl or speedscope). Only one profile runs at a time.
+    """
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    try:
+        result = await profiler.profile(
+            seconds, interval_ms / 1000, route, message_type, include_idle
+        )
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(
+        result["collapsed"],
+        headers={"X-Profile-Samples": str(result["samples"])},
+    )
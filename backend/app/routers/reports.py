@@ -1,17 +1,26 @@
 """Report and karma management routes."""
-from fastapi import APIRouter, Depends, HTTPException
+import hmac
+import json
+
+from anyio import from_thread
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from typing import List
 
+from app.config import ADMIN_TOKEN
 from app.database import get_db
-from app.models import Report, ReportStatus
+from app.models import Report, ReportStatus, ReportTranscript
 from app.services.karma import (
     get_karma,
     check_access_level,
     submit_report,
     award_chat_completion,
 )
+from app.services.report_rollup import get_rollup
+from app.services.report_score import report_scores
+from app.services.transcripts import chat_transcripts
+from app.services.user_versions import user_versions
 
 router = APIRouter(prefix="/api/reports", tags=["reports"])
 
@@ -55,13 +64,27 @@ def submit_user_report(request: ReportRequest, db: Session = Depends(get_db)):
             detail="Your account is restricted from reporting"
         )
     
+    # Last messages of their chat, if they are (still) paired on this worker
+    transcript = from_thread.run_sync(
+        chat_transcripts.snapshot, request.reporter_device_id, request.reported_device_id
+    )
     report = submit_report(
         db,
         request.reporter_device_id,
         request.reported_device_id,
-        request.reason
+        request.reason,
+        transcript
     )
     
+    # Burst of reports from distinct reporters: kick the device right away.
+    # Device ids here are not authenticated, so only a reporter seen chatting
+    # with the device (a transcript exists) counts towards a burst. The
+    # scores are shared with the event loop, so update them there.
+    if transcript is not None and from_thread.run_sync(
+        report_scores.record, request.reported_device_id, request.reporter_device_id
+    ):
+        from_thread.run(report_scores.suspend, request.reported_device_id)
+    
     return ReportResponse(
         id=report.id,
         status=report.status.value,
@@ -70,16 +93,100 @@ def submit_user_report(request: ReportRequest, db: Session = Depends(get_db)):
 
 
 @router.get("/karma", response_model=KarmaResponse)
-def get_user_karma(device_id: str, db: Session = Depends(get_db)):
-    """Get karma score and access level for a device."""
+def get_user_karma(
+    device_id: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    Get karma score and access level for a device.
+    Supports If-None-Match: unchanged karma gets a 304 without a DB query.
+    """
+    cached = user_versions.not_modified(request, device_id, "karma")
+    if cached:
+        return cached
+    version = user_versions.version(device_id)
+    
     karma = get_karma(db, device_id)
     access = check_access_level(db, device_id)
     
-    return KarmaResponse(
+    body = KarmaResponse(
         device_id=device_id,
         karma_score=karma,
         access_level=access
     )
+    return user_versions.respond(request, response, device_id, "karma", version, body)
+
+
+class RollupCounts(BaseModel):
+    received: int
+    filed: int
+    verified: int
+    rejected: int
+    filed_rejected: int
+
+
+class RollupDay(RollupCounts):
+    day: str
+
+
+class RollupTotals(RollupCounts):
+    pending: int
+
+
+class RollupResponse(BaseModel):
+    device_id: str
+    days: int
+    totals: RollupTotals
+    by_day: List[RollupDay]
+
+
+@router.get("/rollup", response_model=RollupResponse)
+def get_report_rollup(
+    device_id: str,
+    days: int = Query(7, ge=1, le=366),
+    x_admin_token: str = Header(""),
+    db: Session = Depends(get_db),
+):
+    """
+    Report counters for a device over the last `days` days, read from the
+    precomputed daily rollups (one row per day, no scan of reports).
+    Moderators only (X-Admin-Token).
+    """
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    return get_rollup(db, device_id, days)
+
+
+class TranscriptMessage(BaseModel):
+    sender: str = Field(..., alias="from")
+    timestamp: str
+    content: str
+
+
+class TranscriptResponse(BaseModel):
+    report_id: int
+    messages: List[TranscriptMessage]
+
+
+@router.get("/{report_id}/transcript", response_model=TranscriptResponse, include_in_schema=False)
+def get_report_transcript(
+    report_id: int,
+    x_admin_token: str = Header(""),
+    db: Session = Depends(get_db),
+):
+    """
+    Chat messages captured with a report (moderators only, X-Admin-Token).
+    """
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    transcript = db.query(ReportTranscript).filter(
+        ReportTranscript.report_id == report_id
+    ).first()
+    if transcript is None:
+        raise HTTPException(status_code=404, detail="No transcript for this report")
+    return {"report_id": report_id, "messages": json.loads(transcript.messages)}
 
 
 @router.post("/chat-complete")
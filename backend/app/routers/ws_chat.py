@@ -2,18 +2,49 @@
 WebSocket endpoint for real-time matching and chat.
 Handles: Queue -> Match -> Chat Session -> Leave/Next
 """
-import json
+import time
 import asyncio
+import logging
 from datetime import datetime, timedelta
-from typing import Dict, Set
+from functools import partial
+from typing import Dict, List, Optional, Set
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from sqlalchemy.orm import Session
 
 from app.database import get_db, SessionLocal
 from app.models import UserSession
 from app.services.matching import matching_service
-from app.services.karma import check_access_level, award_chat_completion
-from app.config import QUEUE_COOLDOWN_SECONDS, DAILY_SPECIFIC_FILTER_LIMIT
+from app.services.karma import (
+    access_level_for,
+    award_chat_completion,
+    check_access_level,
+    penalize_spam,
+    submit_report,
+)
+from app.services.chat_signals import ChatSignals
+from app.services.content_filter import content_filter
+from app.services.denylist import denylist
+from app.services.rate_limit import ConnectionRateLimiter
+from app.services.report_score import report_scores
+from app.services.resume import ResumeStore
+from app.services.snapshot import StateSnapshots
+from app.services.spam import spam_detector
+from app.services.transcripts import chat_transcripts
+from app.services.user_versions import user_versions
+from app.services.ws_protocol import Codec, FrameDecodeError, JsonCodec, negotiate
+from app.services.metrics import (
+    matches_total,
+    messages_relayed_total,
+    set_ws_message,
+    ws_connected_sockets,
+    ws_protocol_connections_total,
+    ws_rate_limit_disconnects_total,
+    ws_send_errors_total,
+    ws_send_latency_seconds,
+)
+from app.config import QUEUE_COOLDOWN_SECONDS, DAILY_SPECIFIC_FILTER_LIMIT, MATCH_SHARDS
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -28,38 +59,133 @@ class ConnectionManager:
         self.active_chats: Dict[str, str] = {}
         # device_id -> last queue time
         self.queue_cooldowns: Dict[str, datetime] = {}
+        # Last messages of each active chat, kept as evidence for reports
+        self.transcripts = chat_transcripts
+        # Coalesced typing indicators / read receipts for active chats
+        self.signals = ChatSignals(self.send_to_partner)
+        # Resume tokens and replay buffers for dropped sockets
+        self.resume = ResumeStore()
+        # device_id -> wire codec negotiated for its current socket
+        self.codecs: Dict[str, Codec] = {}
     
-    async def connect(self, device_id: str, websocket: WebSocket):
-        """Accept and register a new connection."""
-        await websocket.accept()
+    async def connect(self, device_id: str, websocket: WebSocket) -> Codec:
+        """Accept and register a new connection, negotiating its wire protocol."""
+        codec, subprotocol = negotiate(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
+        if device_id not in self.active_connections:
+            ws_connected_sockets.inc()
         self.active_connections[device_id] = websocket
+        self.codecs[device_id] = codec
+        ws_protocol_connections_total.labels(codec.protocol).inc()
+        return codec
     
     def disconnect(self, device_id: str):
         """Remove a connection."""
-        self.active_connections.pop(device_id, None)
+        self._detach(device_id)
         partner_id = self.active_chats.pop(device_id, None)
         if partner_id:
             self.active_chats.pop(partner_id, None)
+            self.signals.clear(partner_id)
+        self.transcripts.close(device_id, partner_id)
+        self.signals.clear(device_id)
+        self.resume.close(device_id)
+    
+    def hold(self, device_id: str, expire) -> bool:
+        """
+        Detach a dropped socket but keep its chat for the resume grace window.
+        Returns False if resumption is disabled.
+        """
+        if not self.resume.hold(device_id, expire):
+            return False
+        self._detach(device_id)
+        return True
+    
+    def _detach(self, device_id: str, websocket: Optional[WebSocket] = None):
+        """Forget a device's socket (only `websocket`, if given)."""
+        current = self.active_connections.get(device_id)
+        if current is not None and (websocket is None or current is websocket):
+            del self.active_connections[device_id]
+            self.codecs.pop(device_id, None)
+            ws_connected_sockets.dec()
+    
+    async def _write(self, device_id: str, ws: WebSocket, message: dict):
+        """Encode a frame with the device's codec and write it."""
+        codec = self.codecs.get(device_id, JsonCodec)
+        if codec.binary:
+            await ws.send_bytes(codec.encode(message))
+        else:
+            await ws.send_text(codec.encode(message))
     
     async def send_personal(self, device_id: str, message: dict):
         """Send message to a specific user."""
         ws = self.active_connections.get(device_id)
         if ws:
+            self.resume.stamp(device_id, message)
+            start = time.perf_counter()
             try:
-                await ws.send_json(message)
+                await self._write(device_id, ws, message)
             except Exception:
-                self.disconnect(device_id)
+                ws_send_errors_total.inc()
+                # The socket's own handler ends or holds the session
+                self._detach(device_id, ws)
+            else:
+                ws_send_latency_seconds.observe(time.perf_counter() - start)
+        elif self.resume.is_held(device_id):
+            # Replayed if the device resumes in time
+            self.resume.stamp(device_id, message)
+        elif MATCH_SHARDS:
+            # Partner may be connected to another worker
+            await matching_service.forward(device_id, message)
+    
+    async def deliver_remote(self, device_id: str, message: dict):
+        """Deliver a frame relayed by a match shard from another worker."""
+        if device_id in self.active_connections or self.resume.is_held(device_id):
+            if message.get("type") == "message" and device_id in self.active_chats:
+                self.transcripts.record(
+                    self.active_chats[device_id], device_id,
+                    message.get("timestamp", ""), message.get("content", ""),
+                )
+            await self.send_personal(device_id, message)
+    
+    async def send_replay(self, device_id: str, resumed: dict, frames: List[dict]):
+        """Send the resume ack and buffered frames as-is (already numbered)."""
+        ws = self.active_connections.get(device_id)
+        try:
+            await self._write(device_id, ws, resumed)
+            for frame in frames:
+                await self._write(device_id, ws, frame)
+        except Exception:
+            ws_send_errors_total.inc()
+            self._detach(device_id, ws)
     
     async def send_to_partner(self, device_id: str, message: dict):
         """Send message to the chat partner."""
         partner_id = self.active_chats.get(device_id)
         if partner_id:
             await self.send_personal(partner_id, message)
+            return True
+        return False
     
     def set_chat_pair(self, device_id1: str, device_id2: str):
         """Establish a chat connection between two users."""
         self.active_chats[device_id1] = device_id2
         self.active_chats[device_id2] = device_id1
+        self.transcripts.open(device_id1, device_id2)
+        self.signals.clear(device_id1)
+        self.signals.clear(device_id2)
+    
+    def clear_chat_pair(self, device_id: str, partner_id: str):
+        """Tear down a chat connection between two users."""
+        self.active_chats.pop(device_id, None)
+        self.active_chats.pop(partner_id, None)
+        self.transcripts.close(device_id, partner_id)
+        self.signals.clear(device_id)
+        self.signals.clear(partner_id)
+    
+    def end_remote_pair(self, device_id: str, partner_id: str):
+        """Tear down a pairing ended from another worker, unless already replaced."""
+        if self.active_chats.get(device_id) == partner_id:
+            self.clear_chat_pair(device_id, partner_id)
     
     def get_partner(self, device_id: str) -> str | None:
         """Get the partner's device ID."""
@@ -75,44 +201,157 @@ class ConnectionManager:
     def set_queue_cooldown(self, device_id: str):
         """Set cooldown timestamp."""
         self.queue_cooldowns[device_id] = datetime.utcnow()
+    
+    async def suspend(self, device_id: str, seconds: float):
+        """Kick a soft-suspended device; its handler then ends the session."""
+        ws = self.active_connections.get(device_id)
+        if ws is None:
+            # A held session can't resume past the handshake check; let it expire
+            return
+        await self.send_personal(device_id, {
+            "type": "suspended",
+            "seconds": round(seconds),
+        })
+        try:
+            await ws.close(code=4003, reason="Access denied: suspended")
+        except Exception:
+            pass
 
 
 manager = ConnectionManager()
+snapshots = StateSnapshots()
+
+report_scores.bind(manager.suspend)
+
+if MATCH_SHARDS:
+    matching_service.bind(manager.set_chat_pair, manager.end_remote_pair, manager.deliver_remote)
+
+
+def capture_state() -> dict:
+    """Queue, chat and resume state for a snapshot."""
+    return {**matching_service.export_state(), "sessions": manager.resume.export()}
+
+
+async def restore_state():
+    """
+    Reload the last snapshot at startup. Restored devices are held as if
+    their sockets had just dropped: they resume with their token within the
+    grace window, or are expired like any other dropped session.
+    """
+    if not (snapshots.enabled and matching_service.use_memory and manager.resume.enabled):
+        return
+    state = snapshots.load()
+    if state is None:
+        return
+    start = time.perf_counter()
+    queued = matching_service.import_state(state["queue"], state["pairs"])
+    for device_id, partner_id in state["pairs"]:
+        manager.active_chats[device_id] = partner_id
+        manager.active_chats[partner_id] = device_id
+    genders = {row[0]: row[1] for row in state["queue"]}
+    for device_id, token, seq in state["sessions"]:
+        manager.resume.restore(device_id, token, seq)
+        manager.hold(device_id, partial(end_session, device_id, genders.get(device_id, "")))
+    logger.info(
+        "Restored %d queued, %d chats, %d sessions from snapshot in %.1fms",
+        queued, len(state["pairs"]), len(state["sessions"]),
+        (time.perf_counter() - start) * 1000,
+    )
+
+
+def start_snapshots():
+    if matching_service.use_memory:
+        snapshots.start(capture_state)
+
+
+async def stop_snapshots():
+    """Write the final snapshot (sockets are already closed with 1012 by now)."""
+    if matching_service.use_memory:
+        await snapshots.stop(capture_state)
 
 
 @router.websocket("/ws/chat/{device_id}")
-async def websocket_endpoint(websocket: WebSocket, device_id: str):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    device_id: str,
+    resume_token: Optional[str] = None,
+    last_seq: int = 0
+):
     """
     WebSocket endpoint for matching and chat.
     
     Message types (client -> server):
     - {"type": "join_queue", "looking_for": "male"|"female"|"any"}
     - {"type": "leave_queue"}
-    - {"type": "send_message", "content": "..."}
+    - {"type": "send_message", "content": "...", "client_id": N}
+    - {"type": "typing", "is_typing": true|false}
+    - {"type": "read", "message_id": N}
     - {"type": "leave_chat"}
     - {"type": "next_match", "looking_for": "..."}
+    - {"type": "rpc", "id": N, "method": "...", "params": {...}}
     
     Message types (server -> client):
     - {"type": "queued", "position": N}
     - {"type": "match_found", "partner": {"nickname": "...", "bio": "..."}}
-    - {"type": "message", "from": "partner", "content": "..."}
+    - {"type": "message", "id": N, "from": "partner", "content": "..."}
+    - {"type": "message_sent", "client_id": N, "id": M} / {"type": "message_not_sent", "client_id": N, "message": "..."}
+    - {"type": "partner_typing", "is_typing": true|false}
+    - {"type": "read_receipt", "message_id": N}
     - {"type": "partner_left"}
+    - {"type": "partner_reconnecting"} / {"type": "partner_resumed"}
     - {"type": "error", "message": "..."}
+    - {"type": "rpc_result", "id": N, "result": {...}}
+    - {"type": "rpc_error", "id": N, "error": "...", "status": 4xx}
+    
+    RPC methods (see RPC_METHODS) reuse the socket's authenticated user:
+    get_profile, get_karma, complete_chat and submit_report {"reason": "..."},
+    which reports the current chat partner.
+    
+    Every server frame carries a "seq". The "connected" greeting includes a
+    "resume_token"; if the socket drops mid-chat, reconnecting within
+    RESUME_GRACE_SECONDS with ?resume_token=...&last_seq=N reattaches to the
+    same partner: the server answers {"type": "resumed", "in_chat": bool}
+    and replays the frames after N.
+    
+    Frames over the per-connection rate limits are dropped; clients that
+    keep flooding are closed with code 4008. Devices soft-suspended after a
+    burst of reports get {"type": "suspended", "seconds": N} and code 4003.
+    
+    Clients may offer the "chat.msgpack.v1" subprotocol to exchange the same
+    frames as compact MessagePack binary frames (see services/ws_protocol.py);
+    otherwise frames are JSON text.
     """
-    # Get database session
-    db = SessionLocal()
+    # Get database session (kept for the socket's lifetime, so loaded
+    # objects must survive the commits that release its pooled connection)
+    db = SessionLocal(expire_on_commit=False)
+    user = None
+    identity = None
+    accepted = False
+    close_code = None
     
     try:
+        # Banned and suspended devices are turned away before touching the database
+        denied = denylist.check(device_id) or (
+            "suspended" if report_scores.is_suspended(device_id) else None
+        )
+        if denied:
+            await websocket.close(code=4003, reason=f"Access denied: {denied}")
+            return
+        
         # Verify user exists and has access
+        loaded_version = user_versions.version(device_id)
         user = db.query(UserSession).filter(
             UserSession.device_id == device_id
         ).first()
+        access = check_access_level(db, device_id) if user else None
+        
+        # Release the pooled connection before awaiting on the socket
+        db.commit()
         
         if not user:
             await websocket.close(code=4001, reason="User not found")
             return
         
-        access = check_access_level(db, device_id)
         if access in ["permanent_ban", "temp_ban"]:
             await websocket.close(code=4003, reason=f"Access denied: {access}")
             return
@@ -121,28 +360,76 @@ async def websocket_endpoint(websocket: WebSocket, device_id: str):
             await websocket.close(code=4002, reason="Gender verification required")
             return
         
+        previous = manager.active_connections.get(device_id)
+        replay = None
+        if resume_token:
+            replay = manager.resume.take(device_id, resume_token, last_seq)
+        if replay is None and (previous is not None or manager.resume.is_held(device_id)):
+            # A fresh connection replaces whatever session the device had
+            await end_session(device_id, user.gender_result)
+        
         # Accept connection
-        await manager.connect(device_id, websocket)
+        codec = await manager.connect(device_id, websocket)
+        accepted = True
+        if previous is not None:
+            # Resumed over a socket we hadn't noticed was dead
+            try:
+                await previous.close(code=4000, reason="Replaced by a new connection")
+            except Exception:
+                pass
         
-        await manager.send_personal(device_id, {
-            "type": "connected",
-            "karma": user.karma_score,
-            "nickname": user.nickname,
-        })
+        if replay is not None:
+            partner_id = manager.get_partner(device_id)
+            await manager.send_replay(device_id, {
+                "type": "resumed",
+                "in_chat": partner_id is not None,
+                "seq": manager.resume.last_seq(device_id),
+            }, replay)
+            if partner_id:
+                await manager.send_personal(partner_id, {"type": "partner_resumed"})
+        else:
+            await manager.send_personal(device_id, {
+                "type": "connected",
+                "karma": user.karma_score,
+                "nickname": user.nickname,
+                "resume_token": manager.resume.open(device_id),
+            })
+        
+        limiter = ConnectionRateLimiter()
+        identity = SocketIdentity(user, loaded_version)
         
         # Main message loop
         while True:
             try:
-                data = await websocket.receive_json()
+                frame = await websocket.receive()
+                if frame["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(frame.get("code", 1000))
+                raw = frame.get("text")
+                if raw is None:
+                    raw = frame.get("bytes") or b""
+                
+                # Shed floods before paying for decoding
+                if not limiter.allow_frame(len(raw)):
+                    if await reject_frame(device_id, websocket, limiter):
+                        close_code = 4008
+                        break
+                    continue
+                
+                data = codec.decode(raw)
                 msg_type = data.get("type")
+                set_ws_message(msg_type)
+                
+                if not limiter.allow_type(msg_type):
+                    if await reject_frame(device_id, websocket, limiter):
+                        close_code = 4008
+                        break
+                    continue
                 
                 if msg_type == "join_queue":
                     try:
-                        await handle_join_queue(device_id, data, user, db)
+                        await handle_join_queue(device_id, data, identity.current(db), db)
                     except Exception as e:
-                        import logging
-                        logger = logging.getLogger(__name__)
-                        logger.error(f"❌ Error in join_queue: {str(e)}", exc_info=True)
+                        logger.error("Error in join_queue for %s", device_id[:8], exc_info=True)
                         await manager.send_personal(device_id, {
                             "type": "error",
                             "message": f"Failed to join queue: {str(e)}"
@@ -150,21 +437,23 @@ async def websocket_endpoint(websocket: WebSocket, device_id: str):
                 
                 elif msg_type == "leave_queue":
                     await matching_service.remove_from_queue(
-                        device_id, user.gender_result
+                        device_id, identity.current(db).gender_result
                     )
                     await manager.send_personal(device_id, {
                         "type": "left_queue"
                     })
                 
                 elif msg_type == "send_message":
-                    content = data.get("content", "").strip()
-                    if content and len(content) <= 1000:
-                        await manager.send_to_partner(device_id, {
-                            "type": "message",
-                            "from": "partner",
-                            "content": content,
-                            "timestamp": datetime.utcnow().isoformat(),
-                        })
+                    await handle_send_message(device_id, data, identity, db)
+                
+                elif msg_type == "typing":
+                    if manager.get_partner(device_id):
+                        await manager.signals.typing(device_id, bool(data.get("is_typing")))
+                
+                elif msg_type == "read":
+                    await manager.signals.read(
+                        device_id, manager.get_partner(device_id), data.get("message_id")
+                    )
                 
                 elif msg_type == "leave_chat":
                     await handle_leave_chat(device_id, db)
@@ -172,30 +461,297 @@ async def websocket_endpoint(websocket: WebSocket, device_id: str):
                 elif msg_type == "next_match":
                     # Leave current chat and find new match
                     await handle_leave_chat(device_id, db, notify_partner=True)
-                    await handle_join_queue(device_id, data, user, db)
+                    await handle_join_queue(device_id, data, identity.current(db), db)
+                
+                elif msg_type == "rpc":
+                    await handle_rpc(device_id, data, identity, db)
+                
+                # Return the connection to the pool between frames
+                if db.in_transaction():
+                    db.commit()
                 
-            except WebSocketDisconnect:
+            except WebSocketDisconnect as e:
+                close_code = e.code
                 break
-            except json.JSONDecodeError:
+            except FrameDecodeError:
                 await manager.send_personal(device_id, {
                     "type": "error",
                     "message": "Invalid message format"
                 })
     
     finally:
-        # Cleanup on disconnect
+        gender = user.gender_result if user else ""
+        current = manager.active_connections.get(device_id)
         partner_id = manager.get_partner(device_id)
-        if partner_id:
+        
+        if current is not None and current is not websocket:
+            # Superseded by a newer socket for this device; it owns the session now
+            pass
+        elif close_code == 1012 and snapshots.running:
+            # Server restarting: leave queue/chat state for the shutdown snapshot
+            manager._detach(device_id, websocket)
+        elif (
+            accepted
+            and partner_id
+            and close_code not in (1000, 4003, 4008)
+            and not report_scores.is_suspended(device_id)
+            and manager.hold(device_id, partial(end_session, device_id, gender))
+        ):
+            # Dropped mid-chat: keep the chat open for a resume
             await manager.send_personal(partner_id, {
-                "type": "partner_left"
+                "type": "partner_reconnecting"
             })
-        
-        await matching_service.remove_from_queue(device_id, user.gender_result if user else "")
-        await matching_service.end_match(device_id)
-        manager.disconnect(device_id)
+        else:
+            await end_session(device_id, gender)
         db.close()
 
 
+async def end_session(device_id: str, gender: str):
+    """Tear down a device's queue entry, chat and connection state."""
+    partner_id = manager.get_partner(device_id)
+    if partner_id:
+        await manager.send_personal(partner_id, {
+            "type": "partner_left"
+        })
+    
+    await matching_service.remove_from_queue(device_id, gender)
+    await matching_service.end_match(device_id)
+    manager.disconnect(device_id)
+
+
+async def reject_frame(
+    device_id: str,
+    websocket: WebSocket,
+    limiter: ConnectionRateLimiter
+) -> bool:
+    """
+    Handle a rate-limited frame. Returns True if the socket was closed
+    because the client kept flooding.
+    """
+    if limiter.should_disconnect:
+        logger.info("Closing flooding socket device=%s", device_id[:8])
+        ws_rate_limit_disconnects_total.inc()
+        await websocket.close(code=4008, reason="Rate limit exceeded")
+        return True
+    if limiter.take_notification():
+        await manager.send_personal(device_id, {
+            "type": "error",
+            "message": "You're sending too fast. Slow down."
+        })
+    return False
+
+
+async def handle_send_message(device_id: str, data: dict, identity: "SocketIdentity", db: Session):
+    """
+    Screen and relay a chat message. If the client tagged it with a
+    client_id, it learns the outcome: message_sent with the id the partner
+    sees (and read receipts refer to), or message_not_sent.
+    """
+    content = data.get("content", "").strip()
+    if not content:
+        return
+    client_id = data.get("client_id")
+    partner_id = manager.get_partner(device_id)
+    if not partner_id:
+        blocked = "no_chat"
+    elif len(content) > 1000:
+        blocked = "too_long"
+    else:
+        blocked = screen_message(device_id, partner_id, content, identity, db)
+    
+    message_id = None
+    if not blocked:
+        message_id = await relay_message(device_id, partner_id, content)
+        if message_id is None:
+            blocked = "no_chat"
+    
+    if client_id is not None:
+        if blocked:
+            await manager.send_personal(device_id, {
+                "type": "message_not_sent",
+                "client_id": client_id,
+                "message": BLOCKED_MESSAGES[blocked],
+            })
+        else:
+            await manager.send_personal(device_id, {
+                "type": "message_sent",
+                "client_id": client_id,
+                "id": message_id,
+            })
+    elif blocked in CONTENT_BLOCKS:
+        await manager.send_personal(device_id, {
+            "type": "error",
+            "message": BLOCKED_MESSAGES[blocked],
+        })
+
+
+def screen_message(
+    device_id: str, partner_id: str, content: str, identity: "SocketIdentity", db: Session
+) -> Optional[str]:
+    """Why a message must not be relayed (a BLOCKED_MESSAGES key), or None."""
+    blocked = content_filter.check(content)
+    if blocked:
+        return blocked
+    verdict = spam_detector.record(device_id, partner_id, content)
+    if verdict is None:
+        return None
+    if verdict == "flagged":
+        logger.warning("Spam burst from %s, applying karma penalty", device_id[:8])
+        penalize_spam(db, device_id, user=identity.current(db))
+    return "spam"
+
+
+async def relay_message(device_id: str, partner_id: str, content: str) -> Optional[int]:
+    """
+    Relay a chat message to the partner and keep it in the chat's transcript.
+    Returns the message's id, or None if the chat is gone.
+    """
+    timestamp = datetime.utcnow().isoformat()
+    message_id = manager.signals.next_message_id(device_id)
+    relayed = await manager.send_to_partner(device_id, {
+        "type": "message",
+        "id": message_id,
+        "from": "partner",
+        "content": content,
+        "timestamp": timestamp,
+    })
+    if not relayed:
+        return None
+    manager.transcripts.record(device_id, partner_id, timestamp, content)
+    messages_relayed_total.inc()
+    return message_id
+
+
+BLOCKED_MESSAGES = {
+    "term": "Message not sent: it contains language that isn't allowed.",
+    "phone": "Message not sent: sharing phone numbers isn't allowed.",
+    "link": "Message not sent: sharing links isn't allowed.",
+    "spam": "Message not sent: you've sent this to several people already.",
+    "too_long": "Message not sent: it's longer than 1000 characters.",
+    "no_chat": "Message not sent: you're not in a chat.",
+}
+# Reasons reported to every client, not only those that tag their messages
+CONTENT_BLOCKS = ("term", "phone", "link", "spam")
+
+
+class SocketIdentity:
+    """
+    A socket's authenticated user, loaded once at connect. It is only
+    re-read when its version (services/user_versions.py) shows a change.
+    """
+    
+    def __init__(self, user: UserSession, version: int):
+        self.user = user
+        self.version = version
+    
+    def current(self, db: Session) -> UserSession:
+        version = user_versions.version(self.user.device_id)
+        if version != self.version:
+            db.refresh(self.user)
+            self.version = version
+        return self.user
+
+
+class RpcError(Exception):
+    """A failed RPC call, reported to the client as rpc_error."""
+    
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def profile_result(user: UserSession) -> dict:
+    """Same fields as /api/auth/me."""
+    return {
+        "device_id": user.device_id,
+        "gender": user.gender_result,
+        "nickname": user.nickname,
+        "bio": user.bio,
+        "karma_score": user.karma_score,
+        "access_level": access_level_for(user.karma_score),
+        "daily_matches_remaining": DAILY_SPECIFIC_FILTER_LIMIT - user.daily_specific_filter_count,
+        "is_verified": user.gender_result is not None,
+    }
+
+
+async def rpc_get_profile(device_id: str, user: UserSession, params: dict, db: Session) -> dict:
+    return profile_result(user)
+
+
+async def rpc_get_karma(device_id: str, user: UserSession, params: dict, db: Session) -> dict:
+    return {
+        "device_id": device_id,
+        "karma_score": user.karma_score,
+        "access_level": access_level_for(user.karma_score),
+    }
+
+
+async def rpc_complete_chat(device_id: str, user: UserSession, params: dict, db: Session) -> dict:
+    new_karma = award_chat_completion(db, device_id, user=user)
+    return {
+        "success": True,
+        "new_karma": new_karma,
+        "message": "Chat completed! Karma bonus awarded."
+    }
+
+
+async def rpc_submit_report(device_id: str, user: UserSession, params: dict, db: Session) -> dict:
+    """Report the current chat partner (same rules as /api/reports/submit)."""
+    partner_id = manager.get_partner(device_id)
+    if not partner_id:
+        raise RpcError("You can only report your current chat partner", 409)
+    reason = str(params.get("reason") or "").strip()
+    if not 10 <= len(reason) <= 500:
+        raise RpcError("Reason must be 10-500 characters", 422)
+    if access_level_for(user.karma_score) in ["permanent_ban", "temp_ban"]:
+        raise RpcError("Your account is restricted from reporting", 403)
+    
+    transcript = manager.transcripts.snapshot(device_id, partner_id)
+    report = submit_report(db, device_id, partner_id, reason, transcript)
+    if report_scores.record(partner_id, device_id):
+        await report_scores.suspend(partner_id)
+    return {
+        "id": report.id,
+        "status": report.status.value,
+        "message": "Report submitted. The user has been penalized."
+    }
+
+
+RPC_METHODS = {
+    "get_profile": rpc_get_profile,
+    "get_karma": rpc_get_karma,
+    "complete_chat": rpc_complete_chat,
+    "submit_report": rpc_submit_report,
+}
+
+
+async def handle_rpc(device_id: str, data: dict, identity: SocketIdentity, db: Session):
+    """Run an RPC call and answer with rpc_result / rpc_error under the same id."""
+    call_id = data.get("id")
+    method = RPC_METHODS.get(data.get("method"))
+    params = data.get("params") or {}
+    try:
+        if method is None:
+            raise RpcError(f"Unknown method: {data.get('method')}", 404)
+        if not isinstance(params, dict):
+            raise RpcError("params must be an object")
+        result = await method(device_id, identity.current(db), params, db)
+    except RpcError as e:
+        await manager.send_personal(device_id, {
+            "type": "rpc_error", "id": call_id, "error": str(e), "status": e.status
+        })
+    except Exception:
+        logger.error("RPC %s failed for %s", data.get("method"), device_id[:8], exc_info=True)
+        db.rollback()
+        await manager.send_personal(device_id, {
+            "type": "rpc_error", "id": call_id, "error": "Internal error", "status": 500
+        })
+    else:
+        await manager.send_personal(device_id, {
+            "type": "rpc_result", "id": call_id, "result": result
+        })
+
+
 async def handle_join_queue(
     device_id: str,
     data: dict,
@@ -205,13 +761,9 @@ async def handle_join_queue(
     """Handle queue join request."""
     looking_for = data.get("looking_for", "any").lower()
     
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info(f"🔍 [JOIN_QUEUE] Device: {device_id[:12]}... | Gender: {user.gender_result} | Looking for: {looking_for}")
-    
     # Check cooldown
     if not manager.can_queue(device_id):
-        logger.info(f"⏱️ [JOIN_QUEUE] Cooldown active for {device_id[:12]}...")
+        logger.debug("join_queue rejected: cooldown device=%s", device_id[:8])
         await manager.send_personal(device_id, {
             "type": "error",
             "message": f"Please wait {QUEUE_COOLDOWN_SECONDS} seconds between queue attempts"
@@ -220,8 +772,11 @@ async def handle_join_queue(
     
     # Check daily limit for specific filters
     if looking_for != "any":
+        # Re-read the counter right before incrementing it: other workers
+        # and REST calls change it without bumping this worker's version
+        db.refresh(user)
         if user.daily_specific_filter_count >= DAILY_SPECIFIC_FILTER_LIMIT:
-            logger.info(f"🚫 [JOIN_QUEUE] Daily limit reached for {device_id[:12]}...")
+            logger.debug("join_queue rejected: daily limit device=%s", device_id[:8])
             await manager.send_personal(device_id, {
                 "type": "error",
                 "message": "Daily limit for specific filters reached. Try 'Any' or wait until tomorrow."
@@ -233,23 +788,21 @@ async def handle_join_queue(
         db.commit()
     
     # Add to queue
-    logger.info(f"➕ [JOIN_QUEUE] Adding to queue...")
     await matching_service.add_to_queue(
         device_id,
         user.gender_result,
-        looking_for
+        looking_for,
+        karma=user.karma_score
     )
     
     manager.set_queue_cooldown(device_id)
     
-    logger.info(f"✅ [JOIN_QUEUE] Queued successfully")
     await manager.send_personal(device_id, {
         "type": "queued",
         "looking_for": looking_for,
     })
     
     # Try to find immediate match
-    logger.info(f"🔍 [JOIN_QUEUE] Searching for match...")
     match = await matching_service.find_match(
         device_id,
         user.gender_result,
@@ -257,10 +810,7 @@ async def handle_join_queue(
     )
     
     if match:
-        logger.info(f"🎉 [JOIN_QUEUE] MATCH FOUND! Partner: {match['device_id'][:12]}...")
         await establish_match(device_id, match["device_id"], db)
-    else:
-        logger.info(f"⏳ [JOIN_QUEUE] No match yet, waiting in queue...")
 
 
 
@@ -279,6 +829,7 @@ async def establish_match(device_id1: str, device_id2: str, db: Session):
     
     # Set up chat pair
     manager.set_chat_pair(device_id1, device_id2)
+    matches_total.inc()
     
     # Increment match counts
     user1.daily_matches_count += 1
@@ -321,8 +872,7 @@ async def handle_leave_chat(
             })
         
         # Clear chat pair
-        manager.active_chats.pop(device_id, None)
-        manager.active_chats.pop(partner_id, None)
+        manager.clear_chat_pair(device_id, partner_id)
     
     await matching_service.end_match(device_id)
     
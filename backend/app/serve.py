@@ -0,0 +1,210 @@
+"""
+Production entry point: N uvicorn workers sharing one port.
+
+    python -m app.serve [--host 0.0.0.0] [--port 8000] [--workers N]
+
+Every worker is a separate process that binds its own listening socket with
+SO_REUSEPORT, so the kernel spreads new connections across workers without
+a shared accept lock. Workers run on uvloop with the httptools parser when
+those are installed (they come with uvicorn[standard]).
+
+The supervisor (this process) never imports the app; it creates the
+database tables once, so workers don't race to do it. It starts the workers,
+and restarts any that exit unexpectedly, giving up if they keep crashing.
+On SIGTERM/SIGINT it forwards SIGTERM to every worker. A worker then stops
+accepting and closes its websockets with 1012 (service restart), so
+clients reconnect and resume on another worker or after the deploy. It
+waits up to GRACEFUL_SHUTDOWN_SECONDS for in-flight HTTP requests, then
+runs the app's shutdown hooks (state snapshot, log flush). Workers still
+running 10 seconds after that deadline are killed.
+
+Worker count (WEB_WORKERS, or --workers): matchmaking and chat state live in
+process memory, so more than one worker only makes sense with match shards
+(MATCH_SHARDS), and SQLite allows a single writer at a time. Unless set
+explicitly, SQLite or no shards means one worker; otherwise one per CPU.
+"""
+import argparse
+import importlib.util
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+import app.config
+from app.config import (
+    DATABASE_URL,
+    FORWARDED_ALLOW_IPS,
+    GRACEFUL_SHUTDOWN_SECONDS,
+    MATCH_SHARDS,
+    SNAPSHOT_PATH,
+    WEB_HOST,
+    WEB_PORT,
+    WEB_WORKERS,
+)
+from app.database import init_db
+from app.services.tracing import setup_logging
+
+logger = logging.getLogger("app.serve")
+
+# A worker restarted this many times within RESTART_WINDOW_SECONDS is broken
+MAX_RESTARTS = 5
+RESTART_WINDOW_SECONDS = 60
+BACKLOG = 2048
+
+
+def default_workers() -> int:
+    """One worker unless the deployment can share state between several."""
+    if WEB_WORKERS:
+        return max(1, int(WEB_WORKERS))
+    if DATABASE_URL.startswith("sqlite"):
+        logger.info("SQLite database: running a single worker (set WEB_WORKERS to override)")
+        return 1
+    if not MATCH_SHARDS:
+        logger.info("No MATCH_SHARDS configured: running a single worker (set WEB_WORKERS to override)")
+        return 1
+    return os.cpu_count() or 1
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def bind_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(host: str, port: int, index: int, workers: int, reuse_port: bool):
+    """Serve the app in this process until SIGTERM."""
+    # Own process group: a terminal Ctrl+C reaches only the supervisor, which
+    # forwards a single SIGTERM (a second signal makes uvicorn skip draining)
+    os.setpgrp()
+    setup_logging()
+    if workers > 1 and SNAPSHOT_PATH:
+        # Each worker snapshots its own matchmaking state (set before the
+        # app, and with it services/snapshot.py, is imported)
+        app.config.SNAPSHOT_PATH = f"{SNAPSHOT_PATH}.{index}"
+
+    import uvicorn
+
+    config = uvicorn.Config(
+        "app.main:app",
+        loop="uvloop" if _installed("uvloop") else "asyncio",
+        http="httptools" if _installed("httptools") else "h11",
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+        log_config=None,
+    )
+    server = uvicorn.Server(config)
+    sock = bind_socket(host, port, reuse_port)
+    logger.info(
+        "Worker %d (pid %d) serving on %s:%d with loop=%s http=%s",
+        index, os.getpid(), host, port, config.loop, config.http,
+    )
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    """Starts the workers, restarts crashed ones and stops them on a signal."""
+
+    def __init__(self, host: str, port: int, workers: int):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.reuse_port = workers > 1 and hasattr(socket, "SO_REUSEPORT")
+        if workers > 1 and not self.reuse_port:
+            logger.warning("SO_REUSEPORT is not available on this platform; running one worker")
+            self.workers = 1
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._restarts: Dict[int, List[float]] = {}
+        self._stopping = False
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        # Create tables once here; workers creating them concurrently race
+        init_db()
+        logger.info("Starting %d worker(s) on %s:%d", self.workers, self.host, self.port)
+        for index in range(self.workers):
+            self._spawn(index)
+
+        status = 0
+        while not self._stopping:
+            time.sleep(0.5)
+            for index, process in list(self._processes.items()):
+                if process.is_alive() or self._stopping:
+                    continue
+                logger.warning("Worker %d (pid %s) exited with %s", index, process.pid, process.exitcode)
+                if not self._may_restart(index):
+                    logger.error("Worker %d keeps exiting, shutting down", index)
+                    status = 1
+                    self._stopping = True
+                    break
+                self._spawn(index)
+
+        self._shutdown()
+        return status
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=run_worker,
+            args=(self.host, self.port, index, self.workers, self.reuse_port),
+            name=f"worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _may_restart(self, index: int) -> bool:
+        now = time.monotonic()
+        recent = [t for t in self._restarts.get(index, []) if now - t < RESTART_WINDOW_SECONDS]
+        recent.append(now)
+        self._restarts[index] = recent
+        return len(recent) <= MAX_RESTARTS
+
+    def _stop(self, signum, frame):
+        if not self._stopping:
+            logger.info("Received %s, draining workers", signal.Signals(signum).name)
+        self._stopping = True
+
+    def _shutdown(self):
+        for process in self._processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        # Workers need the graceful timeout plus time for the shutdown hooks
+        deadline = time.monotonic() + GRACEFUL_SHUTDOWN_SECONDS + 10
+        for process in self._processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Worker %s did not stop in time, killing it", process.name)
+                process.kill()
+                process.join()
+        logger.info("All workers stopped")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the API with supervised worker processes")
+    parser.add_argument("--host", default=WEB_HOST)
+    parser.add_argument("--port", type=int, default=WEB_PORT)
+    parser.add_argument("--workers", type=int, help="default: WEB_WORKERS, else chosen from the setup")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    workers = args.workers if args.workers is not None else default_workers()
+    return Supervisor(args.host, args.port, max(1, workers)).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Typing indicators and read receipts with server-side coalescing.
+
+Clients may send a typing frame per keystroke and a read frame per message;
+only state changes are relayed, at most once per interval per sender, and
+receipts are merged to the highest message id seen.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.config import TYPING_COALESCE_SECONDS, READ_RECEIPT_COALESCE_SECONDS
+from app.services.metrics import chat_signals_total
+
+SendToPartner = Callable[[str, dict], Awaitable[bool]]
+
+
+class _SenderState:
+    """Per-device signal state for the current chat."""
+
+    __slots__ = (
+        "last_message_id",
+        "typing_sent", "typing_pending", "typing_sent_at", "typing_timer",
+        "read_sent", "read_pending", "read_sent_at", "read_timer",
+    )
+
+    def __init__(self):
+        self.last_message_id = 0
+        self.typing_sent = False
+        self.typing_pending: Optional[bool] = None
+        self.typing_sent_at = 0.0
+        self.typing_timer: Optional[asyncio.TimerHandle] = None
+        self.read_sent = 0
+        self.read_pending = 0
+        self.read_sent_at = 0.0
+        self.read_timer: Optional[asyncio.TimerHandle] = None
+
+    def cancel_timers(self):
+        if self.typing_timer:
+            self.typing_timer.cancel()
+            self.typing_timer = None
+        if self.read_timer:
+            self.read_timer.cancel()
+            self.read_timer = None
+
+
+class ChatSignals:
+    """Coalesces typing/read frames before they reach send_to_partner."""
+
+    def __init__(
+        self,
+        send_to_partner: SendToPartner,
+        typing_interval: float = TYPING_COALESCE_SECONDS,
+        read_interval: float = READ_RECEIPT_COALESCE_SECONDS,
+    ):
+        self.send_to_partner = send_to_partner
+        self.typing_interval = typing_interval
+        self.read_interval = read_interval
+        self._states: Dict[str, _SenderState] = {}
+
+    def _state(self, device_id: str) -> _SenderState:
+        state = self._states.get(device_id)
+        if state is None:
+            state = self._states[device_id] = _SenderState()
+        return state
+
+    def next_message_id(self, device_id: str) -> int:
+        """
+        Assign the id for a chat message from this sender.
+        A delivered message implicitly ends the sender's typing state.
+        """
+        state = self._state(device_id)
+        state.last_message_id += 1
+        state.typing_sent = False
+        state.typing_pending = None
+        return state.last_message_id
+
+    async def typing(self, device_id: str, is_typing: bool):
+        """Relay a typing state change, at most once per interval."""
+        state = self._state(device_id)
+        if state.typing_timer is not None:
+            # A flush is already scheduled; it will send the latest state
+            state.typing_pending = is_typing
+            chat_signals_total.labels("typing", "coalesced").inc()
+            return
+        if is_typing == state.typing_sent:
+            chat_signals_total.labels("typing", "coalesced").inc()
+            return
+
+        wait = state.typing_sent_at + self.typing_interval - time.monotonic()
+        if wait <= 0:
+            await self._send_typing(device_id, state, is_typing)
+        else:
+            state.typing_pending = is_typing
+            state.typing_timer = asyncio.get_running_loop().call_later(
+                wait, self._flush_typing, device_id
+            )
+
+    async def read(self, device_id: str, partner_id: Optional[str], message_id):
+        """Relay a read receipt merged to the latest message id, at most once per interval."""
+        if not partner_id or not isinstance(message_id, int):
+            return
+        if message_id <= 0:
+            return
+        # The partner's sender state is unknown if they are on another worker
+        partner_state = self._states.get(partner_id)
+        if partner_state is not None and message_id > partner_state.last_message_id:
+            return
+
+        state = self._state(device_id)
+        if message_id <= max(state.read_sent, state.read_pending):
+            chat_signals_total.labels("read", "coalesced").inc()
+            return
+        state.read_pending = message_id
+        if state.read_timer is not None:
+            chat_signals_total.labels("read", "coalesced").inc()
+            return
+
+        wait = state.read_sent_at + self.read_interval - time.monotonic()
+        if wait <= 0:
+            await self._send_read(device_id, state)
+        else:
+            state.read_timer = asyncio.get_running_loop().call_later(
+                wait, self._flush_read, device_id
+            )
+
+    def clear(self, device_id: str):
+        """Forget signal state when the device's chat ends."""
+        state = self._states.pop(device_id, None)
+        if state:
+            state.cancel_timers()
+
+    async def _send_typing(self, device_id: str, state: _SenderState, is_typing: bool):
+        state.typing_sent = is_typing
+        state.typing_sent_at = time.monotonic()
+        state.typing_pending = None
+        await self.send_to_partner(device_id, {
+            "type": "partner_typing",
+            "is_typing": is_typing,
+        })
+        chat_signals_total.labels("typing", "relayed").inc()
+
+    async def _send_read(self, device_id: str, state: _SenderState):
+        state.read_sent = state.read_pending
+        state.read_sent_at = time.monotonic()
+        await self.send_to_partner(device_id, {
+            "type": "read_receipt",
+            "message_id": state.read_sent,
+        })
+        chat_signals_total.labels("read", "relayed").inc()
+
+    def _flush_typing(self, device_id: str):
+        state = self._states.get(device_id)
+        if state is None:
+            return
+        state.typing_timer = None
+        pending = state.typing_pending
+        if pending is None or pending == state.typing_sent:
+            state.typing_pending = None
+            return
+        asyncio.ensure_future(self._send_typing(device_id, state, pending))
+
+    def _flush_read(self, device_id: str):
+        state = self._states.get(device_id)
+        if state is None:
+            return
+        state.read_timer = None
+        if state.read_pending > state.read_sent:
+            asyncio.ensure_future(self._send_read(device_id, state))
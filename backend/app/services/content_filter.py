@@ -0,0 +1,284 @@
+"""
+Relay-time content filter for chat messages: blocked terms, phone numbers
+and links.
+
+Every message is checked on the event loop before it is relayed, so the
+check has to stay in the microseconds whatever the size of the term list.
+Instead of one regex per term, the whole list is compiled into a single
+pattern shaped like a trie (terms sharing a prefix share a branch), which
+the regex engine walks once per starting position; adding terms makes the
+pattern bigger, not the scan longer. Phones and links are two more
+precompiled patterns. benchmarks/content_filter_bench.py keeps an eye on
+the per-message cost.
+
+Text is normalised before matching, and terms go through the same steps so
+both sides agree:
+- NFKC (fullwidth and styled letters to plain ones) and casefolding
+- zero-width and other format characters removed
+- common substitutions undone (0->o, 1->i, 3->e, 4->a, 5->s, 7->t, @->a, $->s,
+  and "!"/"|" inside a word -> i)
+The compiled pattern itself tolerates stretched letters ("spaaam"), one
+separator between letters ("s.p.a.m", "s p a m") and any punctuation or
+whitespace between the words of a term, so those need no extra pass over
+the text. Phones are matched on the text before the substitutions; links on
+both, with "[.]" / "(dot)" / " dot " read as a dot.
+
+Terms come from CONTENT_FILTER_TERMS and the file at CONTENT_FILTER_FILE
+(one term per line, "#" comments). A term matches as a whole word; a
+trailing "*" makes it match as a prefix ("spam*" also blocks "spammer").
+The file is re-read when its modification time changes, checked at most
+every CONTENT_FILTER_RELOAD_SECONDS, and the new pattern is compiled in a
+background thread, so moderators can update the list without a restart.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config import (
+    CONTENT_FILTER_BLOCK_LINKS,
+    CONTENT_FILTER_BLOCK_PHONES,
+    CONTENT_FILTER_ENABLED,
+    CONTENT_FILTER_FILE,
+    CONTENT_FILTER_RELOAD_SECONDS,
+    CONTENT_FILTER_TERMS,
+)
+from app.services.metrics import messages_blocked_total
+
+logger = logging.getLogger(__name__)
+
+# Format characters (zero-width space/joiners, BOM, soft hyphen, ...)
+_FORMAT_CHARS = {
+    codepoint: None for codepoint in (
+        0x00AD, 0x034F, 0x061C, 0x180E, 0x200B, 0x200C, 0x200D, 0x200E, 0x200F,
+        0x202A, 0x202B, 0x202C, 0x202D, 0x202E, 0x2060, 0x2061, 0x2062, 0x2063,
+        0x2064, 0xFEFF,
+    )
+}
+_LEET = str.maketrans({
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t",
+    "@": "a", "$": "s",
+})
+# "!" and "|" only stand for "i" inside a word ("sp!ll"), not after one
+_INNER_I = re.compile(r"(?<=[^\W_])[!|](?=[^\W_])")
+_NON_WORD = re.compile(r"[\W_]+")
+
+_DOT_WORDS = re.compile(r"\s*(?:\[\.\]|\(\.\)|\[dot\]|\(dot\)|\sdot\s)\s*")
+_LINK = re.compile(
+    r"(?<=[a-z0-9])\."
+    r"(?:com|net|org|io|gg|ly|ru|app|xyz|link|tv|info|biz|site|online|club)"
+    r"(?![a-z0-9])"
+    r"|https?://|www\."
+)
+# A phone is 7-15 digits, bare ("5551234567", "+15551234567") or in groups
+# split by separators ("555 123 4567", "(555) 123-4567", "+44 20 7946 0958").
+# Decimals ("12345.678901", "10.50 20.00") are numbers, not phones.
+_PHONE = re.compile(
+    r"(?<![\w+.,])"
+    r"(?:\+?\d{7,15}"
+    r"|(?:\+\d{1,3}[ .-]?)?\(?\d{2,5}\)?(?:[ .-]{1,2}\(?\d{2,5}\)?){1,5})"
+    r"(?!\w|[.,]\d)"
+)
+_PHONE_DIGITS = (7, 15)
+_DATE = re.compile(r"\d{1,4}[./-]\d{1,2}[./-]\d{1,4}")
+_DECIMALS = re.compile(r"\d+[.,]\d+(?:\s+\d+[.,]\d+)*")
+_DIGITS = "0123456789"
+
+_WORD_START = r"(?<![^\W_])"
+_WORD_END = r"(?![^\W_])"
+_LETTER_GAP = r"[\W_]?"
+_WORD_GAP = r"[\W_]+"
+
+
+def _fold(text: str) -> str:
+    """NFKC, casefold and strip format characters (the phone/link view)."""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKC", text).translate(_FORMAT_CHARS)
+    return text.casefold()
+
+
+def _unleet(folded: str) -> str:
+    text = folded.translate(_LEET)
+    if "!" in text or "|" in text:
+        text = _INNER_I.sub("i", text)
+    return text
+
+
+def normalize(text: str) -> str:
+    """The view blocked terms are matched against."""
+    return _unleet(_fold(text))
+
+
+def _term_tokens(term: str) -> List[Tuple[str, int]]:
+    """A term as runs of (character, length); words are separated by (" ", 1)."""
+    words = _NON_WORD.sub(" ", normalize(term)).strip()
+    return [(char, len(list(run))) for char, run in groupby(words)]
+
+
+def compile_terms(terms: Iterable[str]) -> Optional["re.Pattern"]:
+    """One trie-shaped pattern matching any of `terms` (None if empty)."""
+    trie: Dict = {}
+    for term in terms:
+        term = term.strip()
+        prefix = term.endswith("*")
+        tokens = _term_tokens(term.rstrip("*"))
+        if not tokens:
+            continue
+        node = trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node["*" if prefix else ""] = True
+    if not trie:
+        return None
+    return re.compile(_WORD_START + _trie_pattern(trie, after_letter=False))
+
+
+def _trie_pattern(node: Dict, after_letter: bool) -> str:
+    """
+    Regex for a trie node. A run of n letters matches n or more of them
+    ("spaaam"), and one separator may sit between letters ("s.p.a.m").
+    """
+    if node.get("*"):
+        # A prefix term ends here: anything longer is a match already
+        return ""
+    letters = sorted(t for t in node if isinstance(t, tuple) and t[0] != " ")
+    branches = []
+    if letters:
+        alternatives = [
+            # Literal first so the engine can skip non-matching branches cheaply
+            re.escape(char) * count + re.escape(char) + "*"
+            + _trie_pattern(node[(char, count)], after_letter=True)
+            for char, count in letters
+        ]
+        group = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        branches.append((_LETTER_GAP if after_letter else "") + group)
+    if (" ", 1) in node:
+        branches.append(_WORD_GAP + _trie_pattern(node[(" ", 1)], after_letter=False))
+    if node.get(""):
+        # Whole-word term; longer terms on this branch are tried first
+        branches.append(_WORD_END)
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+class ContentFilter:
+    """Checks messages against the compiled term list, phones and links."""
+
+    def __init__(
+        self,
+        terms: Iterable[str] = (),
+        path: str = "",
+        block_phones: bool = True,
+        block_links: bool = True,
+        reload_seconds: float = CONTENT_FILTER_RELOAD_SECONDS,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.block_phones = block_phones
+        self.block_links = block_links
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._inline_terms = [t for t in terms if t.strip()]
+        self._terms: Optional[re.Pattern] = None
+        self.term_count = 0
+        self._mtime: Optional[float] = None
+        self._next_stat = 0.0
+        self.reload()
+
+    def check(self, content: str) -> Optional[str]:
+        """Why the message must not be relayed ("term", "phone", "link"), or None."""
+        if not self.enabled:
+            return None
+        if self.path:
+            now = time.monotonic()
+            if now >= self._next_stat:
+                self._next_stat = now + self.reload_seconds
+                self._reload_if_changed()
+
+        folded = _fold(content)
+        if self.block_links and self._has_link(folded):
+            return self._blocked("link")
+        if self.block_phones and self._has_phone(folded):
+            return self._blocked("phone")
+        if self._terms is not None and self._terms.search(_unleet(folded)):
+            return self._blocked("term")
+        return None
+
+    @staticmethod
+    def _has_link(text: str) -> bool:
+        if "." not in text and "dot" not in text and "//" not in text:
+            return False
+        if _LINK.search(text):
+            return True
+        # "example dot com", "examp1e[.]c0m"
+        return _LINK.search(_DOT_WORDS.sub(".", text.translate(_LEET))) is not None
+
+    @staticmethod
+    def _has_phone(text: str) -> bool:
+        if not any(digit in text for digit in _DIGITS):
+            return False
+        low, high = _PHONE_DIGITS
+        for match in _PHONE.finditer(text):
+            number = match.group()
+            if _DATE.fullmatch(number) or _DECIMALS.fullmatch(number):
+                continue
+            if low <= sum(c.isdigit() for c in number) <= high:
+                return True
+        return False
+
+    @staticmethod
+    def _blocked(reason: str) -> str:
+        messages_blocked_total.labels(reason).inc()
+        return reason
+
+    # Term list ---------------------------------------------------------------
+
+    def reload(self):
+        """Rebuild the term pattern from the inline terms and the file."""
+        terms = list(self._inline_terms)
+        if self.path:
+            try:
+                self._mtime = os.stat(self.path).st_mtime
+                terms.extend(self._read_file())
+            except OSError:
+                self._mtime = None
+                logger.warning("Content filter file %s not readable", self.path)
+        self._terms = compile_terms(terms)
+        self.term_count = len(terms)
+        logger.info("Content filter loaded with %d terms", len(terms))
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            # Compiling a long list takes a while; keep it off the event loop
+            # and swap the pattern in when it is ready
+            self._mtime = mtime
+            threading.Thread(target=self.reload, name="content-filter-reload", daemon=True).start()
+
+    def _read_file(self) -> List[str]:
+        with open(self.path, encoding="utf-8") as f:
+            return [
+                line.strip() for line in f
+                if line.strip() and not line.lstrip().startswith("#")
+            ]
+
+
+def _inline_terms() -> Tuple[str, ...]:
+    return tuple(t for t in CONTENT_FILTER_TERMS.split(",") if t.strip())
+
+
+content_filter = ContentFilter(
+    terms=_inline_terms(),
+    path=CONTENT_FILTER_FILE,
+    block_phones=CONTENT_FILTER_BLOCK_PHONES,
+    block_links=CONTENT_FILTER_BLOCK_LINKS,
+    enabled=CONTENT_FILTER_ENABLED,
+)
@@ -0,0 +1,152 @@
+"""
+In-memory denylist of banned devices.
+
+Banned devices tend to reconnect in a loop, and every attempt used to cost a
+karma lookup. The denylist answers "is this device banned?" from a dict:
+it is loaded at startup with one query, updated whenever karma changes
+(services/karma.py), and consulted by check_access_level before the
+database, so banned clients are turned away without a DB round trip.
+
+Temp-ban entries expire after DENYLIST_TEMP_BAN_SECONDS; the next access
+check then re-reads karma from the database. With DENYLIST_REDIS=true, ban
+changes are published on a Redis channel (from a background thread, never
+blocking the caller) so every worker's copy stays current; otherwise a
+worker only learns about unbans it made itself.
+
+Lookups run on the event loop while karma changes also arrive from
+threadpool handlers, so every write to the dict takes a lock.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from app.config import DENYLIST_REDIS, DENYLIST_TEMP_BAN_SECONDS, REDIS_URL
+from app.services.metrics import denylist_rejections_total
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "denylist"
+BAN_LEVELS = ("permanent_ban", "temp_ban")
+
+
+class Denylist:
+    """device_id -> (ban level, expiry) with optional Redis fan-out."""
+
+    def __init__(
+        self,
+        temp_ban_seconds: float = DENYLIST_TEMP_BAN_SECONDS,
+        redis_url: Optional[str] = REDIS_URL if DENYLIST_REDIS else None,
+        clock=time.time,
+    ):
+        self.temp_ban_seconds = temp_ban_seconds
+        self.redis_url = redis_url
+        self._clock = clock
+        self._banned: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._publisher = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._banned)
+
+    def check(self, device_id: str) -> Optional[str]:
+        """The device's ban level, or None if it isn't (known to be) banned."""
+        entry = self._banned.get(device_id)
+        if entry is None:
+            return None
+        level, until = entry
+        if until <= self._clock():
+            with self._lock:
+                # Only drop the expired entry, not a ban set since the read
+                if self._banned.get(device_id) is entry:
+                    del self._banned[device_id]
+            return None
+        denylist_rejections_total.labels(level).inc()
+        return level
+
+    def update(self, device_id: str, level: str):
+        """Record a device's current access level (from a karma change)."""
+        if self._apply(device_id, level):
+            self._publish(device_id, level)
+
+    def load(self, bans):
+        """Replace the denylist with (device_id, level) pairs of banned devices."""
+        with self._lock:
+            self._banned.clear()
+            for device_id, level in bans:
+                self._apply_locked(device_id, level)
+        logger.info("Denylist loaded with %d banned devices", len(self._banned))
+
+    def _apply(self, device_id: str, level: str) -> bool:
+        """Set or clear a device's entry. Returns True if its ban status changed."""
+        with self._lock:
+            return self._apply_locked(device_id, level)
+
+    def _apply_locked(self, device_id: str, level: str) -> bool:
+        if level not in BAN_LEVELS:
+            return self._banned.pop(device_id, None) is not None
+        previous = self._banned.get(device_id)
+        if previous is not None and previous[0] == level:
+            return False
+        ttl = math.inf if level == "permanent_ban" else self.temp_ban_seconds
+        self._banned[device_id] = (level, self._clock() + ttl)
+        return True
+
+    # Redis fan-out -------------------------------------------------------
+
+    def _publish(self, device_id: str, level: str):
+        # Karma changes happen on the event loop too (spam penalties, reports
+        # over the websocket); a slow Redis must not stall it, so the publish
+        # runs on a single background thread, which also keeps the order
+        if not self.redis_url:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="denylist-publish")
+        self._executor.submit(self._send, device_id, level)
+
+    def _send(self, device_id: str, level: str):
+        try:
+            if self._publisher is None:
+                import redis
+                self._publisher = redis.Redis.from_url(self.redis_url, socket_timeout=0.5)
+            self._publisher.publish(CHANNEL, f"{device_id} {level}")
+        except Exception:
+            logger.warning("Denylist publish failed device=%s", device_id[:8], exc_info=True)
+
+    def start(self):
+        """Follow ban changes published by other workers."""
+        if self.redis_url and self._task is None:
+            self._task = asyncio.ensure_future(self._follow())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _follow(self):
+        import redis.asyncio as aioredis
+
+        while True:
+            client = aioredis.from_url(self.redis_url, decode_responses=True)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            device_id, _, level = message["data"].partition(" ")
+                            self._apply(device_id, level)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Denylist subscription lost, retrying", exc_info=True)
+                await asyncio.sleep(5)
+            finally:
+                await client.aclose()
+
+
+denylist = Denylist()
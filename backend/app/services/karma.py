@@ -1,9 +1,12 @@
 """Karma service - Reputation management system."""
+import json
 from datetime import datetime, date
 from sqlalchemy.orm import Session
-from typing import Literal
+from typing import List, Literal, Optional
 
-from app.models import UserSession, Report, ReportStatus
+from app.models import UserSession, Report, ReportStatus, ReportTranscript
+from app.services import report_rollup
+from app.services.denylist import denylist
 from app.config import (
     KARMA_INITIAL,
     KARMA_CHAT_COMPLETE,
@@ -11,6 +14,7 @@ from app.config import (
     KARMA_REPORT_VERIFIED,
     KARMA_FALSE_REPORT,
     KARMA_DAILY_LOGIN,
+    KARMA_SPAM,
     KARMA_FULL_ACCESS,
     KARMA_STANDARD_ACCESS,
     KARMA_WARNING,
@@ -43,19 +47,49 @@ def get_karma(db: Session, device_id: str) -> int:
     return user.karma_score
 
 
-def update_karma(db: Session, device_id: str, delta: int, reason: str = "") -> int:
-    """Adjust karma score by delta. Returns new karma value."""
-    user = get_or_create_user(db, device_id)
+def update_karma(
+    db: Session,
+    device_id: str,
+    delta: int,
+    reason: str = "",
+    user: Optional[UserSession] = None
+) -> int:
+    """
+    Adjust karma score by delta. Returns new karma value.
+    Pass `user` when it is already loaded to skip the lookup.
+    """
+    if user is None:
+        user = get_or_create_user(db, device_id)
     user.karma_score = max(0, user.karma_score + delta)  # Floor at 0
     db.commit()
     db.refresh(user)
+    denylist.update(device_id, access_level_for(user.karma_score))
     return user.karma_score
 
 
 def check_access_level(db: Session, device_id: str) -> AccessLevel:
-    """Determine access tier based on karma thresholds."""
-    karma = get_karma(db, device_id)
-    
+    """
+    Determine access tier based on karma thresholds.
+    Banned devices are answered from the denylist without a DB query.
+    """
+    banned = denylist.check(device_id)
+    if banned:
+        return banned
+    level = access_level_for(get_karma(db, device_id))
+    denylist.update(device_id, level)
+    return level
+
+
+def load_denylist(db: Session) -> None:
+    """Fill the denylist from the database (one query, at startup)."""
+    rows = db.query(UserSession.device_id, UserSession.karma_score).filter(
+        UserSession.karma_score < KARMA_TEMP_BAN
+    )
+    denylist.load((device_id, access_level_for(karma)) for device_id, karma in rows)
+
+
+def access_level_for(karma: int) -> AccessLevel:
+    """Map a karma score to its access tier."""
     if karma <= 0:
         return "permanent_ban"
     elif karma < KARMA_TEMP_BAN:
@@ -72,20 +106,32 @@ def submit_report(
     db: Session,
     reporter_device_id: str,
     reported_device_id: str,
-    reason: str
+    reason: str,
+    transcript: Optional[List[dict]] = None
 ) -> Report:
     """
     Submit a report against another user.
     Applies initial karma penalty to the reported user.
+    `transcript` (the chat's last messages, if any) is stored with the report.
     """
     # Create the report
+    now = datetime.utcnow()
     report = Report(
         reporter_device_id=reporter_device_id,
         reported_device_id=reported_device_id,
         reason=reason,
         status=ReportStatus.PENDING,
+        created_at=now,
     )
     db.add(report)
+    report_rollup.record_filed(db, report, now.date())
+    if transcript:
+        db.flush()
+        db.add(ReportTranscript(
+            report_id=report.id,
+            messages=json.dumps(transcript, ensure_ascii=False),
+            created_at=now,
+        ))
     
     # Apply initial penalty to reported user
     update_karma(db, reported_device_id, KARMA_REPORTED, f"Reported: {reason}")
@@ -105,8 +151,11 @@ def verify_report(db: Session, report_id: int, is_valid: bool) -> Report:
     if not report:
         raise ValueError("Report not found")
     
+    previous = report.status
+    report.status = ReportStatus.VERIFIED if is_valid else ReportStatus.REJECTED
+    report_rollup.record_resolved(db, report, previous)
+    
     if is_valid:
-        report.status = ReportStatus.VERIFIED
         update_karma(
             db,
             report.reported_device_id,
@@ -114,7 +163,6 @@ def verify_report(db: Session, report_id: int, is_valid: bool) -> Report:
             "Report verified"
         )
     else:
-        report.status = ReportStatus.REJECTED
         update_karma(
             db,
             report.reporter_device_id,
@@ -128,9 +176,14 @@ def verify_report(db: Session, report_id: int, is_valid: bool) -> Report:
     return report
 
 
-def award_chat_completion(db: Session, device_id: str) -> int:
+def award_chat_completion(db: Session, device_id: str, user: Optional[UserSession] = None) -> int:
     """Award karma for completing a chat without reports."""
-    return update_karma(db, device_id, KARMA_CHAT_COMPLETE, "Chat completed")
+    return update_karma(db, device_id, KARMA_CHAT_COMPLETE, "Chat completed", user=user)
+
+
+def penalize_spam(db: Session, device_id: str, user: Optional[UserSession] = None) -> int:
+    """Penalty for pasting the same message to many partners (services/spam.py)."""
+    return update_karma(db, device_id, KARMA_SPAM, "Spam burst", user=user)
 
 
 def award_daily_login(db: Session, device_id: str) -> int:
@@ -0,0 +1,199 @@
+"""
+Event-loop health: scheduling lag and attribution of blocking code.
+
+A heartbeat coroutine sleeps LOOP_MONITOR_INTERVAL_SECONDS at a time and
+records how late it wakes up (chat_event_loop_lag_seconds). A watchdog
+thread checks the heartbeat; when it is overdue by more than
+LOOP_SLOW_CALLBACK_SECONDS the loop is stuck in some callback, and the
+watchdog samples the loop thread's stack (sys._current_frames) together with
+the asyncio task that is running. Samples are grouped by the innermost frame
+in our own code, so a blocking SQLAlchemy call or model inference shows up
+as the handler line that made it.
+
+Cost while healthy: one timer wakeup per interval on the loop and a
+watchdog wakeup every half threshold, so it stays on in production.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+from app.config import (
+    LOOP_MONITOR_ENABLED,
+    LOOP_MONITOR_INTERVAL_SECONDS,
+    LOOP_MONITOR_TOP,
+    LOOP_SLOW_CALLBACK_SECONDS,
+)
+from app.services.metrics import loop_blocked_seconds_total, loop_lag_seconds, loop_stalls_total
+
+logger = logging.getLogger(__name__)
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_APP_DIR = os.path.join(_ROOT_DIR, "app") + os.sep
+_STACK_DEPTH = 30
+
+
+class LoopMonitor:
+    """Heartbeat on the event loop plus a stack-sampling watchdog thread."""
+
+    def __init__(
+        self,
+        interval: float = LOOP_MONITOR_INTERVAL_SECONDS,
+        threshold: float = LOOP_SLOW_CALLBACK_SECONDS,
+        top: int = LOOP_MONITOR_TOP,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.top = top
+        self.max_lag = 0.0
+        self._beat = time.perf_counter()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # culprit "file:line function" -> offender stats
+        self._offenders: Dict[str, dict] = {}
+        self._stalls = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.ensure_future(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        self._task = None
+        await asyncio.to_thread(self._watchdog.join)
+        self._watchdog = None
+
+    def report(self) -> dict:
+        """Lag distribution and the worst blocking call sites."""
+        lag = loop_lag_seconds._children[()]
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(loop_lag_seconds.buckets + (float("inf"),), lag.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        with self._lock:
+            offenders = sorted(
+                self._offenders.values(), key=lambda o: o["blocked_seconds"], reverse=True
+            )[:self.top]
+            offenders = [dict(o, blocked_seconds=round(o["blocked_seconds"], 3)) for o in offenders]
+        return {
+            "interval_seconds": self.interval,
+            "threshold_seconds": self.threshold,
+            "lag": {
+                "count": lag.count,
+                "mean_seconds": round(lag.sum / lag.count, 6) if lag.count else 0.0,
+                "max_seconds": round(self.max_lag, 6),
+                "buckets": buckets,
+            },
+            "stalls": self._stalls,
+            "offenders": offenders,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._offenders.clear()
+        self.max_lag = 0.0
+
+    async def _heartbeat(self):
+        while True:
+            start = time.perf_counter()
+            self._beat = start
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            loop_lag_seconds.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+    def _watch(self):
+        period = self.threshold / 2
+        stalled_beat = None
+        while not self._stop.wait(period):
+            beat = self._beat
+            overdue = time.perf_counter() - beat - self.interval
+            if overdue <= self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            new_stall = beat != stalled_beat
+            stalled_beat = beat
+            self._record(frame, self._task_name(), period, new_stall)
+            del frame
+
+    def _task_name(self) -> Optional[str]:
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return None
+        if task is None:
+            return None
+        coro = task.get_coro()
+        return getattr(coro, "__qualname__", None) or task.get_name()
+
+    def _record(self, frame, task: Optional[str], blocked: float, new_stall: bool):
+        stack = traceback.extract_stack(frame, limit=_STACK_DEPTH)
+        culprit = next(
+            (f for f in reversed(stack) if f.filename.startswith(_APP_DIR)),
+            stack[-1],
+        )
+        where = f"{os.path.relpath(culprit.filename, _ROOT_DIR)}:{culprit.lineno} {culprit.name}"
+        loop_blocked_seconds_total.inc(blocked)
+        if new_stall:
+            self._stalls += 1
+            loop_stalls_total.inc()
+        with self._lock:
+            offender = self._offenders.get(where)
+            if offender is None:
+                # Trim before inserting so the stall just seen is reported
+                if len(self._offenders) >= 5 * self.top:
+                    self._trim()
+                offender = self._offenders[where] = {
+                    "where": where, "task": task, "stalls": 0, "samples": 0,
+                    "blocked_seconds": 0.0, "stack": [],
+                }
+            offender["samples"] += 1
+            offender["blocked_seconds"] += blocked
+            offender["stalls"] += new_stall
+            offender["task"] = task or offender["task"]
+            offender["stack"] = _format_stack(stack)
+        if new_stall:
+            logger.warning("Event loop blocked >%.0fms at %s (task %s)", self.threshold * 1000, where, task)
+
+    def _trim(self):
+        keep = sorted(self._offenders.values(), key=lambda o: o["blocked_seconds"], reverse=True)
+        self._offenders = {o["where"]: o for o in keep[:self.top]}
+
+
+def _format_stack(stack) -> List[str]:
+    """Outermost first, like a traceback."""
+    return [f"{f.filename}:{f.lineno} {f.name}" for f in stack]
+
+
+loop_monitor = LoopMonitor()
+
+
+def start_loop_monitor():
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
@@ -0,0 +1,149 @@
+"""
+Priority queue for the in-memory matcher (MATCH_PRIORITY mode).
+
+Waiters are kept in one binary heap per compatibility bucket
+(gender, looking_for). A candidate's score is
+
+    seconds waited + karma tier boost - rejoin penalty
+
+and the best-scored compatible waiter is matched first. Every waiter's wait
+grows at the same rate, so ordering by score is the same as ordering by the
+static key `joined - boost + penalty`; heap keys never need updating.
+
+Removals are lazy: the heap item is marked dead and skipped when it reaches
+the top, and a heap is rebuilt once dead items outnumber live ones, so push,
+pop and remove all stay O(log n) amortized.
+"""
+import heapq
+import itertools
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config import (
+    MATCH_PRIORITY_MAX_REJOIN_PENALTY_SECONDS,
+    MATCH_PRIORITY_REJOIN_PENALTY_SECONDS,
+    MATCH_PRIORITY_REJOIN_WINDOW_SECONDS,
+    MATCH_PRIORITY_TIER_BOOST_SECONDS,
+)
+from app.services.karma import access_level_for
+
+Bucket = Tuple[str, str]
+
+# Heap item layout: [key, tiebreak, entry, bucket]; entry is None once removed
+_ENTRY, _BUCKET = 2, 3
+
+
+def tier_boost(karma: Optional[int]) -> float:
+    """Queue credit (seconds) for a karma score; unknown karma gets none."""
+    if karma is None:
+        return 0.0
+    return MATCH_PRIORITY_TIER_BOOST_SECONDS.get(access_level_for(karma), 0.0)
+
+
+class PriorityMatchQueue:
+    """Per-bucket heaps of waiters with lazy deletion."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._heaps: Dict[Bucket, List[list]] = {}
+        self._dead: Dict[Bucket, int] = {}
+        # device_id -> live heap item
+        self._items: Dict[str, list] = {}
+        self._order = itertools.count()
+        # device_id -> (recent joins, window start) for the rejoin penalty
+        self._joins: Dict[str, Tuple[int, float]] = {}
+        self._prune_joins_at = 1024
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._items
+
+    def push(self, entry: dict, karma: Optional[int] = None, waited: float = 0.0):
+        """
+        Queue an entry (replacing any previous one for the same device).
+        `waited` credits time already spent queued, for restored entries.
+        """
+        device_id = entry["device_id"]
+        self.remove(device_id)
+        now = self._clock()
+        key = now - waited - tier_boost(karma) + self._rejoin_penalty(device_id, now)
+        bucket = (entry["gender"], entry["looking_for"])
+        item = [key, next(self._order), entry, bucket]
+        self._items[device_id] = item
+        heapq.heappush(self._heaps.setdefault(bucket, []), item)
+
+    def remove(self, device_id: str) -> bool:
+        """Drop a device's entry. Returns False if it wasn't queued."""
+        item = self._items.pop(device_id, None)
+        if item is None:
+            return False
+        item[_ENTRY] = None
+        bucket = item[_BUCKET]
+        self._dead[bucket] = self._dead.get(bucket, 0) + 1
+        heap = self._heaps[bucket]
+        if self._dead[bucket] > len(heap) // 2:
+            heap[:] = [i for i in heap if i[_ENTRY] is not None]
+            heapq.heapify(heap)
+            self._dead[bucket] = 0
+        return True
+
+    def pop_best(self, buckets: Iterable[Bucket], exclude: Optional[str] = None) -> Optional[dict]:
+        """
+        Take the highest-priority entry across `buckets`, skipping the
+        `exclude` device (the searcher itself, which keeps its place).
+        """
+        best = held = None
+        for bucket in buckets:
+            heap = self._heaps.get(bucket)
+            top = self._peek(bucket, heap) if heap else None
+            if top is not None and top[_ENTRY]["device_id"] == exclude:
+                held = heapq.heappop(heap)
+                top = self._peek(bucket, heap)
+            if top is not None and (best is None or top < best):
+                best = top
+
+        if best is not None:
+            heapq.heappop(self._heaps[best[_BUCKET]])
+            del self._items[best[_ENTRY]["device_id"]]
+        if held is not None:
+            heapq.heappush(self._heaps[held[_BUCKET]], held)
+        return best[_ENTRY] if best is not None else None
+
+    def bucket_sizes(self) -> Dict[Bucket, int]:
+        """Live entries per bucket."""
+        return {
+            bucket: len(heap) - self._dead.get(bucket, 0)
+            for bucket, heap in self._heaps.items()
+        }
+
+    def clear(self):
+        self._heaps.clear()
+        self._dead.clear()
+        self._items.clear()
+        self._joins.clear()
+
+    def _peek(self, bucket: Bucket, heap: List[list]) -> Optional[list]:
+        """Top live item of a heap, discarding dead ones on the way."""
+        while heap and heap[0][_ENTRY] is None:
+            heapq.heappop(heap)
+            self._dead[bucket] -= 1
+        return heap[0] if heap else None
+
+    def _rejoin_penalty(self, device_id: str, now: float) -> float:
+        """Fairness term: users re-joining over and over yield to steadier waiters."""
+        count, since = self._joins.get(device_id, (0, now))
+        if now - since > MATCH_PRIORITY_REJOIN_WINDOW_SECONDS:
+            count, since = 0, now
+        self._joins[device_id] = (count + 1, since)
+        if len(self._joins) > self._prune_joins_at:
+            self._joins = {
+                d: v for d, v in self._joins.items()
+                if now - v[1] <= MATCH_PRIORITY_REJOIN_WINDOW_SECONDS
+            }
+            self._prune_joins_at = 2 * len(self._joins) + 1024
+        return min(
+            count * MATCH_PRIORITY_REJOIN_PENALTY_SECONDS,
+            MATCH_PRIORITY_MAX_REJOIN_PENALTY_SECONDS,
+        )
@@ -0,0 +1,160 @@
+"""
+Matchmaking shard process.
+
+Owns the queues for a subset of preference buckets (see sharding.py) and is
+the single writer for them: one asyncio loop, no locks. API workers connect
+over a unix socket and speak newline-delimited JSON.
+
+Run one process per path listed in MATCH_SHARDS:
+    python -m app.services.match_shard /tmp/chat-shard-0.sock
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Dict, Set
+
+from app.services.matching import (
+    MatchingService,
+    _active_matches,
+    _memory_queues,
+    _priority_queue,
+    _queue_index,
+)
+from app.services.tracing import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+class ShardServer:
+    """Queue owner for one shard; relays frames for the matches it made."""
+
+    def __init__(self):
+        self.matching = MatchingService()
+        # device_id -> worker connection that device is attached to
+        self.owners: Dict[str, asyncio.StreamWriter] = {}
+        self.queued: Set[str] = set()
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one API worker until it disconnects."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Dropping malformed shard request")
+                    continue
+                await self.dispatch(msg, writer)
+        except ConnectionError:
+            pass
+        finally:
+            await self.drop_worker(writer)
+            writer.close()
+
+    async def dispatch(self, msg: dict, writer: asyncio.StreamWriter):
+        op = msg.get("op")
+        if op == "join":
+            await self.join(msg, writer)
+        elif op == "leave":
+            await self.leave(msg["device_id"], msg["gender"])
+        elif op == "send":
+            self.send(msg["device_id"], {"event": "deliver", "device_id": msg["device_id"], "frame": msg["frame"]})
+        elif op == "end":
+            await self.end(msg["device_id"])
+        elif op == "summary":
+            self.reply(writer, {"id": msg["id"], "summary": await self.matching.queue_summary()})
+        elif op == "page":
+            page = await self.matching.queue_page(tuple(msg["bucket"]), msg.get("cursor"), msg["limit"])
+            self.reply(writer, {"id": msg["id"], "page": page})
+
+    async def join(self, msg: dict, writer: asyncio.StreamWriter):
+        """
+        Match a searcher against this shard's queues.
+        With enqueue=False this is a probe: the searcher is never left queued.
+        """
+        device_id = msg["device_id"]
+        self.owners[device_id] = writer
+        if msg["enqueue"]:
+            await self.matching.add_to_queue(
+                device_id, msg["gender"], msg["looking_for"], msg.get("karma")
+            )
+            self.queued.add(device_id)
+
+        match = await self.matching.find_match(device_id, msg["gender"], msg["looking_for"])
+        if match:
+            partner_id = match["device_id"]
+            self.queued.discard(device_id)
+            self.queued.discard(partner_id)
+            # Tell the partner's worker before replying, so both sides see
+            # the pairing before any chat frame for it
+            self.send(partner_id, {"event": "matched", "device_id": partner_id, "partner": device_id})
+        elif not msg["enqueue"]:
+            self.owners.pop(device_id, None)
+
+        self.reply(writer, {"id": msg["id"], "match": match})
+
+    async def leave(self, device_id: str, gender: str):
+        if device_id in self.queued:
+            self.queued.discard(device_id)
+            await self.matching.remove_from_queue(device_id, gender)
+        if device_id not in _active_matches:
+            self.owners.pop(device_id, None)
+
+    async def end(self, device_id: str):
+        """End a match made here and tell the partner's worker."""
+        partner_id = _active_matches.get(device_id)
+        await self.matching.end_match(device_id)
+        if device_id not in self.queued:
+            self.owners.pop(device_id, None)
+        if partner_id:
+            self.send(partner_id, {"event": "ended", "device_id": partner_id, "partner": device_id})
+            if partner_id not in self.queued:
+                self.owners.pop(partner_id, None)
+
+    async def drop_worker(self, writer: asyncio.StreamWriter):
+        """A worker went away: dequeue its devices and end their matches."""
+        gone = [d for d, w in self.owners.items() if w is writer]
+        for device_id in gone:
+            if device_id in self.queued:
+                self.queued.discard(device_id)
+                for queue in _memory_queues.values():
+                    queue[:] = [e for e in queue if e["device_id"] != device_id]
+                _priority_queue.remove(device_id)
+                _queue_index.remove(device_id)
+            partner_id = _active_matches.get(device_id)
+            if partner_id and self.owners.get(partner_id) is not writer:
+                self.send(partner_id, {"event": "deliver", "device_id": partner_id, "frame": {"type": "partner_left"}})
+            await self.end(device_id)
+        if gone:
+            logger.info("Worker disconnected; released %d devices", len(gone))
+
+    def send(self, device_id: str, event: dict):
+        writer = self.owners.get(device_id)
+        if writer is not None:
+            self.reply(writer, event)
+
+    @staticmethod
+    def reply(writer: asyncio.StreamWriter, payload: dict):
+        if not writer.is_closing():
+            writer.write(json.dumps(payload).encode() + b"\n")
+
+
+async def serve(path: str):
+    if os.path.exists(path):
+        os.unlink(path)
+    shard = ShardServer()
+    server = await asyncio.start_unix_server(shard.handle_worker, path=path)
+    logger.info("Match shard listening on %s", path)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        raise SystemExit("usage: python -m app.services.match_shard <socket-path>")
+    setup_logging()
+    asyncio.run(serve(sys.argv[1]))
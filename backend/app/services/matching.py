@@ -2,12 +2,25 @@
 Matching service using Redis for real-time queue management.
 """
 import json
+import time
 import asyncio
+from itertools import chain
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import logging
 
+from app.config import MATCH_PRIORITY, MATCH_SHARDS
+from app.services.match_priority import PriorityMatchQueue
+from app.services.queue_index import Bucket, QueueIndex, bucket_name, describe_entry
+from app.services.metrics import (
+    match_attempts_total,
+    match_latency_seconds,
+    queue_wait_seconds,
+)
+from app.services.tracing import SampledTracer
+
 logger = logging.getLogger(__name__)
+_tracer = SampledTracer(logger)
 
 # In-memory fallback when Redis is not available
 _memory_queues: Dict[str, list] = {
@@ -16,72 +29,103 @@ _memory_queues: Dict[str, list] = {
     "any": [],
 }
 _active_matches: Dict[str, str] = {}  # device_id -> partner_device_id
+# In-memory queues for priority mode, one heap per (gender, looking_for) bucket
+_priority_queue = PriorityMatchQueue()
+# Per-bucket counts, oldest waiter and paginated listings of the in-memory queues
+_queue_index = QueueIndex()
+
+GENDERS = ("male", "female")
+PREFERENCES = ("male", "female", "any")
+
+
+def normalize_gender(gender: str) -> str:
+    """Map verification results (Man/Woman) to queue names (male/female)."""
+    normalized = gender.lower()
+    if normalized == "man":
+        return "male"
+    if normalized == "woman":
+        return "female"
+    return normalized
+
+
+def compatible(gender: str, looking_for: str, other_gender: str, other_looking_for: str) -> bool:
+    return (
+        looking_for in ("any", other_gender)
+        and other_looking_for in ("any", gender)
+    )
 
 
 class MatchingService:
     """Handles user matching with queue-based system."""
     
-    def __init__(self, redis_client=None):
+    def __init__(self, redis_client=None, priority: bool = MATCH_PRIORITY):
         self.redis = redis_client
         self.use_memory = redis_client is None
+        # Priority ordering is only implemented for the in-memory queues
+        self.priority = priority and self.use_memory
         
     async def add_to_queue(
         self,
         device_id: str,
         gender: str,
-        looking_for: str  # "male", "female", or "any"
+        looking_for: str,  # "male", "female", or "any"
+        karma: Optional[int] = None
     ) -> bool:
         """
         Add user to matching queue.
         Returns True if added successfully.
+        karma only affects ordering in priority mode.
         """
-        # Normalize gender to match queue names (male/female)
-        normalized_gender = gender.lower()
-        if normalized_gender == "man":
-            normalized_gender = "male"
-        elif normalized_gender == "woman":
-            normalized_gender = "female"
+        normalized_gender = normalize_gender(gender)
         
         queue_entry = {
             "device_id": device_id,
             "gender": normalized_gender,
             "looking_for": looking_for.lower(),
             "joined_at": datetime.utcnow().isoformat(),
+            "karma": karma,
         }
         
-        if self.use_memory:
+        if self.priority:
+            _priority_queue.push(queue_entry, karma)
+            _queue_index.add(queue_entry)
+            return True
+        elif self.use_memory:
             # In-memory queue
             queue_name = normalized_gender
             if queue_name not in _memory_queues:
                 queue_name = "any"
             _memory_queues[queue_name].append(queue_entry)
-            logger.info(f"Added {device_id} to memory queue: {queue_name}")
+            _queue_index.add(queue_entry)
+            logger.debug("Added %s to memory queue: %s", device_id[:8], queue_name)
             return True
         else:
             # Redis queue
-            queue_key = f"queue:{gender.lower()}"
+            queue_key = f"queue:{normalized_gender}"
             await self.redis.lpush(queue_key, json.dumps(queue_entry))
             # Set expiry on queue entry (auto-cleanup after 5 minutes)
             await self.redis.expire(queue_key, 300)
+            # Join-time index for introspection (see queue_summary/queue_page)
+            index_key = self._index_key((normalized_gender, queue_entry["looking_for"]))
+            await self.redis.zadd(index_key, {device_id: time.time()})
+            await self.redis.expire(index_key, 300)
             return True
     
     
     async def remove_from_queue(self, device_id: str, gender: str) -> bool:
         """Remove user from their queue."""
-        # Normalize gender to match queue names
-        normalized_gender = gender.lower()
-        if normalized_gender == "man":
-            normalized_gender = "male"
-        elif normalized_gender == "woman":
-            normalized_gender = "female"
+        normalized_gender = normalize_gender(gender)
         
-        if self.use_memory:
+        if self.priority:
+            _queue_index.remove(device_id)
+            return _priority_queue.remove(device_id)
+        elif self.use_memory:
+            _queue_index.remove(device_id)
             queue_name = normalized_gender
             if queue_name in _memory_queues:
-                _memory_queues[queue_name] = [
-                    e for e in _memory_queues[queue_name]
-                    if e["device_id"] != device_id
-                ]
+                # In place, so the list keeps its spare capacity for appends
+                queue = _memory_queues[queue_name]
+                queue[:] = [e for e in queue if e["device_id"] != device_id]
             return True
         else:
             # Redis removal (scan and remove)
@@ -91,6 +135,7 @@ class MatchingService:
                 data = json.loads(entry)
                 if data["device_id"] == device_id:
                     await self.redis.lrem(queue_key, 1, entry)
+                    await self.redis.zrem(self._index_key((data["gender"], data["looking_for"])), device_id)
                     return True
             return False
     
@@ -99,6 +144,27 @@ class MatchingService:
         device_id: str,
         my_gender: str,
         looking_for: str
+    ) -> Optional[Dict[str, Any]]:
+        """Find a matching partner, recording search latency and queue wait."""
+        start = time.perf_counter()
+        candidate = await self._find_match(device_id, my_gender, looking_for)
+        match_latency_seconds.observe(time.perf_counter() - start)
+        
+        if candidate:
+            match_attempts_total.labels("matched").inc()
+            joined_at = datetime.fromisoformat(candidate["joined_at"])
+            queue_wait_seconds.observe(
+                max(0.0, (datetime.utcnow() - joined_at).total_seconds())
+            )
+        else:
+            match_attempts_total.labels("no_match").inc()
+        return candidate
+    
+    async def _find_match(
+        self,
+        device_id: str,
+        my_gender: str,
+        looking_for: str
     ) -> Optional[Dict[str, Any]]:
         """
         Find a matching partner from the queue.
@@ -111,85 +177,90 @@ class MatchingService:
         - I'm looking for their gender (or any)
         - They're looking for my gender (or any)
         """
-        # Normalize my_gender to match queue data (man/woman -> male/female)
-        my_gender_lower = my_gender.lower()
-        if my_gender_lower == "man":
-            my_gender_lower = "male"
-        elif my_gender_lower == "woman":
-            my_gender_lower = "female"
+        my_gender_lower = normalize_gender(my_gender)
         
         target_gender = looking_for.lower() if looking_for.lower() != "any" else None
         
-        print(f"\n🔍 [MATCH] Searching for match:")
-        print(f"   Device: {device_id[:12]}...")
-        print(f"   My gender: {my_gender_lower}")
-        print(f"   Looking for: {looking_for}")
-        print(f"   Target gender: {target_gender}")
-        print(f"   Queue stats: {self.get_queue_stats()}")
-        
-        logger.info(f"[MATCH] {device_id[:8]}... ({my_gender_lower}) looking for {looking_for}")
-        logger.info(f"[MATCH] Current queues: {self.get_queue_stats()}")
+        trace = _tracer.start()
+        if trace:
+            _tracer.event(
+                "match.search",
+                device=device_id[:8],
+                gender=my_gender_lower,
+                looking_for=looking_for,
+                queues=self.get_queue_stats(),
+            )
         
-        if self.use_memory:
-            # Search in-memory queues
-            candidates = []
-            
+        if self.priority:
+            # Best-scored waiter across the compatible buckets
+            buckets = [
+                (g, lf) for g in GENDERS for lf in PREFERENCES
+                if compatible(my_gender_lower, looking_for.lower(), g, lf)
+            ]
+            candidate = _priority_queue.pop_best(buckets, exclude=device_id)
+            if candidate is None:
+                if trace:
+                    _tracer.event("match.none", device=device_id[:8], buckets=len(buckets))
+                return None
+            if trace:
+                _tracer.event(
+                    "match.found",
+                    device=device_id[:8],
+                    partner=candidate["device_id"][:8],
+                )
+            _priority_queue.remove(device_id)
+            _queue_index.remove(device_id)
+            _queue_index.remove(candidate["device_id"])
+            _active_matches[device_id] = candidate["device_id"]
+            _active_matches[candidate["device_id"]] = device_id
+            return candidate
+        elif self.use_memory:
+            # Search in-memory queues (iterated in place; we return right after mutating)
             if target_gender:
                 # Looking for specific gender - search THAT gender's queue
-                candidates = list(_memory_queues.get(target_gender, []))
-                print(f"   Searching {target_gender} queue: {len(candidates)} candidates")
-                logger.info(f"[MATCH] Searching {target_gender} queue: {len(candidates)} candidates")
+                candidates = _memory_queues.get(target_gender, [])
             else:
                 # Looking for any - search all queues
-                for queue in _memory_queues.values():
-                    candidates.extend(queue)
-                print(f"   Searching all queues: {len(candidates)} total candidates")
-                logger.info(f"[MATCH] Searching all queues: {len(candidates)} total candidates")
+                candidates = chain.from_iterable(_memory_queues.values())
             
             # Find compatible match - mutual compatibility check
-            for idx, candidate in enumerate(candidates):
-                print(f"\n   Candidate {idx + 1}: {candidate['device_id'][:12]}...")
-                
+            scanned = 0
+            for candidate in candidates:
+                scanned += 1
                 if candidate["device_id"] == device_id:
-                    print(f"   ❌ Skipping self")
-                    logger.info(f"[MATCH] Skipping self")
                     continue
                 
-                candidate_gender = candidate["gender"]
-                their_pref = candidate["looking_for"]
-                
                 # Check mutual compatibility:
                 # 1. I'm ok with their gender (target_gender matches or I want any)
-                i_want_them = (target_gender is None or candidate_gender == target_gender)
                 # 2. They're ok with my gender (they want my gender or any)
-                they_want_me = (their_pref == "any" or their_pref == my_gender_lower)
+                if target_gender is not None and candidate["gender"] != target_gender:
+                    continue
+                their_pref = candidate["looking_for"]
+                if their_pref != "any" and their_pref != my_gender_lower:
+                    continue
                 
-                print(f"   Gender: {candidate_gender}, Looking for: {their_pref}")
-                print(f"   i_want_them: {i_want_them} (target={target_gender}, candidate_gender={candidate_gender})")
-                print(f"   they_want_me: {they_want_me} (their_pref={their_pref}, my_gender={my_gender_lower})")
+                if trace:
+                    _tracer.event(
+                        "match.found",
+                        device=device_id[:8],
+                        partner=candidate["device_id"][:8],
+                        scanned=scanned,
+                    )
+                # Remove both users from the queue
+                await self.remove_from_queue(
+                    candidate["device_id"],
+                    candidate["gender"]
+                )
+                await self.remove_from_queue(device_id, my_gender_lower)
                 
-                logger.info(f"[MATCH] Candidate {candidate['device_id'][:8]}... ({candidate_gender}, wants {their_pref})")
-                logger.info(f"[MATCH] i_want_them={i_want_them}, they_want_me={they_want_me}")
+                # Store active match
+                _active_matches[device_id] = candidate["device_id"]
+                _active_matches[candidate["device_id"]] = device_id
                 
-                if i_want_them and they_want_me:
-                    print(f"   ✅ MATCH FOUND!")
-                    logger.info(f"[MATCH] SUCCESS! Matched with {candidate['device_id'][:8]}...")
-                    # Remove from queue
-                    await self.remove_from_queue(
-                        candidate["device_id"],
-                        candidate["gender"]
-                    )
-                    
-                    # Store active match
-                    _active_matches[device_id] = candidate["device_id"]
-                    _active_matches[candidate["device_id"]] = device_id
-                    
-                    return candidate
-                else:
-                    print(f"   ❌ Not compatible")
+                return candidate
             
-            print(f"\n❌ No match found\n")
-            logger.info(f"[MATCH] No match found for {device_id[:8]}...")
+            if trace:
+                _tracer.event("match.none", device=device_id[:8], scanned=scanned)
             return None
         else:
             # Redis-based matching
@@ -206,17 +277,26 @@ class MatchingService:
                         continue
                     
                     their_pref = candidate["looking_for"]
-                    if their_pref == "any" or their_pref == my_gender.lower():
-                        # Remove from queue
+                    if their_pref == "any" or their_pref == my_gender_lower:
+                        # Remove both users from the queue
                         await self.redis.lrem(queue_key, 1, entry)
+                        await self.redis.zrem(
+                            self._index_key((candidate["gender"], their_pref)),
+                            candidate["device_id"],
+                        )
+                        await self.remove_from_queue(device_id, my_gender_lower)
                         
-                        # Store match in Redis
-                        match_key = f"match:{device_id}"
+                        # Store match in Redis (both directions, like _active_matches)
                         await self.redis.set(
-                            match_key,
+                            f"match:{device_id}",
                             candidate["device_id"],
                             ex=3600  # 1 hour expiry
                         )
+                        await self.redis.set(
+                            f"match:{candidate['device_id']}",
+                            device_id,
+                            ex=3600
+                        )
                         
                         return candidate
             
@@ -247,10 +327,116 @@ class MatchingService:
     
     def get_queue_stats(self) -> Dict[str, int]:
         """Get current queue sizes (for debugging)."""
+        if self.priority:
+            stats = dict.fromkeys(_memory_queues, 0)
+            for (gender, _), size in _priority_queue.bucket_sizes().items():
+                stats[gender if gender in stats else "any"] += size
+            return stats
         if self.use_memory:
             return {k: len(v) for k, v in _memory_queues.items()}
         return {}
+    
+    def export_state(self) -> Dict[str, list]:
+        """In-memory queues and matches as compact rows (see services/snapshot.py)."""
+        if not self.use_memory:
+            return {"queue": [], "pairs": []}
+        entries = (
+            _queue_index.entries() if self.priority
+            else chain.from_iterable(_memory_queues.values())
+        )
+        queue = [
+            [e["device_id"], e["gender"], e["looking_for"], e["joined_at"], e.get("karma")]
+            for e in entries
+        ]
+        pairs = [[a, b] for a, b in _active_matches.items() if a < b]
+        return {"queue": queue, "pairs": pairs}
+    
+    def import_state(self, queue: list, pairs: list) -> int:
+        """
+        Restore rows from export_state, keeping each entry's original join
+        time (and so its priority). Returns the number of queued entries.
+        """
+        if not self.use_memory:
+            return 0
+        now = datetime.utcnow()
+        for device_id, gender, looking_for, joined_at, karma in queue:
+            entry = {
+                "device_id": device_id,
+                "gender": gender,
+                "looking_for": looking_for,
+                "joined_at": joined_at,
+                "karma": karma,
+            }
+            waited = max(0.0, (now - datetime.fromisoformat(joined_at)).total_seconds())
+            if self.priority:
+                _priority_queue.push(entry, karma, waited)
+            else:
+                _memory_queues[gender if gender in _memory_queues else "any"].append(entry)
+            _queue_index.add(entry, waited)
+        for device_id, partner_id in pairs:
+            _active_matches[device_id] = partner_id
+            _active_matches[partner_id] = device_id
+        return len(queue)
+    
+    async def queue_summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-bucket queue size and oldest wait, e.g.
+        {"male:any": {"count": 12, "oldest_wait_seconds": 4.2}}.
+        Read from incrementally maintained indexes; never walks the queues.
+        """
+        if self.use_memory:
+            return _queue_index.summary()
+        now = time.time()
+        summary = {}
+        for bucket in [(g, lf) for g in GENDERS for lf in PREFERENCES]:
+            key = self._index_key(bucket)
+            count = await self.redis.zcard(key)
+            if count:
+                oldest = await self.redis.zrange(key, 0, 0, withscores=True)
+                summary[bucket_name(bucket)] = {
+                    "count": count,
+                    "oldest_wait_seconds": round(max(0.0, now - oldest[0][1]), 1) if oldest else None,
+                }
+        return summary
+    
+    async def queue_page(self, bucket: Bucket, cursor: Optional[str], limit: int) -> Dict[str, Any]:
+        """
+        One page of a bucket's waiters, oldest first:
+        {"entries": [...], "next_cursor": str | None}.
+        Pass next_cursor back to continue; cursors are backend specific.
+        """
+        if self.use_memory:
+            return _queue_index.page(bucket, cursor, limit)
+        # Cursor is the last join time seen; waiters with the exact same
+        # timestamp as a page boundary may be skipped
+        low = "-inf"
+        if cursor:
+            try:
+                low = f"({float(cursor)!r}"
+            except ValueError:
+                pass
+        rows = await self.redis.zrangebyscore(
+            self._index_key(bucket), low, "+inf", start=0, num=limit + 1, withscores=True
+        )
+        now = time.time()
+        entries = [
+            describe_entry(
+                {"device_id": device_id, "gender": bucket[0], "looking_for": bucket[1]},
+                now - joined,
+            )
+            for device_id, joined in rows[:limit]
+        ]
+        next_cursor = repr(rows[limit - 1][1]) if len(rows) > limit else None
+        return {"entries": entries, "next_cursor": next_cursor}
+    
+    @staticmethod
+    def _index_key(bucket: Bucket) -> str:
+        return f"queue:index:{bucket_name(bucket)}"
 
 
 # Global instance (can be overridden with Redis client)
-matching_service = MatchingService()
+if MATCH_SHARDS:
+    from app.services.sharding import ShardedMatchingService
+    matching_service = ShardedMatchingService(MATCH_SHARDS)
+else:
+    matching_service = MatchingService()
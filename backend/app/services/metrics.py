@@ -0,0 +1,412 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Each worker process keeps its own registry: with several app.serve workers,
+/metrics shows only the worker that answered the scrape. Updates come from
+the event loop and from threadpool threads (sync endpoints, the SQLAlchemy
+hooks in instrument_engine), so each one is made under a single module lock;
+it is held for a few additions only and never contended for long.
+"""
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+# Route template of the request currently being served (set by middleware)
+current_route: ContextVar[str] = ContextVar("current_route", default="unknown")
+# Type of the websocket frame currently being handled (set by ws_chat)
+current_ws_message: ContextVar[Optional[str]] = ContextVar("current_ws_message", default=None)
+# The same two values per running task, for the profiler's sampler thread
+# (which cannot read another task's context before Python 3.12)
+task_scopes: "WeakKeyDictionary[asyncio.Task, Dict[str, Optional[str]]]" = WeakKeyDictionary()
+
+
+def _scope_current_task(key: str, value: Optional[str]):
+    task = asyncio.current_task()
+    if task is not None:
+        scope = task_scopes.get(task)
+        if scope is None:
+            scope = task_scopes[task] = {}
+        scope[key] = value
+
+
+def set_ws_message(msg_type: Optional[str]):
+    """Record the websocket frame type being handled by this task."""
+    current_ws_message.set(msg_type)
+    _scope_current_task("message_type", msg_type)
+
+# Guards every metric update (see module docstring)
+_lock = threading.Lock()
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+WAIT_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """Base class: a named metric family with optional labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Get (or create) the child for a label combination."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with _lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        labels = _format_labels(self.labelnames, values)
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        with _lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with _lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._children[()].inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, optionally computed at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        callback: Optional[Callable[[], float]] = None,
+    ):
+        self.callback = callback
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._children[()].dec(amount)
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+    def render(self) -> List[str]:
+        if self.callback is not None:
+            self._children[()].set(self.callback())
+        return super().render()
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with _lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram (cumulative buckets computed at scrape time)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def time(self):
+        """Context manager observing the elapsed wall time in seconds."""
+        return _Timer(self._children[()])
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("target", "start")
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Collection of metric families rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text format 0.0.4."""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry
+registry = MetricsRegistry()
+
+worker_info = registry.register(Gauge(
+    "chat_worker_info", "Worker process serving this scrape", ("pid",)
+))
+worker_info.labels(str(os.getpid())).set(1)
+
+# Matching
+queue_wait_seconds = registry.register(Histogram(
+    "chat_queue_wait_seconds",
+    "Time a matched candidate spent waiting in the queue",
+    buckets=WAIT_BUCKETS,
+))
+match_latency_seconds = registry.register(Histogram(
+    "chat_match_latency_seconds", "Duration of a find_match search"
+))
+match_attempts_total = registry.register(Counter(
+    "chat_match_attempts_total", "find_match searches", ("result",)
+))
+matches_total = registry.register(Counter(
+    "chat_matches_total", "Chat pairs established"
+))
+
+# Chat relay
+messages_relayed_total = registry.register(Counter(
+    "chat_messages_relayed_total", "Chat messages relayed to a partner"
+))
+messages_blocked_total = registry.register(Counter(
+    "chat_messages_blocked_total", "Chat messages not relayed by the content filter", ("reason",)
+))
+ws_send_latency_seconds = registry.register(Histogram(
+    "chat_ws_send_latency_seconds", "Time to write one frame to a websocket"
+))
+ws_send_errors_total = registry.register(Counter(
+    "chat_ws_send_errors_total", "Websocket sends that failed and dropped the socket"
+))
+ws_connected_sockets = registry.register(Gauge(
+    "chat_ws_connected_sockets", "Currently connected chat websockets"
+))
+chat_signals_total = registry.register(Counter(
+    "chat_signals_total", "Typing/read signals by outcome", ("kind", "outcome")
+))
+ws_frames_dropped_total = registry.register(Counter(
+    "chat_ws_frames_dropped_total", "Inbound frames dropped by rate limiting", ("kind",)
+))
+ws_resumes_total = registry.register(Counter(
+    "chat_ws_resumes_total", "Session resume outcomes", ("outcome",)
+))
+ws_protocol_connections_total = registry.register(Counter(
+    "chat_ws_protocol_connections_total", "Accepted websockets by negotiated wire protocol", ("protocol",)
+))
+ws_rate_limit_disconnects_total = registry.register(Counter(
+    "chat_ws_rate_limit_disconnects_total", "Sockets closed for repeated rate limit violations"
+))
+
+# Event loop
+loop_lag_seconds = registry.register(Histogram(
+    "chat_event_loop_lag_seconds",
+    "How late the event loop heartbeat woke up",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+))
+loop_stalls_total = registry.register(Counter(
+    "chat_event_loop_stalls_total", "Times a callback blocked the event loop past the threshold"
+))
+loop_blocked_seconds_total = registry.register(Counter(
+    "chat_event_loop_blocked_seconds_total", "Sampled time the event loop spent blocked"
+))
+
+# Moderation
+report_suspensions_total = registry.register(Counter(
+    "chat_report_suspensions_total", "Devices soft-suspended after a burst of reports"
+))
+spam_flags_total = registry.register(Counter(
+    "chat_spam_flags_total", "Devices flagged for sending near-duplicate messages to many partners"
+))
+denylist_rejections_total = registry.register(Counter(
+    "chat_denylist_rejections_total", "Access checks answered from the banned-device denylist", ("level",)
+))
+
+# Database
+db_queries_total = registry.register(Counter(
+    "chat_db_queries_total", "SQL statements executed", ("route",)
+))
+db_query_seconds = registry.register(Histogram(
+    "chat_db_query_seconds", "SQL statement latency", ("route",)
+))
+
+# Verification
+verification_inference_seconds = registry.register(Histogram(
+    "chat_verification_inference_seconds",
+    "Gender model inference time",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+))
+
+
+def instrument_engine(engine):
+    """Attach SQLAlchemy cursor hooks recording per-route query count and latency."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_metrics_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        route = current_route.get()
+        db_queries_total.labels(route).inc()
+        db_query_seconds.labels(route).observe(elapsed)
+
+
+class RouteLabelMiddleware:
+    """ASGI middleware recording the matched route template in `current_route`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            route = _route_template(scope)
+            token = current_route.set(route)
+            _scope_current_task("route", route)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                current_route.reset(token)
+        else:
+            await self.app(scope, receive, send)
+
+
+def _route_template(scope) -> str:
+    """Resolve the path template (e.g. /ws/chat/{device_id}) to keep label cardinality low."""
+    from starlette.routing import Match
+
+    app = scope.get("app")
+    router = getattr(app, "router", None)
+    if router is not None:
+        for route in router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", scope["path"])
+    return "unmatched"
@@ -0,0 +1,157 @@
+"""
+On-demand statistical profiler for a live worker.
+
+A sampler thread reads every thread's current stack (sys._current_frames)
+at a fixed interval for the requested duration and counts identical stacks.
+Samples taken on the event loop thread are prefixed with the asyncio task
+that was running, so time spent in websocket handlers and async routes is
+attributed per coroutine. The result is in the collapsed-stack format
+understood by flamegraph.pl, speedscope and friends:
+
+    MainThread;task:websocket_endpoint;main (app/main.py:10);... 42
+
+Profiles can be scoped to one route template or websocket message type.
+Scoping looks up the running task in task_scopes (services/metrics.py),
+where the route middleware and the websocket dispatch record each task's
+route and frame type, so a scoped profile covers work done on the event
+loop only; threadpool threads are left out.
+
+Overhead is one stack walk per thread per interval in a background thread;
+nothing is installed on the profiled code paths. The sampler needs the GIL,
+so busy threads are sampled at most every sys.getswitchinterval() (5ms).
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from app.services.metrics import task_scopes
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_MAX_DEPTH = 128
+
+# Innermost frames of threads waiting for work (dropped unless include_idle)
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("handlers.py", "dequeue"),
+}
+
+
+class ProfilerBusy(RuntimeError):
+    """A profile is already running in this process."""
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(_ROOT_DIR + os.sep):
+        return os.path.relpath(filename, _ROOT_DIR)
+    marker = "site-packages" + os.sep
+    index = filename.find(marker)
+    if index != -1:
+        return filename[index + len(marker):]
+    return os.path.basename(filename)
+
+
+class SamplingProfiler:
+    """Collapsed-stack sampling of all threads of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # code object -> "name (file:line" prefix; the line is appended per sample
+        self._labels: Dict[object, str] = {}
+
+    async def profile(
+        self,
+        seconds: float,
+        interval: float,
+        route: Optional[str] = None,
+        message_type: Optional[str] = None,
+        include_idle: bool = False,
+    ) -> Dict:
+        """
+        Sample for `seconds` and return {"samples": N, "collapsed": "..."}.
+        Raises ProfilerBusy if another profile is running.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            loop = asyncio.get_running_loop()
+            return await asyncio.to_thread(
+                self._sample, loop, threading.get_ident(), seconds, interval,
+                route, message_type, include_idle,
+            )
+        finally:
+            self._lock.release()
+
+    def _sample(self, loop, loop_thread, seconds, interval, route, message_type, include_idle):
+        scoped = route is not None or message_type is not None
+        me = threading.get_ident()
+        counts: Counter = Counter()
+        samples = 0
+        names = {}
+        deadline = time.perf_counter() + seconds
+        next_names = 0.0
+
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now >= next_names:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                next_names = now + 1.0
+
+            task = asyncio.current_task(loop)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                root = names.get(thread_id, f"thread-{thread_id}")
+                if thread_id == loop_thread and task is not None:
+                    if scoped and not self._in_scope(task, route, message_type):
+                        continue
+                    coro = task.get_coro()
+                    root += ";task:" + getattr(coro, "__qualname__", task.get_name())
+                elif scoped:
+                    continue
+                elif not include_idle and (
+                    os.path.basename(frame.f_code.co_filename), frame.f_code.co_name
+                ) in _IDLE_FRAMES:
+                    continue
+                counts[root + ";" + self._collapse(frame)] += 1
+            frame = None
+            samples += 1
+            time.sleep(interval)
+
+        collapsed = "\n".join(
+            f"{stack} {count}" for stack, count in sorted(counts.items(), key=lambda kv: -kv[1])
+        )
+        return {"samples": samples, "collapsed": collapsed + "\n" if collapsed else ""}
+
+    @staticmethod
+    def _in_scope(task: asyncio.Task, route: Optional[str], message_type: Optional[str]) -> bool:
+        scope = task_scopes.get(task) or {}
+        if route is not None and scope.get("route") != route:
+            return False
+        if message_type is not None and scope.get("message_type") != message_type:
+            return False
+        return True
+
+    def _collapse(self, frame) -> str:
+        """Outermost-first 'name (file:line)' frames joined with ';'."""
+        parts = []
+        while frame is not None and len(parts) < _MAX_DEPTH:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{code.co_name} ({_short_path(code.co_filename)}:"
+            parts.append(f"{label}{frame.f_lineno})")
+            frame = frame.f_back
+        parts.reverse()
+        return ";".join(parts)
+
+
+profiler = SamplingProfiler()
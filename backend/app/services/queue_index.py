@@ -0,0 +1,141 @@
+"""
+Incremental introspection index for the in-memory match queues.
+
+Tracks every queued entry per (gender, looking_for) bucket in join order so
+monitoring can read per-bucket counts, the oldest waiter's age and
+cursor-paginated listings without copying or scanning whole queues.
+
+Each bucket is an append-only list ordered by join sequence. Removals are
+lazy (the item is marked dead); the bucket's head skips dead items when the
+oldest waiter is read, and a bucket is compacted once dead items outnumber
+live ones. Counts are kept as running totals.
+"""
+import bisect
+import itertools
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+Bucket = Tuple[str, str]
+
+# Item layout: [seq, joined_at, entry]; entry is None once removed
+_SEQ, _JOINED, _ENTRY = 0, 1, 2
+
+
+def bucket_name(bucket: Bucket) -> str:
+    return f"{bucket[0]}:{bucket[1]}"
+
+
+def parse_bucket(name: str) -> Optional[Bucket]:
+    """'male:any' -> ('male', 'any'); None if malformed."""
+    gender, sep, looking_for = name.partition(":")
+    return (gender, looking_for) if sep and gender and looking_for else None
+
+
+def describe_entry(entry: dict, waited_seconds: float) -> Dict[str, Any]:
+    """Public view of a queue entry (device IDs are truncated)."""
+    return {
+        "device_id": entry["device_id"][:12] + "...",
+        "gender": entry["gender"],
+        "looking_for": entry["looking_for"],
+        "waited_seconds": round(max(0.0, waited_seconds), 1),
+    }
+
+
+class QueueIndex:
+    """Per-bucket join-ordered view of queued entries."""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._buckets: Dict[Bucket, List[list]] = {}
+        self._heads: Dict[Bucket, int] = {}
+        self._counts: Dict[Bucket, int] = {}
+        # device_id -> (bucket, live item)
+        self._items: Dict[str, Tuple[Bucket, list]] = {}
+        self._seq = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, entry: dict, waited: float = 0.0):
+        """
+        Index a queued entry (replacing any previous one for the device).
+        `waited` backdates it, for entries restored from a snapshot.
+        """
+        device_id = entry["device_id"]
+        self.remove(device_id)
+        bucket = (entry["gender"], entry["looking_for"])
+        item = [next(self._seq), self._clock() - waited, entry]
+        self._buckets.setdefault(bucket, []).append(item)
+        self._heads.setdefault(bucket, 0)
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self._items[device_id] = (bucket, item)
+
+    def remove(self, device_id: str) -> bool:
+        found = self._items.pop(device_id, None)
+        if found is None:
+            return False
+        bucket, item = found
+        item[_ENTRY] = None
+        self._counts[bucket] -= 1
+        items = self._buckets[bucket]
+        if len(items) - self._counts[bucket] > len(items) // 2:
+            items[:] = [i for i in items if i[_ENTRY] is not None]
+            self._heads[bucket] = 0
+        return True
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Count and oldest wait per non-empty bucket."""
+        now = self._clock()
+        result = {}
+        for bucket, count in self._counts.items():
+            if not count:
+                continue
+            oldest = self._oldest(bucket)
+            result[bucket_name(bucket)] = {
+                "count": count,
+                "oldest_wait_seconds": round(max(0.0, now - oldest[_JOINED]), 1),
+            }
+        return result
+
+    def page(self, bucket: Bucket, cursor: Optional[str], limit: int) -> Dict[str, Any]:
+        """
+        Up to `limit` entries of a bucket, oldest first, after `cursor`
+        (the next_cursor of the previous page).
+        """
+        items = self._buckets.get(bucket, [])
+        after = int(cursor) if cursor and cursor.isdigit() else 0
+        start = max(self._heads.get(bucket, 0), bisect.bisect_right(items, after, key=lambda i: i[_SEQ]))
+        now = self._clock()
+        entries, last_seq, next_cursor = [], None, None
+        for index in range(start, len(items)):
+            item = items[index]
+            if item[_ENTRY] is None:
+                continue
+            if len(entries) == limit:
+                next_cursor = str(last_seq)
+                break
+            entries.append(describe_entry(item[_ENTRY], now - item[_JOINED]))
+            last_seq = item[_SEQ]
+        return {"entries": entries, "next_cursor": next_cursor}
+
+    def entries(self) -> Iterator[dict]:
+        """Every queued entry, bucket by bucket in join order."""
+        for items in self._buckets.values():
+            for item in items:
+                if item[_ENTRY] is not None:
+                    yield item[_ENTRY]
+
+    def clear(self):
+        self._buckets.clear()
+        self._heads.clear()
+        self._counts.clear()
+        self._items.clear()
+
+    def _oldest(self, bucket: Bucket) -> list:
+        """Oldest live item of a non-empty bucket, advancing past dead ones."""
+        items = self._buckets[bucket]
+        head = self._heads[bucket]
+        while items[head][_ENTRY] is None:
+            head += 1
+        self._heads[bucket] = head
+        return items[head]
@@ -0,0 +1,108 @@
+"""
+Per-connection inbound rate limiting for the chat websocket.
+
+Every frame first passes a size check and a connection-wide token bucket,
+before any JSON parsing, so floods are shed for the cost of a len() and a
+few float operations. Parsed frames then pass a bucket for their type.
+Connections that keep hitting the limits are disconnected.
+"""
+import time
+from typing import Dict, Optional
+
+from app.config import (
+    RATE_LIMIT_MAX_FRAME_CHARS,
+    RATE_LIMIT_FRAMES_PER_SECOND,
+    RATE_LIMIT_FRAME_BURST,
+    RATE_LIMIT_MESSAGES_PER_SECOND,
+    RATE_LIMIT_MESSAGE_BURST,
+    RATE_LIMIT_JOINS_PER_MINUTE,
+    RATE_LIMIT_JOIN_BURST,
+    RATE_LIMIT_RPCS_PER_SECOND,
+    RATE_LIMIT_RPC_BURST,
+    RATE_LIMIT_STRIKES,
+    RATE_LIMIT_STRIKE_WINDOW_SECONDS,
+)
+from app.services.metrics import ws_frames_dropped_total
+
+# Client frame type -> bucket name
+FRAME_KINDS = {
+    "send_message": "message",
+    "join_queue": "join",
+    "next_match": "next",
+    "rpc": "rpc",
+}
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens/second, holding at most `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        tokens = self.tokens + (now - self.updated_at) * self.rate
+        self.updated_at = now
+        if tokens >= 1.0:
+            self.tokens = min(tokens, self.burst) - 1.0
+            return True
+        self.tokens = tokens
+        return False
+
+
+class ConnectionRateLimiter:
+    """Inbound frame limits and strike tracking for one websocket."""
+
+    def __init__(self):
+        self.frames = TokenBucket(RATE_LIMIT_FRAMES_PER_SECOND, RATE_LIMIT_FRAME_BURST)
+        self.buckets: Dict[str, TokenBucket] = {
+            "message": TokenBucket(RATE_LIMIT_MESSAGES_PER_SECOND, RATE_LIMIT_MESSAGE_BURST),
+            "join": TokenBucket(RATE_LIMIT_JOINS_PER_MINUTE / 60, RATE_LIMIT_JOIN_BURST),
+            "next": TokenBucket(RATE_LIMIT_JOINS_PER_MINUTE / 60, RATE_LIMIT_JOIN_BURST),
+            "rpc": TokenBucket(RATE_LIMIT_RPCS_PER_SECOND, RATE_LIMIT_RPC_BURST),
+        }
+        self.strikes = 0
+        self.strike_window_start = 0.0
+        self.notified = False
+
+    def allow_frame(self, size: int) -> bool:
+        """Cheap pre-parse check on the raw frame."""
+        if size > RATE_LIMIT_MAX_FRAME_CHARS:
+            return self._drop("oversize")
+        if not self.frames.allow():
+            return self._drop("frame")
+        return True
+
+    def allow_type(self, msg_type) -> bool:
+        """Per-type check once the frame type is known."""
+        kind = FRAME_KINDS.get(msg_type)
+        if kind is None or self.buckets[kind].allow():
+            return True
+        return self._drop(kind)
+
+    def _drop(self, kind: str) -> bool:
+        ws_frames_dropped_total.labels(kind).inc()
+        now = time.monotonic()
+        if now - self.strike_window_start > RATE_LIMIT_STRIKE_WINDOW_SECONDS:
+            self.strike_window_start = now
+            self.strikes = 0
+            self.notified = False
+        self.strikes += 1
+        return False
+
+    @property
+    def should_disconnect(self) -> bool:
+        """Too many dropped frames within the strike window."""
+        return self.strikes > RATE_LIMIT_STRIKES
+
+    def take_notification(self) -> bool:
+        """True once per strike window, so the client is told to slow down only once."""
+        if self.notified:
+            return False
+        self.notified = True
+        return True
@@ -0,0 +1,169 @@
+"""
+Report rollups - per-device, per-day report counters.
+
+Moderation questions ("how many reports did X receive this week, by
+status?") are answered from report_daily_rollups in O(days) instead of
+scanning the reports table. Counters are bumped in the same transaction as
+the report change (submit_report / verify_report), with a native upsert so
+concurrent writers never race on the (device_id, day) row.
+
+rebuild_rollups() recomputes them from the reports table, to backfill
+existing data or repair drift:
+    python -m app.services.report_rollup --rebuild
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.models import Report, ReportDailyRollup, ReportStatus
+
+COUNTERS = ("received", "filed", "verified", "rejected", "filed_rejected")
+
+
+def _insert_for(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+def bump(db: Session, device_id: str, day: date, **deltas: int):
+    """Add deltas to a device's counters for a day (no commit)."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    insert = _insert_for(db.get_bind().dialect.name)
+    if insert is not None:
+        table = ReportDailyRollup.__table__
+        stmt = insert(table).values(
+            device_id=device_id, day=day, **{name: deltas.get(name, 0) for name in COUNTERS}
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["device_id", "day"],
+            set_={name: table.c[name] + delta for name, delta in deltas.items()},
+        )
+        db.execute(stmt)
+        return
+
+    # Other databases: read-modify-write inside the caller's transaction
+    row = db.query(ReportDailyRollup).filter(
+        ReportDailyRollup.device_id == device_id, ReportDailyRollup.day == day
+    ).with_for_update().first()
+    if row is None:
+        row = ReportDailyRollup(device_id=device_id, day=day, **{name: 0 for name in COUNTERS})
+        db.add(row)
+    for name, delta in deltas.items():
+        setattr(row, name, getattr(row, name) + delta)
+
+
+def record_filed(db: Session, report: Report, day: date):
+    """A new report: counts for both the reporter and the reported device."""
+    bump(db, report.reported_device_id, day, received=1)
+    bump(db, report.reporter_device_id, day, filed=1)
+
+
+def record_resolved(db: Session, report: Report, previous: Optional[ReportStatus]):
+    """Move a report's outcome counters from `previous` to its current status."""
+    day = (report.created_at or datetime.utcnow()).date()
+    for status, sign in ((previous, -1), (report.status, 1)):
+        if status == ReportStatus.VERIFIED:
+            bump(db, report.reported_device_id, day, verified=sign)
+        elif status == ReportStatus.REJECTED:
+            bump(db, report.reported_device_id, day, rejected=sign)
+            bump(db, report.reporter_device_id, day, filed_rejected=sign)
+
+
+def get_rollup(db: Session, device_id: str, days: int = 7) -> Dict:
+    """
+    Counters for the last `days` UTC days (today included):
+    {"totals": {...}, "by_day": [{"day": "YYYY-MM-DD", ...}, ...]}.
+    Days without reports are omitted from by_day.
+    """
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = db.query(ReportDailyRollup).filter(
+        ReportDailyRollup.device_id == device_id,
+        ReportDailyRollup.day >= since,
+    ).order_by(ReportDailyRollup.day).all()
+
+    totals = {name: 0 for name in COUNTERS}
+    by_day: List[Dict] = []
+    for row in rows:
+        counts = {name: getattr(row, name) for name in COUNTERS}
+        for name, value in counts.items():
+            totals[name] += value
+        by_day.append({"day": row.day.isoformat(), **counts})
+    totals["pending"] = totals["received"] - totals["verified"] - totals["rejected"]
+    return {"device_id": device_id, "days": days, "totals": totals, "by_day": by_day}
+
+
+def rebuild_rollups(db: Session, since: Optional[date] = None) -> int:
+    """
+    Recompute rollups from the reports table (all days, or from `since`).
+    Returns the number of rows written.
+    """
+    day = func.date(Report.created_at)
+    verified = case((Report.status == ReportStatus.VERIFIED, 1), else_=0)
+    rejected = case((Report.status == ReportStatus.REJECTED, 1), else_=0)
+
+    received = db.query(
+        Report.reported_device_id, day, func.count(), func.sum(verified), func.sum(rejected)
+    ).group_by(Report.reported_device_id, day)
+    filed = db.query(
+        Report.reporter_device_id, day, func.count(), func.sum(rejected)
+    ).group_by(Report.reporter_device_id, day)
+    stale = db.query(ReportDailyRollup)
+    if since is not None:
+        received = received.filter(Report.created_at >= since)
+        filed = filed.filter(Report.created_at >= since)
+        stale = stale.filter(ReportDailyRollup.day >= since)
+
+    rows: Dict = {}
+
+    def row_for(device_id, day_value):
+        key = (device_id, _as_date(day_value))
+        if key not in rows:
+            rows[key] = {name: 0 for name in COUNTERS}
+        return rows[key]
+
+    for device_id, day_value, count, n_verified, n_rejected in received:
+        counts = row_for(device_id, day_value)
+        counts.update(received=count, verified=n_verified or 0, rejected=n_rejected or 0)
+    for device_id, day_value, count, n_rejected in filed:
+        counts = row_for(device_id, day_value)
+        counts.update(filed=count, filed_rejected=n_rejected or 0)
+
+    stale.delete(synchronize_session=False)
+    db.bulk_insert_mappings(ReportDailyRollup, [
+        {"device_id": device_id, "day": day_value, **counts}
+        for (device_id, day_value), counts in rows.items()
+    ])
+    db.commit()
+    return len(rows)
+
+
+def _as_date(value) -> date:
+    # func.date() comes back as a string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.database import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Rebuild report rollups from the reports table")
+    parser.add_argument("--rebuild", action="store_true", required=True)
+    parser.add_argument("--since", type=date.fromisoformat, help="only days from YYYY-MM-DD")
+    args = parser.parse_args()
+
+    init_db()
+    session = SessionLocal()
+    try:
+        print(f"rebuilt {rebuild_rollups(session, args.since)} rollup rows")
+    finally:
+        session.close()
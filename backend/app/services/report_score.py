@@ -0,0 +1,161 @@
+"""
+Real-time auto-moderation from report bursts.
+
+Karma only moves by fixed deltas per report, so a device drawing a burst of
+reports from different people keeps chatting until a moderator looks. Each
+device here gets an exponentially decaying report score (half-life
+REPORT_SCORE_HALF_LIFE_SECONDS), raised by one for every distinct reporter.
+Reporters are remembered in a small bounded set per device, so repeat
+reports from one reporter never count twice. When the score reaches
+REPORT_SCORE_SUSPEND_THRESHOLD with at least REPORT_SCORE_MIN_REPORTERS
+distinct reporters, the device is soft-suspended for
+REPORT_SCORE_SUSPEND_SECONDS: its socket is closed with code 4003 and new
+connections are refused until the suspension ends.
+
+Everything lives in process memory and costs no DB queries; a suspension is
+local to the worker that received the reports.
+"""
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.config import (
+    REPORT_SCORE_HALF_LIFE_SECONDS,
+    REPORT_SCORE_MAX_REPORTERS,
+    REPORT_SCORE_MIN_REPORTERS,
+    REPORT_SCORE_SUSPEND_SECONDS,
+    REPORT_SCORE_SUSPEND_THRESHOLD,
+)
+from app.services.metrics import report_suspensions_total
+
+logger = logging.getLogger(__name__)
+
+# Scores below this are forgotten along with their reporters
+_FORGET_BELOW = 0.05
+
+
+class _DeviceScore:
+    __slots__ = ("score", "updated_at", "reporters")
+
+    def __init__(self, now: float):
+        self.score = 0.0
+        self.updated_at = now
+        # reporter device_id -> last report time, oldest first
+        self.reporters: Dict[str, float] = {}
+
+
+class ReportScores:
+    """Decaying per-device report scores with distinct-reporter counting."""
+
+    def __init__(
+        self,
+        half_life: float = REPORT_SCORE_HALF_LIFE_SECONDS,
+        threshold: float = REPORT_SCORE_SUSPEND_THRESHOLD,
+        min_reporters: int = REPORT_SCORE_MIN_REPORTERS,
+        max_reporters: int = REPORT_SCORE_MAX_REPORTERS,
+        suspend_seconds: float = REPORT_SCORE_SUSPEND_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.decay = math.log(2) / half_life
+        self.threshold = threshold
+        self.min_reporters = min_reporters
+        self.max_reporters = max(max_reporters, min_reporters)
+        self.suspend_seconds = suspend_seconds
+        self._clock = clock
+        self._scores: Dict[str, _DeviceScore] = {}
+        # device_id -> suspended until (clock time)
+        self._suspended: Dict[str, float] = {}
+        self._prune_at = 1024
+        self._on_suspend: Optional[Callable[[str, float], Awaitable[None]]] = None
+
+    def bind(self, on_suspend: Callable[[str, float], Awaitable[None]]):
+        """Set the coroutine that disconnects a suspended device."""
+        self._on_suspend = on_suspend
+
+    def record(self, reported_id: str, reporter_id: str) -> bool:
+        """
+        Count a report. Returns True if it just suspended `reported_id`;
+        the caller then awaits suspend() on the event loop.
+        """
+        now = self._clock()
+        entry = self._scores.get(reported_id)
+        if entry is None:
+            entry = self._scores[reported_id] = _DeviceScore(now)
+            if len(self._scores) > self._prune_at:
+                self._prune(now)
+        self._decay(entry, now)
+
+        if reporter_id not in entry.reporters:
+            entry.score += 1.0
+            if len(entry.reporters) >= self.max_reporters:
+                del entry.reporters[next(iter(entry.reporters))]
+        else:
+            del entry.reporters[reporter_id]
+        entry.reporters[reporter_id] = now
+
+        if (
+            entry.score >= self.threshold
+            and len(entry.reporters) >= self.min_reporters
+            and not self.is_suspended(reported_id)
+        ):
+            self._suspended[reported_id] = now + self.suspend_seconds
+            report_suspensions_total.inc()
+            logger.info(
+                "Suspending device=%s score=%.2f reporters=%d",
+                reported_id[:8], entry.score, len(entry.reporters),
+            )
+            return True
+        return False
+
+    async def suspend(self, device_id: str):
+        """Disconnect a device that record() just suspended."""
+        remaining = self.suspended_for(device_id)
+        if remaining and self._on_suspend is not None:
+            await self._on_suspend(device_id, remaining)
+
+    def suspended_for(self, device_id: str) -> float:
+        """Seconds of suspension left for a device (0 if none)."""
+        until = self._suspended.get(device_id)
+        if until is None:
+            return 0.0
+        remaining = until - self._clock()
+        if remaining <= 0:
+            del self._suspended[device_id]
+            return 0.0
+        return remaining
+
+    def is_suspended(self, device_id: str) -> bool:
+        return self.suspended_for(device_id) > 0
+
+    def score(self, device_id: str) -> float:
+        """Current decayed score (for debugging and monitoring)."""
+        entry = self._scores.get(device_id)
+        if entry is None:
+            return 0.0
+        self._decay(entry, self._clock())
+        return entry.score
+
+    def clear(self):
+        self._scores.clear()
+        self._suspended.clear()
+
+    def _decay(self, entry: _DeviceScore, now: float):
+        entry.score *= math.exp(-self.decay * (now - entry.updated_at))
+        entry.updated_at = now
+        if entry.score < _FORGET_BELOW:
+            entry.score = 0.0
+            entry.reporters.clear()
+
+    def _prune(self, now: float):
+        """Drop decayed scores and ended suspensions."""
+        for device_id in list(self._scores):
+            entry = self._scores[device_id]
+            self._decay(entry, now)
+            if not entry.reporters:
+                del self._scores[device_id]
+        self._suspended = {d: u for d, u in self._suspended.items() if u > now}
+        self._prune_at = 2 * len(self._scores) + 1024
+
+
+report_scores = ReportScores()
@@ -0,0 +1,118 @@
+"""
+Resumable chat sessions.
+
+Every frame sent to a device carries a per-session "seq" and the last few
+are kept in a bounded buffer. When a socket drops mid-chat the session is
+held for a short grace window instead of ending the chat; a reconnect that
+presents the session's resume token reattaches to the same partner and is
+replayed every buffered frame after the last seq it saw.
+"""
+import asyncio
+import secrets
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.config import RESUME_GRACE_SECONDS, RESUME_BUFFER_FRAMES
+from app.services.metrics import ws_resumes_total
+
+
+class _Session:
+    __slots__ = ("token", "seq", "frames", "expiry")
+
+    def __init__(self, token: str, buffer_size: int):
+        self.token = token
+        self.seq = 0
+        self.frames: Deque[dict] = deque(maxlen=buffer_size)
+        self.expiry: Optional[asyncio.Task] = None
+
+
+class ResumeStore:
+    """Resume tokens, replay buffers and grace timers, keyed by device."""
+
+    def __init__(
+        self,
+        grace_seconds: float = RESUME_GRACE_SECONDS,
+        buffer_size: int = RESUME_BUFFER_FRAMES,
+    ):
+        self.grace_seconds = grace_seconds
+        self.buffer_size = buffer_size
+        self._sessions: Dict[str, _Session] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.grace_seconds > 0
+
+    def open(self, device_id: str) -> str:
+        """Start a new session for a fresh connection. Returns its resume token."""
+        self.close(device_id)
+        token = secrets.token_urlsafe(16)
+        self._sessions[device_id] = _Session(token, self.buffer_size)
+        return token
+
+    def stamp(self, device_id: str, message: dict):
+        """Number an outgoing frame and keep it for replay."""
+        session = self._sessions.get(device_id)
+        if session is not None:
+            session.seq += 1
+            message["seq"] = session.seq
+            session.frames.append(message)
+
+    def last_seq(self, device_id: str) -> int:
+        session = self._sessions.get(device_id)
+        return session.seq if session else 0
+
+    def hold(self, device_id: str, expire: Callable[[], Awaitable[None]]) -> bool:
+        """Keep a dropped session for the grace window, then run `expire`."""
+        session = self._sessions.get(device_id)
+        if not self.enabled or session is None:
+            return False
+        if session.expiry is not None:
+            session.expiry.cancel()
+        session.expiry = asyncio.ensure_future(self._expire_later(device_id, session, expire))
+        return True
+
+    def is_held(self, device_id: str) -> bool:
+        session = self._sessions.get(device_id)
+        return session is not None and session.expiry is not None
+
+    def take(self, device_id: str, token: str, last_seq: int) -> Optional[List[dict]]:
+        """
+        Validate a resume attempt. Returns the frames to replay, or None if
+        the token is wrong or the session already expired.
+        """
+        session = self._sessions.get(device_id)
+        if session is None or not secrets.compare_digest(session.token.encode(), token.encode()):
+            ws_resumes_total.labels("rejected").inc()
+            return None
+        if session.expiry is not None:
+            session.expiry.cancel()
+            session.expiry = None
+        # A session restored from a snapshot may be behind what the client saw
+        session.seq = max(session.seq, last_seq)
+        ws_resumes_total.labels("resumed").inc()
+        return [frame for frame in session.frames if frame["seq"] > last_seq]
+
+    def export(self) -> List[list]:
+        """[device_id, token, seq] per session, for snapshots (buffers are not kept)."""
+        return [[device_id, s.token, s.seq] for device_id, s in self._sessions.items()]
+
+    def restore(self, device_id: str, token: str, seq: int):
+        """Recreate a session from a snapshot row; hold() it until the device returns."""
+        self.close(device_id)
+        session = _Session(token, self.buffer_size)
+        session.seq = seq
+        self._sessions[device_id] = session
+
+    def close(self, device_id: str):
+        """Forget a session (chat over, or replaced by a fresh connection)."""
+        session = self._sessions.pop(device_id, None)
+        if session is not None and session.expiry is not None:
+            session.expiry.cancel()
+
+    async def _expire_later(self, device_id: str, session: _Session, expire: Callable[[], Awaitable[None]]):
+        await asyncio.sleep(self.grace_seconds)
+        if self._sessions.get(device_id) is not session:
+            return
+        session.expiry = None
+        ws_resumes_total.labels("expired").inc()
+        await expire()
@@ -0,0 +1,308 @@
+"""
+Sharded matchmaking for multi-worker deployments.
+
+With several uvicorn workers, in-process queues are per worker and users on
+different workers never meet. In sharded mode the queue space is split by
+preference bucket ({my gender, gender I want}) and each bucket is owned by
+one match shard process (match_shard.py). Workers forward joins to the
+owning shard over a unix socket; the shard that made a match also relays
+chat frames between the two workers involved.
+
+A join first probes the other shards holding compatible buckets (without
+queueing), then queues on its home shard. Two compatible users joining at
+the same instant on different shards can miss each other; they are paired
+with the next compatible arrival instead.
+"""
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import MATCH_SHARD_TIMEOUT_SECONDS
+from app.services.matching import GENDERS, PREFERENCES, MatchingService, compatible, normalize_gender
+
+logger = logging.getLogger(__name__)
+
+
+def bucket_key(gender: str, looking_for: str) -> str:
+    """Preference bucket; mutual specific seekers (male->female, female->male) share one."""
+    return "|".join(sorted((gender, looking_for)))
+
+
+class ShardClient:
+    """One persistent connection from this worker to a match shard."""
+
+    def __init__(
+        self,
+        path: str,
+        on_event: Callable[[dict], Awaitable[None]],
+        timeout: float = MATCH_SHARD_TIMEOUT_SECONDS,
+    ):
+        self.path = path
+        self.on_event = on_event
+        self.timeout = timeout
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        # device_id -> its latest event task (see _dispatch)
+        self._events: Dict[Optional[str], asyncio.Task] = {}
+
+    async def _connection(self) -> asyncio.StreamWriter:
+        if self._writer is not None and not self._writer.is_closing():
+            return self._writer
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is None or self._writer.is_closing():
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+                self._reader_task = asyncio.ensure_future(self._read_loop(reader))
+                logger.info("Connected to match shard %s", self.path)
+        return self._writer
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                msg = json.loads(line)
+                future = self._pending.pop(msg["id"], None) if "id" in msg else None
+                if future is not None:
+                    if not future.done():
+                        future.set_result(msg)
+                else:
+                    self._dispatch(msg)
+        except ConnectionError:
+            pass
+        finally:
+            logger.warning("Lost connection to match shard %s", self.path)
+            self._writer = None
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"match shard {self.path} went away"))
+
+    def _dispatch(self, msg: dict):
+        """
+        Handle an event without holding up the reader: a slow websocket must
+        not stall events for everyone else on this worker. Events for the
+        same device still run one after another, in arrival order.
+        """
+        device_id = msg.get("device_id")
+        previous = self._events.get(device_id)
+        task = asyncio.ensure_future(self._handle_event(msg, previous))
+        self._events[device_id] = task
+        task.add_done_callback(functools.partial(self._event_done, device_id))
+
+    async def _handle_event(self, msg: dict, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait((previous,))
+        try:
+            await self.on_event(msg)
+        except Exception:
+            logger.error("Error handling shard event %s", msg.get("event"), exc_info=True)
+
+    def _event_done(self, device_id: Optional[str], task: asyncio.Task):
+        if self._events.get(device_id) is task:
+            del self._events[device_id]
+
+    async def request(self, msg: dict) -> dict:
+        """
+        Send a request and wait for the shard's reply. Raises ConnectionError
+        if the shard goes away or doesn't answer within the timeout.
+        """
+        writer = await self._connection()
+        msg["id"] = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[msg["id"]] = future
+        writer.write(json.dumps(msg).encode() + b"\n")
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError(
+                f"match shard {self.path} did not answer {msg.get('op')} within {self.timeout}s"
+            ) from None
+        finally:
+            self._pending.pop(msg["id"], None)
+
+    async def notify(self, msg: dict):
+        """Send a request that has no reply."""
+        writer = await self._connection()
+        writer.write(json.dumps(msg).encode() + b"\n")
+
+
+class ShardedMatchingService(MatchingService):
+    """
+    MatchingService that forwards to match shards instead of local queues.
+
+    Matches made on behalf of another worker's searcher arrive as events;
+    `bind()` connects them to the websocket layer.
+    """
+
+    def __init__(self, shard_paths: List[str]):
+        super().__init__()
+        self.use_memory = False
+        # Shards apply MATCH_PRIORITY to their own queues
+        self.priority = False
+        self.shards = [
+            ShardClient(path, functools.partial(self._on_event, index))
+            for index, path in enumerate(shard_paths)
+        ]
+        # local device_id -> home shard index while queued
+        self._home: Dict[str, int] = {}
+        # device_id -> karma from add_to_queue, sent with the following join
+        self._karma: Dict[str, Optional[int]] = {}
+        # device_id -> (partner_device_id, index of the shard that made the match),
+        # for local devices and their (possibly remote) partners
+        self._matches: Dict[str, Tuple[str, int]] = {}
+        self._on_match: Optional[Callable[[str, str], None]] = None
+        self._on_end: Optional[Callable[[str, str], None]] = None
+        self._deliver: Optional[Callable[[str, dict], Awaitable[None]]] = None
+
+    def bind(
+        self,
+        on_match: Callable[[str, str], None],
+        on_end: Callable[[str, str], None],
+        deliver: Callable[[str, dict], Awaitable[None]],
+    ):
+        """Hook up pairing, unpairing and frame delivery for local sockets."""
+        self._on_match = on_match
+        self._on_end = on_end
+        self._deliver = deliver
+
+    def shard_for(self, gender: str, looking_for: str) -> int:
+        return zlib.crc32(bucket_key(gender, looking_for).encode()) % len(self.shards)
+
+    def probe_order(self, gender: str, looking_for: str) -> List[int]:
+        """Shards holding buckets compatible with this searcher, home shard last."""
+        home = self.shard_for(gender, looking_for)
+        others = {
+            self.shard_for(g, lf)
+            for g in GENDERS for lf in PREFERENCES
+            if compatible(gender, looking_for, g, lf)
+        }
+        others.discard(home)
+        return sorted(others) + [home]
+
+    async def add_to_queue(
+        self, device_id: str, gender: str, looking_for: str, karma: Optional[int] = None
+    ) -> bool:
+        """
+        Only remembers karma: the entry is created on the owning shard by
+        find_match, so a searcher is never queued on one shard while probing another.
+        """
+        self._karma[device_id] = karma
+        return True
+
+    async def remove_from_queue(self, device_id: str, gender: str) -> bool:
+        self._karma.pop(device_id, None)
+        home = self._home.pop(device_id, None)
+        if home is None:
+            return False
+        await self.shards[home].notify({
+            "op": "leave", "device_id": device_id, "gender": gender,
+        })
+        return True
+
+    async def _find_match(
+        self,
+        device_id: str,
+        my_gender: str,
+        looking_for: str
+    ) -> Optional[Dict[str, Any]]:
+        gender = normalize_gender(my_gender)
+        looking_for = looking_for.lower()
+        order = self.probe_order(gender, looking_for)
+        karma = self._karma.pop(device_id, None)
+
+        for position, index in enumerate(order):
+            home = position == len(order) - 1
+            if home:
+                self._home[device_id] = index
+            reply = await self.shards[index].request({
+                "op": "join",
+                "device_id": device_id,
+                "gender": gender,
+                "looking_for": looking_for,
+                "karma": karma,
+                "enqueue": home,
+            })
+            candidate = reply["match"]
+            if candidate:
+                self._home.pop(device_id, None)
+                self._record(device_id, candidate["device_id"], index)
+                return candidate
+        return None
+
+    async def get_current_match(self, device_id: str) -> Optional[str]:
+        entry = self._matches.get(device_id)
+        return entry[0] if entry else None
+
+    async def end_match(self, device_id: str) -> bool:
+        entry = self._matches.pop(device_id, None)
+        if entry:
+            partner_id, index = entry
+            self._matches.pop(partner_id, None)
+            await self.shards[index].notify({"op": "end", "device_id": device_id})
+        return True
+
+    async def forward(self, device_id: str, message: dict) -> bool:
+        """Deliver a frame to a matched device connected to another worker."""
+        entry = self._matches.get(device_id)
+        if not entry:
+            return False
+        try:
+            await self.shards[entry[1]].notify({"op": "send", "device_id": device_id, "frame": message})
+        except OSError:
+            return False
+        return True
+
+    def get_queue_stats(self) -> Dict[str, int]:
+        return {"shards": len(self.shards), "queued_here": len(self._home)}
+
+    async def queue_summary(self) -> Dict[str, Dict[str, Any]]:
+        """Union of every shard's bucket summaries (each bucket lives on one shard)."""
+        replies = await asyncio.gather(*(shard.request({"op": "summary"}) for shard in self.shards))
+        merged: Dict[str, Dict[str, Any]] = {}
+        for reply in replies:
+            merged.update(reply["summary"])
+        return merged
+
+    async def queue_page(self, bucket: Tuple[str, str], cursor: Optional[str], limit: int) -> Dict[str, Any]:
+        """A bucket lives on exactly one shard; ask it."""
+        reply = await self.shards[self.shard_for(*bucket)].request({
+            "op": "page", "bucket": list(bucket), "cursor": cursor, "limit": limit,
+        })
+        return reply["page"]
+
+    def _record(self, device_id: str, partner_id: str, index: int):
+        self._matches[device_id] = (partner_id, index)
+        self._matches[partner_id] = (device_id, index)
+
+    async def _on_event(self, index: int, msg: dict):
+        event = msg["event"]
+        device_id = msg["device_id"]
+        if event == "deliver":
+            if self._deliver:
+                await self._deliver(device_id, msg["frame"])
+        elif event == "matched":
+            # Someone on another worker (or this one) was paired with our queued device
+            partner_id = msg["partner"]
+            self._home.pop(device_id, None)
+            self._record(device_id, partner_id, index)
+            if self._on_match:
+                self._on_match(device_id, partner_id)
+        elif event == "ended":
+            partner_id = msg["partner"]
+            # Ignore if either side has already moved on to a new match
+            if self._matches.get(device_id, (None,))[0] == partner_id:
+                self._matches.pop(device_id)
+            if self._matches.get(partner_id, (None,))[0] == device_id:
+                self._matches.pop(partner_id)
+            if self._on_end:
+                self._on_end(device_id, partner_id)
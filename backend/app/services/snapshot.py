@@ -0,0 +1,114 @@
+"""
+Checkpoints of live matchmaking state for fast restarts.
+
+The in-memory backend loses every queue spot, chat pairing and resume
+session when the process restarts, and all clients then re-queue at once.
+With SNAPSHOT_PATH set the state is written every SNAPSHOT_INTERVAL_SECONDS
+and once more at shutdown, as one compact JSON document of positional rows:
+
+    {"version": 1, "saved_at": <epoch>,
+     "queue": [[device_id, gender, looking_for, joined_at, karma], ...],
+     "pairs": [[device_id, partner_id], ...],
+     "sessions": [[device_id, resume_token, seq], ...]}
+
+Files are replaced atomically (write to a temp file, then rename), so a crash
+mid-write leaves the previous checkpoint intact. On startup the restored
+sessions are held for the resume grace window like dropped sockets: clients
+reconnect with their resume token and keep their queue spot or chat, and
+devices that never come back are expired.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.config import SNAPSHOT_INTERVAL_SECONDS, SNAPSHOT_MAX_AGE_SECONDS, SNAPSHOT_PATH
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+class StateSnapshots:
+    """Periodic, atomic checkpoints of a state dict to a local file."""
+
+    def __init__(
+        self,
+        path: str = SNAPSHOT_PATH,
+        interval: float = SNAPSHOT_INTERVAL_SECONDS,
+        max_age: float = SNAPSHOT_MAX_AGE_SECONDS,
+    ):
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Read the last checkpoint; None if missing, unreadable or too old."""
+        if not self.enabled:
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                state = json.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable snapshot %s", self.path, exc_info=True)
+            return None
+        if state.get("version") != SNAPSHOT_VERSION:
+            logger.warning("Ignoring snapshot with version %s", state.get("version"))
+            return None
+        age = time.time() - state.get("saved_at", 0)
+        if age > self.max_age:
+            logger.info("Ignoring snapshot saved %.0fs ago", age)
+            return None
+        return state
+
+    async def save(self, state: Dict[str, Any]):
+        """Write a checkpoint. Encoding and I/O run off the event loop."""
+        state = {"version": SNAPSHOT_VERSION, "saved_at": time.time(), **state}
+        await asyncio.to_thread(self._write, state)
+
+    def start(self, capture: Callable[[], Dict[str, Any]]):
+        """Checkpoint `capture()` every interval until stop()."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.ensure_future(self._run(capture))
+
+    async def stop(self, capture: Callable[[], Dict[str, Any]]):
+        """Stop the periodic task and write a final checkpoint."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.enabled:
+            await self.save(capture())
+
+    async def _run(self, capture: Callable[[], Dict[str, Any]]):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save(capture())
+            except Exception:
+                logger.warning("Snapshot failed", exc_info=True)
+
+    def _write(self, state: Dict[str, Any]):
+        data = json.dumps(state, separators=(",", ":")).encode()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,148 @@
+"""
+Cross-partner spam detection.
+
+Spammers paste the same message to every partner they reach through
+next_match. For each device the detector remembers a sketch of its last
+SPAM_HISTORY messages together with the partner they went to. A sketch is
+a bottom-k MinHash: the SKETCH_SIZE smallest hashes of the message's words
+and word pairs (after casefolding and dropping punctuation), so two
+sketches estimate the Jaccard similarity of their messages even when a few
+words were changed, added or re-punctuated. Shingling and hashing run in C
+(split/zip/set/sorted), so a sketch costs a few tens of microseconds at
+most.
+
+A message whose sketch is at least SPAM_SIMILARITY similar to messages
+sent to SPAM_MIN_PARTNERS different partners (counting the current one)
+within SPAM_WINDOW_SECONDS is spam. It is not relayed; the first one of a
+burst also costs the device KARMA_SPAM (services/karma.py).
+
+Cost per message is bounded: the text is cut at MAX_SHINGLED_CHARS, and it
+is compared with at most SPAM_HISTORY sketches of SKETCH_SIZE hashes each.
+Devices are kept in an LRU of SPAM_TRACKED_DEVICES entries; everything is in
+process memory.
+"""
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Optional, Tuple
+
+from app.config import (
+    SPAM_DETECTION_ENABLED,
+    SPAM_HISTORY,
+    SPAM_MIN_LENGTH,
+    SPAM_MIN_PARTNERS,
+    SPAM_SIMILARITY,
+    SPAM_TRACKED_DEVICES,
+    SPAM_WINDOW_SECONDS,
+)
+from app.services.metrics import messages_blocked_total, spam_flags_total
+
+SKETCH_SIZE = 16
+MAX_SHINGLED_CHARS = 512
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+Sketch = Tuple[int, ...]
+
+
+def sketch(content: str) -> Optional[Sketch]:
+    """Bottom-k MinHash of the message, or None if it is too short to judge."""
+    text = _NON_WORD.sub(" ", content[:MAX_SHINGLED_CHARS].casefold()).strip()
+    if len(text) < SPAM_MIN_LENGTH:
+        return None
+    words = text.split()
+    shingles = set(words)
+    shingles.update(zip(words, words[1:]))
+    return tuple(sorted(map(hash, shingles))[:SKETCH_SIZE])
+
+
+def similarity(a: Sketch, b: Sketch) -> float:
+    """Estimated Jaccard similarity of the messages behind two sketches."""
+    both = set(a).intersection(b)
+    if not both:
+        return 0.0
+    union = sorted(set(a).union(b))[:SKETCH_SIZE]
+    return sum(1 for h in union if h in both) / len(union)
+
+
+class _History:
+    __slots__ = ("sent", "flagged_until")
+
+    def __init__(self, size: int):
+        # (sketch, partner_id, sent_at), oldest first
+        self.sent: Deque[Tuple[Sketch, str, float]] = deque(maxlen=size)
+        self.flagged_until = 0.0
+
+
+class SpamDetector:
+    """Per-device sketches of recent messages in a bounded LRU."""
+
+    def __init__(
+        self,
+        similarity_threshold: float = SPAM_SIMILARITY,
+        min_partners: int = SPAM_MIN_PARTNERS,
+        window: float = SPAM_WINDOW_SECONDS,
+        history: int = SPAM_HISTORY,
+        max_devices: int = SPAM_TRACKED_DEVICES,
+        enabled: bool = SPAM_DETECTION_ENABLED,
+        clock=time.monotonic,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.min_partners = min_partners
+        self.window = window
+        self.history = history
+        self.max_devices = max_devices
+        self.enabled = enabled
+        self._clock = clock
+        self._devices: "OrderedDict[str, _History]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def record(self, device_id: str, partner_id: str, content: str) -> Optional[str]:
+        """
+        Remember a message the device is sending to `partner_id`.
+        Returns None if it may be relayed, "flagged" if it starts a spam burst
+        (the caller applies the karma penalty) or "repeat" if the device was
+        already flagged for this burst.
+        """
+        if not self.enabled:
+            return None
+        signature = sketch(content)
+        if signature is None:
+            return None
+        now = self._clock()
+
+        entry = self._devices.get(device_id)
+        if entry is None:
+            entry = self._devices[device_id] = _History(self.history)
+            if len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+        else:
+            self._devices.move_to_end(device_id)
+
+        partners = {partner_id}
+        since = now - self.window
+        for previous, previous_partner, sent_at in entry.sent:
+            if (
+                sent_at >= since
+                and previous_partner not in partners
+                and similarity(signature, previous) >= self.similarity_threshold
+            ):
+                partners.add(previous_partner)
+        entry.sent.append((signature, partner_id, now))
+
+        if len(partners) < self.min_partners:
+            return None
+        messages_blocked_total.labels("spam").inc()
+        if entry.flagged_until > now:
+            return "repeat"
+        entry.flagged_until = now + self.window
+        spam_flags_total.inc()
+        return "flagged"
+
+    def clear(self):
+        self._devices.clear()
+
+
+spam_detector = SpamDetector()
@@ -0,0 +1,183 @@
+"""
+Build and load the static frontend bundle served by routers/frontend.py.
+
+Build (from backend/):
+
+    python -m app.services.static_assets [--source ../frontend-static] [--out ../frontend-static/dist]
+
+The stylesheet and scripts are copied under content-hashed names
+(styles.3f2a9c1b0d.css), index.html is rewritten to reference them, and
+every file gets precompressed .gz and, if the brotli package is installed,
+.br variants. Hashed files never change under the same name, so they can be
+cached forever. index.html keeps its name and is revalidated on each load.
+It also gets window.API_BASE_URL set to its own origin, so the client talks
+to the server that served it.
+
+At runtime the whole bundle (all encodings) is loaded into memory once. A
+response is then a single write of prebuilt bytes: no disk reads,
+compression or thread hops per request. This stands in for sendfile, which
+uvicorn does not offer to ASGI apps.
+"""
+import argparse
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import sys
+from typing import Dict, NamedTuple, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_SOURCE = os.path.join(os.path.dirname(_BACKEND_DIR), "frontend-static")
+
+INDEX = "index.html"
+HASHED_EXTENSIONS = (".css", ".js")
+# Encodings by preference, with the file suffix of their variant
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+_HASHED_NAME = re.compile(r"\.[0-9a-f]{10}\.[a-z]+$")
+
+
+def _content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=5).hexdigest()
+
+
+def _write_variants(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+    compressed = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressed.append((".br", brotli.compress(data, quality=11)))
+    for suffix, body in compressed:
+        if len(body) < len(data):
+            with open(path + suffix, "wb") as f:
+                f.write(body)
+
+
+def build(source: str, out: str) -> Dict[str, str]:
+    """Write the hashed, precompressed bundle. Returns original -> hashed name."""
+    if os.path.isdir(out):
+        shutil.rmtree(out)
+    os.makedirs(out)
+
+    renamed = {}
+    for name in sorted(os.listdir(source)):
+        stem, ext = os.path.splitext(name)
+        if ext not in HASHED_EXTENSIONS:
+            continue
+        with open(os.path.join(source, name), "rb") as f:
+            data = f.read()
+        renamed[name] = f"{stem}.{_content_hash(data)}{ext}"
+        _write_variants(os.path.join(out, renamed[name]), data)
+
+    with open(os.path.join(source, INDEX), encoding="utf-8") as f:
+        html = f.read()
+    for name, hashed in renamed.items():
+        html = re.sub(
+            r'((?:src|href)=")' + re.escape(name) + '"', lambda m: m.group(1) + hashed + '"', html
+        )
+    html = html.replace(
+        "<script src=",
+        "<script>window.API_BASE_URL = location.origin;</script>\n    <script src=",
+        1,
+    )
+    _write_variants(os.path.join(out, INDEX), html.encode("utf-8"))
+
+    if brotli is None:
+        logger.warning("brotli is not installed; built gzip variants only")
+    return renamed
+
+
+class Asset(NamedTuple):
+    media_type: str
+    # Hash of the identity body; see etag()
+    digest: str
+    immutable: bool
+    # encoding ("identity", "gzip", "br") -> body
+    bodies: Dict[str, bytes]
+
+    def etag(self, encoding: str) -> str:
+        """Strong ETag of one representation: each encoding has its own bytes."""
+        if encoding == "identity":
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{encoding}"'
+
+
+def load(directory: str) -> Dict[str, Asset]:
+    """Read a built bundle into memory: file name -> Asset."""
+    if not os.path.isfile(os.path.join(directory, INDEX)):
+        raise RuntimeError(
+            f"No frontend build in {directory}; run python -m app.services.static_assets"
+        )
+    assets = {}
+    for name in os.listdir(directory):
+        if name.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+            continue
+        with open(os.path.join(directory, name), "rb") as f:
+            bodies = {"identity": f.read()}
+        for encoding, suffix in ENCODINGS:
+            variant = os.path.join(directory, name + suffix)
+            if os.path.isfile(variant):
+                with open(variant, "rb") as f:
+                    bodies[encoding] = f.read()
+        assets[name] = Asset(
+            # Starlette appends "; charset=utf-8" to text/* types
+            media_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+            digest=_content_hash(bodies["identity"]),
+            immutable=bool(_HASHED_NAME.search(name)),
+            bodies=bodies,
+        )
+    logger.info("Loaded %d frontend assets from %s", len(assets), directory)
+    return assets
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check: any listed tag equal to `etag`, compared weakly."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def pick_encoding(asset: Asset, accept_encoding: Optional[str]) -> str:
+    """Best precompressed variant the client accepts."""
+    if accept_encoding:
+        accepted = set()
+        for part in accept_encoding.split(","):
+            token, _, params = part.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                accepted.add(token.strip().lower())
+        for encoding, _ in ENCODINGS:
+            if encoding in asset.bodies and (encoding in accepted or "*" in accepted):
+                return encoding
+    return "identity"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the hashed, precompressed frontend bundle")
+    parser.add_argument("--source", default=DEFAULT_SOURCE)
+    parser.add_argument("--out", help="default: <source>/dist")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    out = args.out or os.path.join(args.source, "dist")
+    renamed = build(args.source, out)
+    for name, hashed in renamed.items():
+        print(f"{name} -> {hashed}")
+    print(f"bundle written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Non-blocking logging setup and sampled, level-gated tracing for hot paths.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from typing import Optional
+
+from app.config import LOG_LEVEL, MATCH_TRACE_SAMPLE_RATE
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging():
+    """
+    Route root logging through a QueueHandler.
+
+    Records are enqueued on the calling thread and written to stderr by a
+    background QueueListener, so log I/O never blocks the event loop.
+    Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s %(message)s"
+    ))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class TraceFields:
+    """Key/value payload rendered only when a handler formats the record."""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return " ".join(f"{key}={value}" for key, value in self.fields.items())
+
+
+class SampledTracer:
+    """
+    DEBUG-level structured events for a fraction of operations.
+
+    Call `start()` once per operation; it returns False (and costs one
+    level check) unless DEBUG is enabled and the operation is sampled.
+    Only then should `event()` be called.
+    """
+
+    def __init__(self, logger: logging.Logger, sample_rate: float = MATCH_TRACE_SAMPLE_RATE):
+        self.logger = logger
+        self.sample_rate = sample_rate
+
+    def start(self) -> bool:
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def event(self, name: str, **fields):
+        self.logger.debug("%s %s", name, TraceFields(fields), extra={"trace": fields})
@@ -0,0 +1,118 @@
+"""
+Bounded in-memory transcripts of active chats, kept only as report evidence.
+
+Each chat pair shares one preallocated ring of the last
+TRANSCRIPT_MAX_MESSAGES relayed messages, also capped at
+TRANSCRIPT_MAX_BYTES of UTF-8 text (oldest messages are evicted first).
+Recording a message is a couple of list writes; nothing touches the
+database on the message path. A copy of the ring goes into the database only
+when one of the two files a report, and the ring is dropped when the chat
+ends.
+"""
+from typing import Dict, List, Optional
+
+from app.config import TRANSCRIPT_MAX_BYTES, TRANSCRIPT_MAX_MESSAGES
+
+# Slot layout: (sender device_id, timestamp, content, size in bytes)
+_SENDER, _TIMESTAMP, _CONTENT, _SIZE = 0, 1, 2, 3
+
+
+class TranscriptRing:
+    """Fixed-capacity ring of (sender, timestamp, content) with a byte cap."""
+
+    __slots__ = ("_slots", "_start", "_count", "_bytes", "max_bytes")
+
+    def __init__(self, capacity: int = TRANSCRIPT_MAX_MESSAGES, max_bytes: int = TRANSCRIPT_MAX_BYTES):
+        self._slots: List[Optional[tuple]] = [None] * capacity
+        self._start = 0
+        self._count = 0
+        self._bytes = 0
+        self.max_bytes = max_bytes
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, sender: str, timestamp: str, content: str):
+        size = len(content.encode())
+        if size > self.max_bytes:
+            return
+        capacity = len(self._slots)
+        while self._count and (self._count == capacity or self._bytes + size > self.max_bytes):
+            self._evict_oldest()
+        end = (self._start + self._count) % capacity
+        self._slots[end] = (sender, timestamp, content, size)
+        self._count += 1
+        self._bytes += size
+
+    def snapshot(self) -> List[tuple]:
+        """Messages oldest first as (sender, timestamp, content)."""
+        capacity = len(self._slots)
+        return [
+            self._slots[(self._start + i) % capacity][:_SIZE]
+            for i in range(self._count)
+        ]
+
+    def _evict_oldest(self):
+        slot = self._slots[self._start]
+        self._slots[self._start] = None
+        self._bytes -= slot[_SIZE]
+        self._start = (self._start + 1) % len(self._slots)
+        self._count -= 1
+
+
+class ChatTranscripts:
+    """One ring per active chat, reachable from both participants."""
+
+    def __init__(self):
+        # device_id -> ring shared with its partner
+        self._rings: Dict[str, TranscriptRing] = {}
+
+    def __len__(self) -> int:
+        return len(self._rings) // 2
+
+    @property
+    def enabled(self) -> bool:
+        return TRANSCRIPT_MAX_MESSAGES > 0 and TRANSCRIPT_MAX_BYTES > 0
+
+    def open(self, device_id1: str, device_id2: str):
+        """Allocate the ring for a new chat."""
+        if self.enabled:
+            self._rings[device_id1] = self._rings[device_id2] = TranscriptRing()
+
+    def record(self, sender: str, partner_id: str, timestamp: str, content: str):
+        """Add a relayed message to the pair's ring (created on first use)."""
+        if not self.enabled:
+            return
+        ring = self._rings.get(sender)
+        if ring is None or self._rings.get(partner_id) is not ring:
+            ring = self._rings[sender] = self._rings[partner_id] = TranscriptRing()
+        ring.append(sender, timestamp, content)
+
+    def snapshot(self, reporter_id: str, reported_id: str) -> Optional[List[dict]]:
+        """
+        The chat between the two devices, with senders as "reporter" /
+        "reported"; None if they have no transcript together.
+        """
+        ring = self._rings.get(reporter_id)
+        if ring is None or self._rings.get(reported_id) is not ring:
+            return None
+        return [
+            {
+                "from": "reporter" if sender == reporter_id else "reported",
+                "timestamp": timestamp,
+                "content": content,
+            }
+            for sender, timestamp, content in ring.snapshot()
+        ]
+
+    def close(self, device_id: str, partner_id: Optional[str] = None):
+        """Free a chat's ring."""
+        ring = self._rings.pop(device_id, None)
+        if partner_id is not None and ring is not None and self._rings.get(partner_id) is ring:
+            del self._rings[partner_id]
+
+    def clear(self):
+        self._rings.clear()
+
+
+chat_transcripts = ChatTranscripts()
@@ -0,0 +1,147 @@
+"""
+Conditional GETs for per-user resources (/api/auth/me, /api/reports/karma).
+
+The frontend polls both endpoints, and each poll used to cost a DB session,
+a user lookup and an access check. Every device now has a version, moved to
+the next value of a global counter whenever a UserSession row is flushed or
+committed (karma, profile, verification, daily counters), and each response
+carries a weak ETag: a hash of its body.
+
+After answering a device from the database, the worker remembers the ETag
+it sent together with the device's version. A later request whose
+If-None-Match matches a remembered ETag is answered 304 from memory, as long
+as the version hasn't moved and the entry is younger than
+USER_ETAG_TTL_SECONDS. The TTL bounds staleness for changes made by another
+worker; after it expires the request is revalidated against the database
+(and still gets a 304 if nothing changed).
+"""
+import hashlib
+import itertools
+import json
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import USER_ETAG_TTL_SECONDS
+from app.models import UserSession
+
+
+def etag_for(body: BaseModel) -> str:
+    digest = hashlib.blake2b(
+        json.dumps(body.model_dump(), sort_keys=True, default=str).encode(), digest_size=8
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
+
+class UserVersions:
+    """Per-device change counters and the ETags validated against them."""
+
+    def __init__(self, ttl: float = USER_ETAG_TTL_SECONDS, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        # Bumped from threadpool handlers as well as the event loop
+        self._lock = threading.Lock()
+        # Versions come from one counter for all devices, so a device whose
+        # entry was pruned can never get an old version number back
+        self._counter = itertools.count(1)
+        # device_id -> (version, bumped_at)
+        self._versions: Dict[str, Tuple[int, float]] = {}
+        # (device_id, resource) -> (etag, version, validated_at)
+        self._validated: Dict[Tuple[str, str], Tuple[str, int, float]] = {}
+        self._prune_at = 4096
+
+    def version(self, device_id: str) -> int:
+        entry = self._versions.get(device_id)
+        return entry[0] if entry else 0
+
+    def bump(self, device_id: str):
+        now = self._clock()
+        with self._lock:
+            self._versions[device_id] = (next(self._counter), now)
+            # Devices that are bumped but never polled must not pile up
+            if len(self._versions) > self._prune_at:
+                self._prune(now)
+
+    def not_modified(self, request: Request, device_id: str, resource: str) -> Optional[Response]:
+        """A 304 answered from memory, or None if the DB must be consulted."""
+        if_none_match = request.headers.get("if-none-match")
+        entry = self._validated.get((device_id, resource))
+        if entry is None or not _matches(if_none_match, entry[0]):
+            return None
+        etag, version, validated_at = entry
+        if version != self.version(device_id) or self._clock() - validated_at > self.ttl:
+            return None
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    def respond(
+        self,
+        request: Request,
+        response: Response,
+        device_id: str,
+        resource: str,
+        version: int,
+        body: BaseModel,
+    ):
+        """
+        Finish a request answered from the database. `version` is the
+        device's version from before the DB reads, so a write racing with
+        them is never remembered as current.
+        """
+        etag = etag_for(body)
+        now = self._clock()
+        with self._lock:
+            if version == self.version(device_id):
+                self._validated[(device_id, resource)] = (etag, version, now)
+                if len(self._validated) > self._prune_at:
+                    self._prune(now)
+        if _matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+        return body
+
+    def _prune(self, now: float):
+        """Forget expired validations, and versions no request can race with."""
+        self._validated = {
+            key: entry for key, entry in self._validated.items() if now - entry[2] <= self.ttl
+        }
+        self._versions = {
+            device_id: entry for device_id, entry in self._versions.items()
+            if now - entry[1] <= self.ttl
+        }
+        self._prune_at = 2 * max(len(self._validated), len(self._versions)) + 4096
+
+
+user_versions = UserVersions()
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_flushed(session, flush_context):
+    changed = session.info.setdefault("changed_devices", set())
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, UserSession):
+            changed.add(obj.device_id)
+            user_versions.bump(obj.device_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed(session):
+    # Bump again once the change is visible, in case a read started in between
+    for device_id in session.info.pop("changed_devices", ()):
+        user_versions.bump(device_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("changed_devices", None)
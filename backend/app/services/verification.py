@@ -8,15 +8,22 @@ import tempfile
 from typing import Optional, Tuple
 import logging
 
+from app.services.metrics import verification_inference_seconds
+from app.services.verification_cache import perceptual_hash, verification_cache
+
 logger = logging.getLogger(__name__)
 
 
-def verify_gender_from_image(image_bytes: bytes) -> Tuple[Optional[str], Optional[str]]:
+def verify_gender_from_image(
+    image_bytes: bytes, device_id: Optional[str] = None
+) -> Tuple[Optional[str], Optional[str]]:
     """
     Analyze image to detect gender.
     
     Args:
         image_bytes: Raw image bytes from camera capture
+        device_id: The uploading device (near-duplicate cache hits are
+            only taken from its own earlier uploads)
         
     Returns:
         Tuple of (gender, error_message)
@@ -27,7 +34,15 @@ def verify_gender_from_image(image_bytes: bytes) -> Tuple[Optional[str], Optiona
     - Image is written to a temporary file that is auto-deleted
     - No image data is persisted to disk or database
     - Only the gender result string is returned
+    - Repeat submissions of a successfully verified image are answered
+      from a cache holding only the perceptual hash and the result
     """
+    image_hash = perceptual_hash(image_bytes)
+    if image_hash is not None:
+        cached = verification_cache.get(image_hash, device_id)
+        if cached is not None:
+            return cached
+    
     temp_path = None
     try:
         # Write to temp file (required by DeepFace)
@@ -39,12 +54,17 @@ def verify_gender_from_image(image_bytes: bytes) -> Tuple[Optional[str], Optiona
         from app.services.gender_model import gender_model
         
         # predict returns (gender, error_message)
-        gender, error = gender_model.predict(temp_path)
+        with verification_inference_seconds.time():
+            gender, error = gender_model.predict(temp_path)
         
-        if gender:
-            return gender, None
-        else:
+        if not gender:
+            # Not cached: a retry with a better frame must reach the model
             return None, error or "Could not determine gender."
+        
+        result = (gender, None)
+        if image_hash is not None:
+            verification_cache.put(image_hash, result, device_id)
+        return result
             
     except Exception as e:
         logger.error(f"Gender verification error: {str(e)}")
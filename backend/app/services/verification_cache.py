@@ -0,0 +1,145 @@
+"""
+Short-lived cache of verification results keyed by perceptual hash.
+PRIVACY: Only the 64-bit image hash and the result string are kept - never pixels.
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import logging
+
+from app.services.metrics import registry, Gauge
+from app.config import (
+    VERIFICATION_CACHE_SIZE,
+    VERIFICATION_CACHE_TTL_SECONDS,
+    VERIFICATION_CACHE_MAX_DISTANCE,
+)
+
+logger = logging.getLogger(__name__)
+
+# (gender, error_message) - same shape as verify_gender_from_image
+VerificationResult = Tuple[Optional[str], Optional[str]]
+
+
+def perceptual_hash(image_bytes: bytes) -> Optional[int]:
+    """
+    Compute a 64-bit difference hash (dHash) of an encoded image.
+
+    The image is decoded, reduced to 9x8 grayscale and each bit records
+    whether a pixel is brighter than its right neighbour. Re-encoded or
+    slightly shifted frames of the same scene land within a few bits.
+    Returns None if the image cannot be decoded.
+    """
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return None
+
+    try:
+        buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+        image = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return None
+        small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+        del image
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
+    except Exception as e:
+        logger.warning(f"Perceptual hash failed: {e}")
+        return None
+
+
+class VerificationCache:
+    """
+    Bounded LRU of hash -> result with TTL. An identical hash is reused for
+    anyone; a near-duplicate (a slightly different frame) only matches the
+    same device's earlier uploads, never another person's similar photo.
+    """
+
+    def __init__(
+        self,
+        max_size: int = VERIFICATION_CACHE_SIZE,
+        ttl_seconds: int = VERIFICATION_CACHE_TTL_SECONDS,
+        max_distance: int = VERIFICATION_CACHE_MAX_DISTANCE,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        # image_hash -> (expires_at, device_id, result)
+        self._entries: "OrderedDict[int, Tuple[float, Optional[str], VerificationResult]]" = OrderedDict()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _expire(self, now: float):
+        """Drop expired entries (oldest first, insertion order == expiry order)."""
+        while self._entries:
+            image_hash, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.pop(image_hash, None)
+
+    def get(self, image_hash: int, device_id: Optional[str] = None) -> Optional[VerificationResult]:
+        """Return cached result for this hash or a near-duplicate from the same device, if any."""
+        now = time.monotonic()
+        self._expire(now)
+
+        entry = self._entries.get(image_hash)
+        if entry:
+            self.hits += 1
+            return entry[2]
+
+        if self.max_distance > 0 and device_id is not None:
+            for cached_hash, (_, owner, result) in self._entries.items():
+                if owner == device_id and (cached_hash ^ image_hash).bit_count() <= self.max_distance:
+                    self.hits += 1
+                    self.near_hits += 1
+                    return result
+
+        self.misses += 1
+        return None
+
+    def put(self, image_hash: int, result: VerificationResult, device_id: Optional[str] = None):
+        """Store a result, evicting the oldest entry when full."""
+        if self.max_size <= 0:
+            return
+        self._entries.pop(image_hash, None)
+        self._entries[image_hash] = (time.monotonic() + self.ttl_seconds, device_id, result)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def get_stats(self) -> Dict[str, float]:
+        """Get cache size and hit-rate counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton instance
+verification_cache = VerificationCache()
+
+registry.register(Gauge(
+    "chat_verification_cache_hits", "Verification cache hits (exact and near-duplicate)",
+    callback=lambda: verification_cache.hits,
+))
+registry.register(Gauge(
+    "chat_verification_cache_misses", "Verification cache misses",
+    callback=lambda: verification_cache.misses,
+))
+registry.register(Gauge(
+    "chat_verification_cache_size", "Verification cache entries",
+    callback=lambda: len(verification_cache._entries),
+))
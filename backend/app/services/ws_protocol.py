@@ -0,0 +1,165 @@
+"""
+Chat websocket wire protocols.
+
+Clients negotiate via the Sec-WebSocket-Protocol header:
+- "chat.json.v1": JSON text frames (the default; also used when the client
+  offers no subprotocol)
+- "chat.msgpack.v1": MessagePack binary frames in a compact positional
+  schema: [type_code, seq, field1, field2, ...] with integer type codes and
+  epoch-millisecond timestamps. Client frames omit seq: [type_code, field1, ...]
+
+Handlers always see and produce the same dicts as the JSON protocol; only
+the encoding differs. The field tables must match WIRE_SCHEMA in
+frontend-static/api.js.
+"""
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from app.config import WS_BINARY_PROTOCOL
+
+JSON_PROTOCOL = "chat.json.v1"
+MSGPACK_PROTOCOL = "chat.msgpack.v1"
+
+# type -> (code, positional fields)
+SERVER_FRAMES: Dict[str, Tuple[int, Tuple[str, ...]]] = {
+    "connected": (1, ("karma", "nickname", "resume_token")),
+    "queued": (2, ("looking_for",)),
+    "match_found": (3, ("partner",)),
+    "message": (4, ("id", "content", "timestamp")),
+    "partner_typing": (5, ("is_typing",)),
+    "read_receipt": (6, ("message_id",)),
+    "partner_left": (7, ()),
+    "chat_ended": (8, ()),
+    "left_queue": (9, ()),
+    "error": (10, ("message",)),
+    "resumed": (11, ("in_chat",)),
+    "partner_reconnecting": (12, ()),
+    "partner_resumed": (13, ()),
+    "rpc_result": (14, ("id", "result")),
+    "rpc_error": (15, ("id", "error", "status")),
+    "message_sent": (16, ("client_id", "id")),
+    "message_not_sent": (17, ("client_id", "message")),
+}
+
+CLIENT_FRAMES: Dict[int, Tuple[str, Tuple[str, ...]]] = {
+    1: ("join_queue", ("looking_for",)),
+    2: ("leave_queue", ()),
+    3: ("send_message", ("content", "client_id")),
+    4: ("typing", ("is_typing",)),
+    5: ("read", ("message_id",)),
+    6: ("leave_chat", ()),
+    7: ("next_match", ("looking_for",)),
+    8: ("rpc", ("id", "method", "params")),
+}
+
+# Frames of a type without a code travel as [0, seq, {...original dict...}]
+_UNCODED = 0
+
+
+class FrameDecodeError(ValueError):
+    """An inbound frame could not be decoded."""
+
+
+def _epoch_ms(iso_timestamp: str) -> int:
+    # Server timestamps are naive UTC (datetime.utcnow().isoformat())
+    moment = datetime.fromisoformat(iso_timestamp).replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+class JsonCodec:
+    protocol = JSON_PROTOCOL
+    binary = False
+
+    @staticmethod
+    def encode(message: dict) -> str:
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+    @staticmethod
+    def decode(raw: Union[str, bytes]) -> dict:
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise FrameDecodeError(str(e)) from e
+        if not isinstance(data, dict):
+            raise FrameDecodeError("Expected an object")
+        return data
+
+
+class MsgpackCodec:
+    protocol = MSGPACK_PROTOCOL
+    binary = True
+
+    @staticmethod
+    def encode(message: dict) -> bytes:
+        msg_type = message.get("type")
+        schema = SERVER_FRAMES.get(msg_type)
+        if schema is None:
+            return msgpack.packb([_UNCODED, message.get("seq", 0), message])
+        code, fields = schema
+        frame: List = [code, message.get("seq", 0)]
+        for field in fields:
+            value = message.get(field)
+            if field == "timestamp" and isinstance(value, str):
+                value = _epoch_ms(value)
+            frame.append(value)
+        return msgpack.packb(frame)
+
+    @staticmethod
+    def decode(raw: Union[str, bytes]) -> dict:
+        if not isinstance(raw, bytes):
+            raise FrameDecodeError("Expected a binary frame")
+        try:
+            frame = msgpack.unpackb(raw)
+        except Exception as e:
+            raise FrameDecodeError(str(e)) from e
+        if not isinstance(frame, list) or not frame or not isinstance(frame[0], int):
+            raise FrameDecodeError("Expected [type_code, ...]")
+        schema = CLIENT_FRAMES.get(frame[0])
+        if schema is None:
+            raise FrameDecodeError(f"Unknown type code {frame[0]}")
+        msg_type, fields = schema
+        data = {"type": msg_type}
+        data.update(zip(fields, frame[1:]))
+        return data
+
+
+Codec = Union[JsonCodec, MsgpackCodec]
+
+_CLIENT_CODES = {name: (code, fields) for code, (name, fields) in CLIENT_FRAMES.items()}
+_SERVER_TYPES = {code: (name, fields) for name, (code, fields) in SERVER_FRAMES.items()}
+
+
+def pack_client_frame(message: dict) -> bytes:
+    """Encode a client frame for chat.msgpack.v1 (Python clients, e.g. the load harness)."""
+    code, fields = _CLIENT_CODES[message["type"]]
+    return msgpack.packb([code, *(message.get(field) for field in fields)])
+
+
+def unpack_server_frame(raw: bytes) -> dict:
+    """Decode a chat.msgpack.v1 server frame back into its JSON-protocol dict."""
+    frame = msgpack.unpackb(raw)
+    if frame[0] == _UNCODED:
+        return frame[2]
+    msg_type, fields = _SERVER_TYPES[frame[0]]
+    data = {"type": msg_type, "seq": frame[1]}
+    data.update(zip(fields, frame[2:]))
+    return data
+
+
+def negotiate(offered: List[str]) -> Tuple[Codec, Optional[str]]:
+    """
+    Pick a codec from the client's offered subprotocols.
+    Returns (codec, subprotocol to echo in the handshake, if any).
+    """
+    if MSGPACK_PROTOCOL in offered and msgpack is not None and WS_BINARY_PROTOCOL:
+        return MsgpackCodec, MSGPACK_PROTOCOL
+    if offered:
+        # Browsers fail the handshake if none of their offers is echoed back
+        return JsonCodec, JSON_PROTOCOL
+    return JsonCodec, None
@@ -0,0 +1,201 @@
+"""
+Microbenchmark for the relay-time content filter (services/content_filter.py).
+
+For growing term lists (random pseudo-words, 10% of them prefix terms) the
+filter is timed on a seeded corpus of chat messages: clean ones, and ones
+containing an obfuscated term, a link or a phone number. For comparison the
+same clean messages are run through the naive approach of one regex per
+term.
+
+Fails (exits non-zero) if the median cost of a clean message at the largest
+term list exceeds --budget-us, or if cost grows with the number of terms
+(scaling exponent above MAX_EXPONENT, fitted like matching_bench.py).
+
+Usage (from backend/):
+    python benchmarks/content_filter_bench.py
+    python benchmarks/content_filter_bench.py --sizes 100 1000 --budget-us 20
+"""
+import argparse
+import math
+import os
+import random
+import re
+import statistics
+import string
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.services.content_filter import ContentFilter  # noqa: E402
+
+SIZES = (10, 100, 1_000, 10_000)
+NAIVE_MAX_TERMS = 1_000
+MAX_EXPONENT = 0.25
+
+CHAT_WORDS = (
+    "hi hey hello how are you doing today im good thanks what about lol haha "
+    "where from nice cool yeah no maybe music games movies school work tired "
+    "weekend plans really same here what do you like to do for fun honestly "
+    "that sounds awesome never tried it before i think so too bye see ya"
+).split()
+LEET = str.maketrans({"o": "0", "i": "1", "e": "3", "a": "4", "s": "5"})
+
+
+def pseudo_words(rng: random.Random, count: int) -> List[str]:
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10))))
+    return sorted(words)
+
+
+def make_terms(rng: random.Random, size: int) -> List[str]:
+    return [w + "*" if rng.random() < 0.1 else w for w in pseudo_words(rng, size)]
+
+
+def chat_message(rng: random.Random) -> str:
+    return " ".join(rng.choices(CHAT_WORDS, k=rng.randint(2, 40)))
+
+
+def obfuscate(rng: random.Random, term: str) -> str:
+    term = term.rstrip("*")
+    style = rng.randrange(4)
+    if style == 0:
+        return term.translate(LEET)
+    if style == 1:
+        return ".".join(term)
+    if style == 2:
+        return term.upper()
+    return term[:2] + term[2] * 4 + term[3:]
+
+
+def dirty_message(rng: random.Random, terms: List[str]) -> str:
+    words = chat_message(rng).split()
+    kind = rng.randrange(3)
+    if kind == 0:
+        payload = obfuscate(rng, rng.choice(terms))
+    elif kind == 1:
+        payload = rng.choice(("check www.", "go to ", "visit ")) + rng.choice(
+            ("example.com", "example dot com", "examp1e[.]net")
+        )
+    else:
+        payload = rng.choice(("+1 (555) 123-4567", "555 123 4567", "07700 900123"))
+    words.insert(rng.randrange(len(words) + 1), payload)
+    return " ".join(words)
+
+
+def time_per_message(check: Callable[[str], object], messages: List[str], rounds: int) -> List[float]:
+    """Seconds per call, one sample per message (best of `rounds`)."""
+    samples = []
+    for message in messages:
+        best = math.inf
+        for _ in range(rounds):
+            start = time.perf_counter()
+            check(message)
+            best = min(best, time.perf_counter() - start)
+        samples.append(best)
+    return samples
+
+
+def naive_filter(terms: List[str]) -> Callable[[str], bool]:
+    patterns = [
+        re.compile(r"\b" + re.escape(t.rstrip("*")) + ("" if t.endswith("*") else r"\b"))
+        for t in terms
+    ]
+
+    def check(message: str) -> bool:
+        text = message.lower()
+        return any(p.search(text) for p in patterns)
+
+    return check
+
+
+def pct(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def scaling_exponent(sizes: List[int], seconds: List[float]) -> float:
+    """Least-squares slope of log(time) against log(term count)."""
+    xs = [math.log(s) for s in sizes]
+    ys = [math.log(max(t, 1e-9)) for t in seconds]
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    return numerator / denominator if denominator else 0.0
+
+
+def run(args) -> int:
+    rng = random.Random(args.seed)
+    clean = [chat_message(rng) for _ in range(args.messages)]
+    medians = []
+
+    print(f"{'terms':>7} {'compile':>9} {'clean p50':>10} {'clean p99':>10} "
+          f"{'dirty p50':>10} {'caught':>7} {'naive p50':>10}")
+    for size in args.sizes:
+        terms = make_terms(rng, size)
+        dirty = [dirty_message(rng, terms) for _ in range(args.messages // 4)]
+
+        start = time.perf_counter()
+        content_filter = ContentFilter(terms=terms)
+        compile_ms = (time.perf_counter() - start) * 1e3
+
+        clean_samples = time_per_message(content_filter.check, clean, args.rounds)
+        dirty_samples = time_per_message(content_filter.check, dirty, args.rounds)
+        caught = sum(1 for m in dirty if content_filter.check(m)) / len(dirty)
+        false_positives = sum(1 for m in clean if content_filter.check(m))
+        medians.append(statistics.median(clean_samples))
+
+        naive = "-"
+        if size <= NAIVE_MAX_TERMS:
+            naive_samples = time_per_message(naive_filter(terms), clean[:200], 1)
+            naive = f"{statistics.median(naive_samples) * 1e6:8.1f}us"
+        print(
+            f"{size:>7} {compile_ms:>7.1f}ms {medians[-1] * 1e6:>8.1f}us "
+            f"{pct(clean_samples, 99) * 1e6:>8.1f}us "
+            f"{statistics.median(dirty_samples) * 1e6:>8.1f}us {caught:>7.1%} {naive:>10}"
+        )
+        if false_positives:
+            print(f"        {false_positives} clean messages blocked")
+
+    problems = []
+    if medians[-1] * 1e6 > args.budget_us:
+        problems.append(
+            f"clean message p50 {medians[-1] * 1e6:.1f}us > budget {args.budget_us}us "
+            f"at {args.sizes[-1]} terms"
+        )
+    if len(args.sizes) > 1:
+        exponent = scaling_exponent(list(args.sizes), medians)
+        print(f"\nscaling exponent (cost vs term count): {exponent:.2f}")
+        if exponent > MAX_EXPONENT:
+            problems.append(f"scaling exponent {exponent:.2f} > {MAX_EXPONENT}")
+
+    if problems:
+        print("\nREGRESSIONS:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+    print("\nOK: per-message cost within budget and flat in the number of terms")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Content filter microbenchmark")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--messages", type=int, default=2_000, help="clean messages per size")
+    parser.add_argument("--rounds", type=int, default=5, help="timings per message (best kept)")
+    parser.add_argument("--budget-us", type=float, default=25.0,
+                        help="max median microseconds per clean message")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
@@ -0,0 +1,535 @@
+"""
+Load-test harness: simulate many concurrent WebSocket chatters.
+
+Boots the FastAPI app in-process on an ephemeral localhost port (or targets
+an already running server with --url), registers N fake devices through
+/api/auth/register, marks them verified (DEMO_MODE only), opens N
+/ws/chat/{device_id} connections and drives a join/message/next/leave mix.
+
+Reports p50/p99 match latency, message relay latency, throughput and memory,
+and stores each run as JSON under benchmarks/results/ for comparison
+between commits.
+
+Usage (from backend/):
+    python benchmarks/load_test.py --clients 1000 --duration 30
+    python benchmarks/load_test.py --clients 200 --compare latest
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --server-pid 1234
+    python benchmarks/load_test.py --clients 200 --protocol msgpack
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+@dataclass
+class RunStats:
+    """Raw observations collected by all chatters."""
+    match_latencies: List[float] = field(default_factory=list)
+    relay_latencies: List[float] = field(default_factory=list)
+    connect_latencies: List[float] = field(default_factory=list)
+    messages_sent: int = 0
+    messages_received: int = 0
+    match_events: int = 0
+    joins: int = 0
+    nexts: int = 0
+    leaves: int = 0
+    match_timeouts: int = 0
+    server_errors: int = 0
+    connection_failures: int = 0
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile (None for no data)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """Resident set size of a process, from /proc when available."""
+    status = Path(f"/proc/{pid or 'self'}/status")
+    try:
+        for line in status.read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None:
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            pass
+    return None
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def raise_fd_limit():
+    """Each chatter costs two sockets in-process; lift the soft fd limit."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Server bootstrap
+# ---------------------------------------------------------------------------
+
+async def start_local_server(db_path: str):
+    """Start the app in-process with uvicorn on a free port. Returns (server, task, base_url)."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("DEMO_MODE", "true")
+    os.environ.setdefault("QUEUE_COOLDOWN_SECONDS", "0")
+    # Simulated clients rejoin much faster than a person would
+    os.environ.setdefault("RATE_LIMIT_JOINS_PER_MINUTE", "6000")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    import uvicorn
+    from app.main import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    config = uvicorn.Config(
+        app, host="127.0.0.1", port=port, log_level="warning",
+        ws_max_size=65536, backlog=4096,
+    )
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+def _post_json(url: str, payload: dict, timeout: float = 30):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), method="POST",
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+async def register_devices(base_url: str, device_ids: List[str], concurrency: int = 64):
+    """Register every device through the public API."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def register(device_id: str):
+        async with semaphore:
+            await asyncio.to_thread(
+                _post_json, f"{base_url}/api/auth/register", {"device_id": device_id}
+            )
+
+    await asyncio.gather(*(register(d) for d in device_ids))
+
+
+def mark_verified(genders: Dict[str, str]):
+    """Set gender_result directly (DEMO_MODE only - skips camera verification)."""
+    from app.config import DEMO_MODE
+    from app.database import SessionLocal
+    from app.models import UserSession
+
+    if not DEMO_MODE:
+        raise SystemExit("Refusing to mark devices verified: DEMO_MODE is off")
+
+    db = SessionLocal()
+    try:
+        for gender in set(genders.values()):
+            ids = [d for d, g in genders.items() if g == gender]
+            for start in range(0, len(ids), 500):
+                db.query(UserSession).filter(
+                    UserSession.device_id.in_(ids[start:start + 500])
+                ).update({UserSession.gender_result: gender}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+# ---------------------------------------------------------------------------
+# Simulated chatter
+# ---------------------------------------------------------------------------
+
+class Chatter:
+    """One simulated user driving the chat protocol."""
+
+    def __init__(self, device_id: str, ws_url: str, stats: RunStats, args, rng: random.Random):
+        self.device_id = device_id
+        self.ws_url = ws_url
+        self.stats = stats
+        self.args = args
+        self.rng = rng
+        self.ws = None
+        self.reader: Optional[asyncio.Task] = None
+        self.matched = asyncio.Event()
+        self.chat_over = asyncio.Event()
+        self.specific_joins = 0
+        self.binary = args.protocol == "msgpack"
+        self.wire = None
+
+    async def connect(self) -> bool:
+        import websockets
+        from app.services import ws_protocol
+
+        self.wire = ws_protocol
+
+        start = time.perf_counter()
+        try:
+            self.ws = await websockets.connect(
+                f"{self.ws_url}/ws/chat/{self.device_id}",
+                max_queue=None, ping_interval=None, open_timeout=60,
+                subprotocols=[ws_protocol.MSGPACK_PROTOCOL] if self.binary else None,
+            )
+            if self.binary and self.ws.subprotocol != ws_protocol.MSGPACK_PROTOCOL:
+                raise RuntimeError("server did not accept the msgpack protocol")
+            hello = self._decode(await self.ws.recv())
+            if hello.get("type") != "connected":
+                raise RuntimeError(f"unexpected greeting {hello}")
+        except Exception:
+            self.stats.connection_failures += 1
+            return False
+        self.stats.connect_latencies.append(time.perf_counter() - start)
+        self.reader = asyncio.create_task(self._read())
+        return True
+
+    async def _read(self):
+        stats = self.stats
+        try:
+            async for raw in self.ws:
+                msg = self._decode(raw)
+                msg_type = msg.get("type")
+                if msg_type == "message":
+                    stats.messages_received += 1
+                    sent_at = msg.get("content", "").partition(" ")[0]
+                    try:
+                        stats.relay_latencies.append(time.perf_counter() - float(sent_at))
+                    except ValueError:
+                        pass
+                elif msg_type == "match_found":
+                    stats.match_events += 1
+                    self.chat_over.clear()
+                    self.matched.set()
+                elif msg_type in ("partner_left", "chat_ended"):
+                    self.matched.clear()
+                    self.chat_over.set()
+                elif msg_type == "error":
+                    stats.server_errors += 1
+        except Exception:
+            pass
+
+    def _decode(self, raw) -> dict:
+        return self.wire.unpack_server_frame(raw) if self.binary else json.loads(raw)
+
+    async def _send(self, payload: dict):
+        if self.binary:
+            await self.ws.send(self.wire.pack_client_frame(payload))
+        else:
+            await self.ws.send(json.dumps(payload))
+
+    def _looking_for(self) -> str:
+        from app.config import DAILY_SPECIFIC_FILTER_LIMIT
+
+        # Stay under the daily filter limit so joins are never rejected
+        if (self.specific_joins < DAILY_SPECIFIC_FILTER_LIMIT
+                and self.rng.random() < self.args.specific_prob):
+            self.specific_joins += 1
+            return self.rng.choice(["male", "female"])
+        return "any"
+
+    async def drive(self, stop_at: float):
+        """Join -> chat -> next/leave until the deadline."""
+        args, rng, stats = self.args, self.rng, self.stats
+        need_join = True
+        try:
+            while time.monotonic() < stop_at:
+                self.matched.clear()
+                queued_at = time.perf_counter()
+                if need_join:
+                    stats.joins += 1
+                    await self._send({"type": "join_queue", "looking_for": self._looking_for()})
+                need_join = True
+
+                try:
+                    await asyncio.wait_for(
+                        self.matched.wait(), timeout=max(0.0, stop_at - time.monotonic())
+                    )
+                except asyncio.TimeoutError:
+                    stats.match_timeouts += 1
+                    await self._send({"type": "leave_queue"})
+                    return
+                stats.match_latencies.append(time.perf_counter() - queued_at)
+
+                for _ in range(rng.randint(1, args.messages_per_chat)):
+                    if self.chat_over.is_set() or time.monotonic() >= stop_at:
+                        break
+                    await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+                    if self.chat_over.is_set():
+                        break
+                    await self._send({
+                        "type": "send_message",
+                        # A plain decimal timestamp: not taken for a phone number
+                        # by the content filter, which stays on for the run
+                        "content": f"{time.perf_counter():.6f} {'x' * rng.randint(5, 120)}",
+                    })
+                    stats.messages_sent += 1
+
+                if self.chat_over.is_set():
+                    continue  # partner left first; rejoin
+                if rng.random() < args.next_prob:
+                    stats.nexts += 1
+                    await self._send({"type": "next_match", "looking_for": self._looking_for()})
+                    need_join = False
+                else:
+                    stats.leaves += 1
+                    await self._send({"type": "leave_chat"})
+                    await asyncio.sleep(rng.expovariate(1000 / args.idle_ms))
+        except Exception:
+            stats.connection_failures += 1
+
+    async def close(self):
+        if self.ws is not None:
+            try:
+                await self.ws.close()
+            except Exception:
+                pass
+        if self.reader is not None:
+            self.reader.cancel()
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def summarize(stats: RunStats, drive_seconds: float, memory: dict) -> dict:
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "match_latency_ms": {
+            "p50": ms(percentile(stats.match_latencies, 50)),
+            "p99": ms(percentile(stats.match_latencies, 99)),
+            "count": len(stats.match_latencies),
+        },
+        "relay_latency_ms": {
+            "p50": ms(percentile(stats.relay_latencies, 50)),
+            "p99": ms(percentile(stats.relay_latencies, 99)),
+            "count": len(stats.relay_latencies),
+        },
+        "connect_latency_ms": {
+            "p50": ms(percentile(stats.connect_latencies, 50)),
+            "p99": ms(percentile(stats.connect_latencies, 99)),
+        },
+        "throughput": {
+            "matches_per_sec": round(stats.match_events / 2 / drive_seconds, 2),
+            "messages_relayed_per_sec": round(stats.messages_received / drive_seconds, 2),
+        },
+        "counts": {
+            key: value for key, value in asdict(stats).items()
+            if isinstance(value, int)
+        },
+        "memory": memory,
+    }
+
+
+FLAT_KEYS = [
+    ("match_latency_ms", "p50"), ("match_latency_ms", "p99"),
+    ("relay_latency_ms", "p50"), ("relay_latency_ms", "p99"),
+    ("throughput", "matches_per_sec"), ("throughput", "messages_relayed_per_sec"),
+    ("memory", "rss_after_mb"),
+]
+
+
+def print_report(result: dict, baseline: Optional[dict] = None):
+    print(f"\nrevision {result['revision']}  clients={result['params']['clients']}  "
+          f"duration={result['params']['duration']}s  mode={result['mode']}")
+    header = f"{'metric':<42}{'value':>14}"
+    if baseline:
+        header += f"{'baseline':>14}{'delta':>10}"
+        print(f"baseline {baseline['revision']} ({baseline['timestamp']})")
+    print(header)
+    for section, key in FLAT_KEYS:
+        value = result["results"][section].get(key)
+        line = f"{section + '.' + key:<42}{_fmt(value):>14}"
+        if baseline:
+            old = baseline["results"].get(section, {}).get(key)
+            line += f"{_fmt(old):>14}"
+            if value is not None and old:
+                line += f"{(value - old) / old * 100:>+9.1f}%"
+        print(line)
+    counts = result["results"]["counts"]
+    print("counts: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+
+
+def _fmt(value) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def load_baseline(spec: str, exclude: Optional[Path] = None) -> Optional[dict]:
+    if spec == "latest":
+        runs = sorted(p for p in RESULTS_DIR.glob("*.json") if p != exclude)
+        if not runs:
+            return None
+        path = runs[-1]
+    else:
+        path = Path(spec)
+    return json.loads(path.read_text())
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+async def run(args) -> dict:
+    raise_fd_limit()
+    server = server_task = None
+    db_dir = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        mode = "external"
+    else:
+        db_dir = tempfile.TemporaryDirectory(prefix="chat-loadtest-")
+        server, server_task, base_url = await start_local_server(
+            os.path.join(db_dir.name, "loadtest.db")
+        )
+        mode = "in-process"
+    ws_url = base_url.replace("http://", "ws://").replace("https://", "wss://")
+
+    rng = random.Random(args.seed)
+    stats = RunStats()
+    device_ids = [f"bench{uuid.UUID(int=rng.getrandbits(128)).hex}" for _ in range(args.clients)]
+    genders = {
+        d: ("Man" if rng.random() < args.male_ratio else "Woman") for d in device_ids
+    }
+
+    try:
+        started = time.perf_counter()
+        await register_devices(base_url, device_ids)
+        mark_verified(genders)
+        print(f"registered {len(device_ids)} devices in {time.perf_counter() - started:.1f}s")
+
+        rss_before = rss_bytes(args.server_pid)
+        chatters = [
+            Chatter(d, ws_url, stats, args, random.Random(rng.getrandbits(32)))
+            for d in device_ids
+        ]
+        semaphore = asyncio.Semaphore(args.connect_concurrency)
+
+        async def connect(chatter: Chatter):
+            async with semaphore:
+                return await chatter.connect()
+
+        started = time.perf_counter()
+        connected = await asyncio.gather(*(connect(c) for c in chatters))
+        chatters = [c for c, ok in zip(chatters, connected) if ok]
+        print(f"opened {len(chatters)} websockets in {time.perf_counter() - started:.1f}s")
+
+        drive_started = time.monotonic()
+        stop_at = drive_started + args.duration
+        await asyncio.gather(*(c.drive(stop_at) for c in chatters))
+        drive_seconds = time.monotonic() - drive_started
+        rss_after = rss_bytes(args.server_pid)
+
+        await asyncio.gather(*(c.close() for c in chatters))
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await server_task
+        if db_dir is not None:
+            db_dir.cleanup()
+
+    memory = {
+        "scope": "server" if args.server_pid else ("harness+server" if mode == "in-process" else "harness"),
+        "rss_before_mb": round(rss_before / 2**20, 1) if rss_before else None,
+        "rss_after_mb": round(rss_after / 2**20, 1) if rss_after else None,
+    }
+    return {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().strftime("%Y%m%dT%H%M%SZ"),
+        "label": args.label,
+        "mode": mode,
+        "params": {
+            key: getattr(args, key) for key in (
+                "clients", "duration", "messages_per_chat", "think_ms", "idle_ms",
+                "next_prob", "specific_prob", "male_ratio", "seed", "protocol",
+            )
+        },
+        "results": summarize(stats, drive_seconds, memory),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=200, help="concurrent chatters")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of traffic")
+    parser.add_argument("--url", help="target a running server instead of booting one in-process")
+    parser.add_argument("--server-pid", type=int, help="measure RSS of this pid (external mode)")
+    parser.add_argument("--messages-per-chat", type=int, default=8)
+    parser.add_argument("--think-ms", type=float, default=300, help="mean delay between messages")
+    parser.add_argument("--idle-ms", type=float, default=500, help="mean pause after leave_chat")
+    parser.add_argument("--next-prob", type=float, default=0.6, help="next_match vs leave_chat")
+    parser.add_argument("--specific-prob", type=float, default=0.1, help="share of gender-filtered joins")
+    parser.add_argument("--male-ratio", type=float, default=0.6)
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--protocol", choices=["json", "msgpack"], default="json",
+                        help="websocket wire protocol to negotiate")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="", help="free-form note stored with the result")
+    parser.add_argument("--compare", help="baseline result file, or 'latest'")
+    parser.add_argument("--no-save", action="store_true", help="do not write a result file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+
+    saved = None
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        saved = RESULTS_DIR / f"{result['timestamp']}-{result['revision']}.json"
+        saved.write_text(json.dumps(result, indent=2))
+
+    baseline = load_baseline(args.compare, exclude=saved) if args.compare else None
+    print_report(result, baseline)
+    if saved:
+        print(f"\nsaved {saved.relative_to(BACKEND_DIR)}")
+
+
+if __name__ == "__main__":
+    main()
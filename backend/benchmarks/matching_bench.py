@@ -0,0 +1,497 @@
+"""
+Microbenchmarks for MatchingService at varying queue depths.
+
+For each backend (in-memory FIFO, in-memory priority heaps, and Redis via a local in-process stand-in or a
+real server with --redis-url) the queues are filled to each depth with a
+realistic gender/preference mix, then add_to_queue, find_match,
+remove_from_queue and end_match are timed.
+
+Complexity is checked by fitting the scaling exponent of each operation
+(slope of log(time) over log(depth)) and comparing it with the committed
+baseline in benchmarks/matching_baseline.json. A seeded arrival/abandonment
+simulation reports per-group match rates and wait-time distributions, which
+are compared against the same baseline so matcher changes cannot silently
+change who gets matched.
+
+Exits non-zero on a regression.
+
+Usage (from backend/):
+    python benchmarks/matching_bench.py
+    python benchmarks/matching_bench.py --quick --backends memory
+    python benchmarks/matching_bench.py --update-baseline
+"""
+import argparse
+import asyncio
+import fnmatch
+import heapq
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict, deque
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "matching_baseline.json"
+
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.services import matching as matching_module  # noqa: E402
+from app.services.matching import MatchingService  # noqa: E402
+
+DEPTHS = (10, 1_000, 10_000, 100_000)
+QUICK_DEPTHS = (10, 1_000, 10_000)
+OPERATIONS = ("add_to_queue", "find_match", "remove_from_queue", "end_match")
+
+# Realistic population: (gender_result, looking_for) -> weight
+POPULATION_MIX = {
+    ("Man", "any"): 0.40,
+    ("Man", "female"): 0.18,
+    ("Man", "male"): 0.04,
+    ("Woman", "any"): 0.28,
+    ("Woman", "male"): 0.08,
+    ("Woman", "female"): 0.02,
+}
+
+# Allowed growth of the scaling exponent before we call it a regression
+EXPONENT_TOLERANCE = 0.35
+MATCH_RATE_TOLERANCE = 0.03
+WAIT_TOLERANCE = 0.25
+
+
+class LocalRedis:
+    """Minimal asyncio stand-in for the redis commands MatchingService uses."""
+
+    def __init__(self):
+        self.data: Dict[str, object] = {}
+
+    async def lpush(self, key, *values):
+        items = self.data.setdefault(key, deque())
+        items.extendleft(values)
+        return len(items)
+
+    async def lrange(self, key, start, end):
+        items = self.data.get(key, ())
+        end = len(items) if end == -1 else end + 1
+        return list(islice(items, start, end))
+
+    async def lrem(self, key, count, value):
+        items = self.data.get(key, deque())
+        removed = 0
+        index = 0
+        while index < len(items) and (count == 0 or removed < count):
+            if items[index] == value:
+                del items[index]
+                removed += 1
+            else:
+                index += 1
+        return removed
+
+    async def zadd(self, key, mapping):
+        members = self.data.setdefault(key, {})
+        added = sum(1 for member in mapping if member not in members)
+        members.update(mapping)
+        return added
+
+    async def zrem(self, key, *members):
+        scores = self.data.get(key, {})
+        return sum(1 for member in members if scores.pop(member, None) is not None)
+
+    async def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def _zsorted(self, key):
+        return sorted(self.data.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+
+    async def zrange(self, key, start, end, withscores=False):
+        items = self._zsorted(key)
+        items = items[start:] if end == -1 else items[start:end + 1]
+        return items if withscores else [member for member, _ in items]
+
+    async def zrangebyscore(self, key, low, high, start=None, num=None, withscores=False):
+        def bound(value):
+            text = str(value)
+            return (float(text[1:]), True) if text.startswith("(") else (float(text), False)
+
+        (low, low_open), (high, high_open) = bound(low), bound(high)
+        items = [
+            (member, score) for member, score in self._zsorted(key)
+            if (score > low if low_open else score >= low)
+            and (score < high if high_open else score <= high)
+        ]
+        if start is not None:
+            items = items[start:start + num]
+        return items if withscores else [member for member, _ in items]
+
+    async def expire(self, key, seconds):
+        return key in self.data
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    async def keys(self, pattern="*"):
+        return [key for key in self.data if fnmatch.fnmatch(key, pattern)]
+
+    async def flushdb(self):
+        self.data.clear()
+
+
+def make_backend(name: str, redis_url: Optional[str]) -> MatchingService:
+    if name == "memory":
+        return MatchingService(priority=False)
+    if name == "priority":
+        return MatchingService(priority=True)
+    if redis_url:
+        import redis.asyncio as aioredis
+        return MatchingService(aioredis.from_url(redis_url, decode_responses=True), priority=False)
+    return MatchingService(LocalRedis(), priority=False)
+
+
+async def reset(service: MatchingService):
+    """Empty all queues and matches for this backend."""
+    if service.use_memory:
+        for queue in matching_module._memory_queues.values():
+            queue.clear()
+        matching_module._active_matches.clear()
+        matching_module._priority_queue.clear()
+        matching_module._queue_index.clear()
+    else:
+        await service.redis.flushdb()
+
+
+def draw_profile(rng: random.Random) -> Tuple[str, str]:
+    profiles = list(POPULATION_MIX)
+    return rng.choices(profiles, weights=[POPULATION_MIX[p] for p in profiles])[0]
+
+
+def device(prefix: str, index: int) -> str:
+    return f"{prefix}{index:0>32}"
+
+
+# ---------------------------------------------------------------------------
+# Operation timings
+# ---------------------------------------------------------------------------
+
+async def fill(service: MatchingService, depth: int, rng: random.Random) -> List[Tuple[str, str, str]]:
+    entries = []
+    for i in range(depth):
+        gender, looking_for = draw_profile(rng)
+        device_id = device("q", i)
+        await service.add_to_queue(device_id, gender, looking_for)
+        entries.append((device_id, gender, looking_for))
+    return entries
+
+
+async def timed(samples: List[float], coro):
+    start = time.perf_counter()
+    result = await coro
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+async def bench_depth(
+    service: MatchingService, depth: int, iterations: int, budget: float, seed: int
+) -> Dict[str, float]:
+    """Median seconds per operation at a given queue depth."""
+    rng = random.Random(seed)
+    await reset(service)
+    entries = await fill(service, depth, rng)
+    results = {}
+
+    # add_to_queue: add one entry, then take it out again (untimed)
+    samples: List[float] = []
+    deadline = time.perf_counter() + budget
+    for i in range(iterations):
+        gender, looking_for = draw_profile(rng)
+        device_id = device("a", i)
+        await timed(samples, service.add_to_queue(device_id, gender, looking_for))
+        await service.remove_from_queue(device_id, gender)
+        if time.perf_counter() > deadline:
+            break
+    results["add_to_queue"] = statistics.median(samples)
+
+    # remove_from_queue: remove a random queued entry, then re-add it (untimed)
+    samples = []
+    deadline = time.perf_counter() + budget
+    for _ in range(iterations):
+        device_id, gender, looking_for = rng.choice(entries)
+        await timed(samples, service.remove_from_queue(device_id, gender))
+        await service.add_to_queue(device_id, gender, looking_for)
+        if time.perf_counter() > deadline:
+            break
+    results["remove_from_queue"] = statistics.median(samples)
+
+    # find_match: a new searcher joins and searches; matched partners are put back
+    samples = []
+    deadline = time.perf_counter() + budget
+    for i in range(iterations):
+        gender, looking_for = draw_profile(rng)
+        device_id = device("s", i)
+        await service.add_to_queue(device_id, gender, looking_for)
+        match = await timed(samples, service.find_match(device_id, gender, looking_for))
+        if match:
+            await service.end_match(device_id)
+            await service.add_to_queue(
+                match["device_id"], match["gender"], match["looking_for"]
+            )
+        else:
+            await service.remove_from_queue(device_id, gender)
+        if time.perf_counter() > deadline:
+            break
+    results["find_match"] = statistics.median(samples)
+
+    # end_match: tear down a freshly recorded pair
+    samples = []
+    deadline = time.perf_counter() + budget
+    for i in range(iterations):
+        first, second = device("m", 2 * i), device("m", 2 * i + 1)
+        if service.use_memory:
+            matching_module._active_matches[first] = second
+            matching_module._active_matches[second] = first
+        else:
+            await service.redis.set(f"match:{first}", second)
+            await service.redis.set(f"match:{second}", first)
+        await timed(samples, service.end_match(first))
+        if time.perf_counter() > deadline:
+            break
+    results["end_match"] = statistics.median(samples)
+
+    await reset(service)
+    return results
+
+
+def scaling_exponent(depths: List[int], seconds: List[float]) -> float:
+    """Least-squares slope of log(time) against log(depth)."""
+    xs = [math.log(d) for d in depths]
+    ys = [math.log(max(s, 1e-9)) for s in seconds]
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    return numerator / denominator if denominator else 0.0
+
+
+# ---------------------------------------------------------------------------
+# Fairness simulation
+# ---------------------------------------------------------------------------
+
+async def simulate_fairness(
+    service: MatchingService, arrivals: int, mean_patience: float, seed: int
+) -> dict:
+    """
+    Seeded arrival stream: each arrival joins and searches like
+    handle_join_queue; waiting users abandon after an exponential patience.
+    Wait time is measured in arrivals (logical clock) so results are
+    machine independent.
+    """
+    rng = random.Random(seed)
+    await reset(service)
+    arrived_at: Dict[str, int] = {}
+    profile: Dict[str, Tuple[str, str]] = {}
+    waiting = set()
+    deadlines: List[Tuple[int, str]] = []
+    groups = defaultdict(lambda: {"arrivals": 0, "matched": 0, "abandoned": 0, "waits": []})
+
+    for step in range(arrivals):
+        while deadlines and deadlines[0][0] <= step:
+            _, gone = heapq.heappop(deadlines)
+            if gone in waiting:
+                waiting.discard(gone)
+                await service.remove_from_queue(gone, profile[gone][0])
+                groups[profile[gone]]["abandoned"] += 1
+
+        gender, looking_for = draw_profile(rng)
+        device_id = device("f", step)
+        arrived_at[device_id] = step
+        profile[device_id] = (gender, looking_for)
+        groups[(gender, looking_for)]["arrivals"] += 1
+
+        await service.add_to_queue(device_id, gender, looking_for)
+        match = await service.find_match(device_id, gender, looking_for)
+        if match:
+            partner = match["device_id"]
+            await service.end_match(device_id)
+            waiting.discard(partner)
+            for who in (device_id, partner):
+                stats = groups[profile[who]]
+                stats["matched"] += 1
+                stats["waits"].append(step - arrived_at[who])
+        else:
+            waiting.add(device_id)
+            patience = int(rng.expovariate(1 / mean_patience)) + 1
+            heapq.heappush(deadlines, (step + patience, device_id))
+
+    await reset(service)
+
+    report = {}
+    for (gender, looking_for), stats in sorted(groups.items()):
+        waits = sorted(stats["waits"])
+        report[f"{gender}/{looking_for}"] = {
+            "arrivals": stats["arrivals"],
+            "match_rate": round(stats["matched"] / stats["arrivals"], 4),
+            "abandon_rate": round(stats["abandoned"] / stats["arrivals"], 4),
+            "wait_p50": _pct(waits, 50),
+            "wait_p90": _pct(waits, 90),
+            "wait_p99": _pct(waits, 99),
+        }
+    rates = [g["match_rate"] for g in report.values()]
+    jain = (sum(rates) ** 2) / (len(rates) * sum(r * r for r in rates)) if any(rates) else 0.0
+    return {"groups": report, "jain_index": round(jain, 4)}
+
+
+def _pct(ordered: List[int], pct: float) -> Optional[int]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+# ---------------------------------------------------------------------------
+# Baseline comparison
+# ---------------------------------------------------------------------------
+
+def compare(backend: str, result: dict, baseline: dict) -> List[str]:
+    problems = []
+    base = baseline.get(backend)
+    if not base:
+        return problems
+
+    for op, exponent in result["exponents"].items():
+        allowed = base["exponents"].get(op)
+        if allowed is not None and exponent > allowed + EXPONENT_TOLERANCE:
+            problems.append(
+                f"{backend}.{op}: scaling exponent {exponent:.2f} > baseline {allowed:.2f} "
+                f"+ {EXPONENT_TOLERANCE}"
+            )
+
+    base_groups = base.get("fairness", {}).get("groups", {})
+    for group, stats in result["fairness"]["groups"].items():
+        old = base_groups.get(group)
+        if not old:
+            continue
+        if abs(stats["match_rate"] - old["match_rate"]) > MATCH_RATE_TOLERANCE:
+            problems.append(
+                f"{backend} fairness {group}: match_rate {stats['match_rate']:.3f} "
+                f"vs baseline {old['match_rate']:.3f}"
+            )
+        for key in ("wait_p50", "wait_p90"):
+            new_wait, old_wait = stats[key], old[key]
+            if new_wait is None or old_wait is None:
+                continue
+            if abs(new_wait - old_wait) > max(2, WAIT_TOLERANCE * old_wait):
+                problems.append(
+                    f"{backend} fairness {group}: {key} {new_wait} vs baseline {old_wait}"
+                )
+    return problems
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+async def run(args) -> dict:
+    results = {}
+    for backend in args.backends:
+        service = make_backend(backend, args.redis_url)
+        timings = {}
+        for depth in args.depths:
+            iterations = args.iterations if depth < 100_000 else max(10, args.iterations // 10)
+            timings[depth] = await bench_depth(
+                service, depth, iterations, args.budget, args.seed
+            )
+            print(f"{backend:<7} depth={depth:<7} " + "  ".join(
+                f"{op}={timings[depth][op] * 1e6:9.1f}us" for op in OPERATIONS
+            ))
+
+        fit_depths = [d for d in args.depths if d >= 1_000] or list(args.depths)
+        exponents = {
+            op: round(scaling_exponent(fit_depths, [timings[d][op] for d in fit_depths]), 3)
+            for op in OPERATIONS
+        }
+        fairness = await simulate_fairness(service, args.arrivals, args.patience, args.seed)
+        results[backend] = {
+            "timings_us": {
+                str(d): {op: round(t * 1e6, 2) for op, t in ops.items()}
+                for d, ops in timings.items()
+            },
+            "exponents": exponents,
+            "fairness": fairness,
+        }
+        print(f"{backend:<7} exponents " + "  ".join(f"{op}={e:.2f}" for op, e in exponents.items()))
+        print(f"{backend:<7} fairness jain={fairness['jain_index']}")
+        for group, stats in fairness["groups"].items():
+            print(f"          {group:<14} match={stats['match_rate']:.3f} "
+                  f"abandon={stats['abandon_rate']:.3f} wait p50/p90/p99="
+                  f"{stats['wait_p50']}/{stats['wait_p90']}/{stats['wait_p99']}")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MatchingService microbenchmarks")
+    parser.add_argument("--backends", nargs="+", default=["memory", "priority", "redis"],
+                        choices=["memory", "priority", "redis"])
+    parser.add_argument("--depths", nargs="+", type=int, default=None)
+    parser.add_argument("--quick", action="store_true", help="skip the 100k depth")
+    parser.add_argument("--iterations", type=int, default=200, help="samples per operation")
+    parser.add_argument("--budget", type=float, default=2.0, help="max seconds per operation/depth")
+    parser.add_argument("--arrivals", type=int, default=20_000, help="fairness simulation length")
+    parser.add_argument("--patience", type=float, default=50, help="mean arrivals before abandoning")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--redis-url", help="use a real Redis instead of the in-process stand-in")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--json", type=Path, help="write full results here")
+    args = parser.parse_args(argv)
+    if args.depths is None:
+        args.depths = list(QUICK_DEPTHS if args.quick else DEPTHS)
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        for backend, result in results.items():
+            baseline[backend] = {
+                "exponents": result["exponents"],
+                "fairness": result["fairness"],
+            }
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"\nbaseline updated: {args.baseline.name}")
+        return 0
+
+    if not args.baseline.exists():
+        print("\nno baseline found; run with --update-baseline")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    problems = [p for backend, result in results.items() for p in compare(backend, result, baseline)]
+    if problems:
+        print("\nREGRESSIONS:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+    print("\nOK: no complexity or fairness regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,9 @@
  * API Module - Backend communication
  */
 const API = {
-    BASE_URL: 'http://localhost:8000',
-    WS_URL: 'ws://localhost:8000',
+    // Set by the bundle the API serves (FRONTEND_DIST); the dev server uses :8000
+    BASE_URL: window.API_BASE_URL || 'http://localhost:8000',
+    WS_URL: (window.API_BASE_URL || 'http://localhost:8000').replace(/^http/, 'ws'),
     deviceId: null,
 
     async init() {
@@ -31,6 +32,33 @@ const API = {
         return response.json();
     },
 
+    // Last ETag and body per polled endpoint, for conditional GETs
+    validators: {},
+
+    async conditionalGet(endpoint) {
+        const cached = this.validators[endpoint];
+        const headers = {
+            'Content-Type': 'application/json',
+            'X-Device-ID': this.deviceId
+        };
+        if (cached) headers['If-None-Match'] = cached.etag;
+
+        const response = await fetch(`${this.BASE_URL}${endpoint}`, { headers });
+        if (response.status === 304 && cached) {
+            return cached.body;
+        }
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({ detail: 'Request failed' }));
+            throw new Error(error.detail || 'Request failed');
+        }
+        const body = await response.json();
+        const etag = response.headers.get('ETag');
+        if (etag) {
+            this.validators[endpoint] = { etag, body };
+        }
+        return body;
+    },
+
     async register() {
         return this.request('/api/auth/register', {
             method: 'POST',
@@ -66,10 +94,15 @@ const API = {
     },
 
     async getMe() {
-        return this.request(`/api/auth/me`);
+        return this.conditionalGet(`/api/auth/me`);
     },
 
+    // While the chat socket is open these go over it as RPCs (the server
+    // reports the current partner); REST is the fallback outside chat.
     async submitReport(reportedDeviceId, reason, details) {
+        if (WebSocketManager.isOpen()) {
+            return WebSocketManager.rpc('submit_report', { reason: `${reason}: ${details}` });
+        }
         return this.request('/api/reports/submit', {
             method: 'POST',
             body: JSON.stringify({
@@ -80,11 +113,140 @@ const API = {
     },
 
     async completeChat() {
+        if (WebSocketManager.isOpen()) return WebSocketManager.rpc('complete_chat');
         return this.request(`/api/reports/chat-complete`, { method: 'POST' });
     },
 
     async getKarma() {
-        return this.request(`/api/reports/karma`);
+        if (WebSocketManager.isOpen()) return WebSocketManager.rpc('get_karma');
+        return this.conditionalGet(`/api/reports/karma`);
+    },
+};
+
+/**
+ * Compact wire protocol (chat.msgpack.v1) - must match backend/app/services/ws_protocol.py.
+ * Server frames: [code, seq, ...fields]; client frames: [code, ...fields].
+ */
+const WIRE_SCHEMA = {
+    server: {
+        1: ['connected', ['karma', 'nickname', 'resume_token']],
+        2: ['queued', ['looking_for']],
+        3: ['match_found', ['partner']],
+        4: ['message', ['id', 'content', 'timestamp']],
+        5: ['partner_typing', ['is_typing']],
+        6: ['read_receipt', ['message_id']],
+        7: ['partner_left', []],
+        8: ['chat_ended', []],
+        9: ['left_queue', []],
+        10: ['error', ['message']],
+        11: ['resumed', ['in_chat']],
+        12: ['partner_reconnecting', []],
+        13: ['partner_resumed', []],
+        14: ['rpc_result', ['id', 'result']],
+        15: ['rpc_error', ['id', 'error', 'status']],
+        16: ['message_sent', ['client_id', 'id']],
+        17: ['message_not_sent', ['client_id', 'message']],
+    },
+    client: {
+        join_queue: [1, ['looking_for']],
+        leave_queue: [2, []],
+        send_message: [3, ['content', 'client_id']],
+        typing: [4, ['is_typing']],
+        read: [5, ['message_id']],
+        leave_chat: [6, []],
+        next_match: [7, ['looking_for']],
+        rpc: [8, ['id', 'method', 'params']],
+    },
+};
+
+/**
+ * Minimal MessagePack codec covering what the chat frames use
+ * (nil, bool, int, float, str, array, map).
+ */
+const MsgPack = {
+    encode(value) {
+        const out = [];
+        const utf8 = new TextEncoder();
+        const write = (v) => {
+            if (v === null || v === undefined) out.push(0xc0);
+            else if (v === false) out.push(0xc2);
+            else if (v === true) out.push(0xc3);
+            else if (typeof v === 'number') {
+                if (Number.isInteger(v) && v >= 0 && v < 0x80) out.push(v);
+                else if (Number.isInteger(v) && v < 0 && v >= -32) out.push(v & 0xff);
+                else if (Number.isInteger(v) && v >= -0x80000000 && v <= 0xffffffff) {
+                    out.push(v < 0 ? 0xd2 : 0xce, (v >>> 24) & 0xff, (v >>> 16) & 0xff, (v >>> 8) & 0xff, v & 0xff);
+                } else {
+                    const view = new DataView(new ArrayBuffer(8));
+                    view.setFloat64(0, v);
+                    out.push(0xcb, ...new Uint8Array(view.buffer));
+                }
+            } else if (typeof v === 'string') {
+                const bytes = utf8.encode(v);
+                const n = bytes.length;
+                if (n < 32) out.push(0xa0 | n);
+                else if (n < 0x100) out.push(0xd9, n);
+                else if (n < 0x10000) out.push(0xda, n >> 8, n & 0xff);
+                else out.push(0xdb, (n >>> 24) & 0xff, (n >>> 16) & 0xff, (n >>> 8) & 0xff, n & 0xff);
+                for (const b of bytes) out.push(b);
+            } else if (Array.isArray(v)) {
+                const n = v.length;
+                if (n < 16) out.push(0x90 | n);
+                else out.push(0xdc, n >> 8, n & 0xff);
+                v.forEach(write);
+            } else {
+                const keys = Object.keys(v);
+                const n = keys.length;
+                if (n < 16) out.push(0x80 | n);
+                else out.push(0xde, n >> 8, n & 0xff);
+                keys.forEach((k) => { write(k); write(v[k]); });
+            }
+        };
+        write(value);
+        return new Uint8Array(out);
+    },
+
+    decode(buffer) {
+        const view = new DataView(buffer);
+        const bytes = new Uint8Array(buffer);
+        const utf8 = new TextDecoder();
+        let pos = 0;
+        const str = (n) => { const s = utf8.decode(bytes.subarray(pos, pos + n)); pos += n; return s; };
+        const arr = (n) => { const a = []; for (let i = 0; i < n; i++) a.push(read()); return a; };
+        const map = (n) => { const m = {}; for (let i = 0; i < n; i++) { const k = read(); m[k] = read(); } return m; };
+        const read = () => {
+            const b = bytes[pos++];
+            if (b < 0x80) return b;
+            if (b < 0x90) return map(b & 0x0f);
+            if (b < 0xa0) return arr(b & 0x0f);
+            if (b < 0xc0) return str(b & 0x1f);
+            if (b >= 0xe0) return b - 0x100;
+            let v;
+            switch (b) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xca: v = view.getFloat32(pos); pos += 4; return v;
+                case 0xcb: v = view.getFloat64(pos); pos += 8; return v;
+                case 0xcc: return bytes[pos++];
+                case 0xcd: v = view.getUint16(pos); pos += 2; return v;
+                case 0xce: v = view.getUint32(pos); pos += 4; return v;
+                case 0xcf: v = Number(view.getBigUint64(pos)); pos += 8; return v;
+                case 0xd0: return view.getInt8(pos++);
+                case 0xd1: v = view.getInt16(pos); pos += 2; return v;
+                case 0xd2: v = view.getInt32(pos); pos += 4; return v;
+                case 0xd3: v = Number(view.getBigInt64(pos)); pos += 8; return v;
+                case 0xd9: return str(bytes[pos++]);
+                case 0xda: v = view.getUint16(pos); pos += 2; return str(v);
+                case 0xdb: v = view.getUint32(pos); pos += 4; return str(v);
+                case 0xdc: v = view.getUint16(pos); pos += 2; return arr(v);
+                case 0xdd: v = view.getUint32(pos); pos += 4; return arr(v);
+                case 0xde: v = view.getUint16(pos); pos += 2; return map(v);
+                case 0xdf: v = view.getUint32(pos); pos += 4; return map(v);
+                default: throw new Error(`Unsupported MessagePack byte 0x${b.toString(16)}`);
+            }
+        };
+        return read();
     },
 };
 
@@ -95,15 +257,35 @@ const WebSocketManager = {
     socket: null,
     handlers: {},
     reconnectAttempts: 0,
+    // Lets a dropped socket reattach to the same chat (see server RESUME_GRACE_SECONDS)
+    resumeToken: null,
+    lastSeq: 0,
+    // Offer the compact binary protocol; the server falls back to JSON if it doesn't support it
+    preferBinary: true,
+    binary: false,
+    // RPC calls awaiting a reply: id -> { resolve, reject, timer }
+    pending: {},
+    nextRpcId: 1,
+    rpcTimeoutMs: 10000,
 
     connect() {
         if (this.socket?.readyState === WebSocket.OPEN) return Promise.resolve();
         return new Promise((resolve, reject) => {
-            const url = `${API.WS_URL}/ws/chat/${API.deviceId}`;
+            let url = `${API.WS_URL}/ws/chat/${API.deviceId}`;
+            if (this.resumeToken) {
+                url += `?resume_token=${encodeURIComponent(this.resumeToken)}&last_seq=${this.lastSeq}`;
+            }
             console.log('🔌 [WS-Static] Connecting to:', url);
-            this.socket = new WebSocket(url);
-            this.socket.onopen = () => { this.reconnectAttempts = 0; resolve(); };
+            const protocols = this.preferBinary ? ['chat.msgpack.v1', 'chat.json.v1'] : [];
+            this.socket = new WebSocket(url, protocols);
+            this.socket.binaryType = 'arraybuffer';
+            this.socket.onopen = () => {
+                this.binary = this.socket.protocol === 'chat.msgpack.v1';
+                this.reconnectAttempts = 0;
+                resolve();
+            };
             this.socket.onclose = (e) => {
+                this.failPending('Connection lost');
                 this.triggerHandler('disconnected', { code: e.code, reason: e.reason });
                 if (this.reconnectAttempts < 5) {
                     this.reconnectAttempts++;
@@ -112,22 +294,82 @@ const WebSocketManager = {
             };
             this.socket.onerror = (e) => reject(e);
             this.socket.onmessage = (e) => {
-                try { this.handleMessage(JSON.parse(e.data)); } catch (err) { console.error(err); }
+                try {
+                    this.handleMessage(typeof e.data === 'string' ? JSON.parse(e.data) : this.decodeFrame(e.data));
+                } catch (err) { console.error(err); }
             };
         });
     },
 
-    disconnect() { if (this.socket) { this.socket.close(); this.socket = null; } },
+    disconnect() {
+        this.resumeToken = null;
+        if (this.socket) { this.socket.close(); this.socket = null; }
+    },
 
     send(type, data = {}) {
         if (!this.socket || this.socket.readyState !== WebSocket.OPEN) return false;
-        this.socket.send(JSON.stringify({ type, ...data }));
+        this.socket.send(this.binary ? this.encodeFrame(type, data) : JSON.stringify({ type, ...data }));
         return true;
     },
 
+    isOpen() {
+        return this.socket?.readyState === WebSocket.OPEN;
+    },
+
+    rpc(method, params = {}) {
+        const id = this.nextRpcId++;
+        return new Promise((resolve, reject) => {
+            if (!this.send('rpc', { id, method, params })) {
+                reject(new Error('Not connected'));
+                return;
+            }
+            const timer = setTimeout(() => {
+                delete this.pending[id];
+                reject(new Error('Request timed out'));
+            }, this.rpcTimeoutMs);
+            this.pending[id] = { resolve, reject, timer };
+        });
+    },
+
+    settleRpc(data) {
+        const call = this.pending[data.id];
+        if (!call) return;
+        delete this.pending[data.id];
+        clearTimeout(call.timer);
+        if (data.type === 'rpc_result') call.resolve(data.result);
+        else call.reject(new Error(data.error || 'Request failed'));
+    },
+
+    failPending(reason) {
+        Object.values(this.pending).forEach(call => {
+            clearTimeout(call.timer);
+            call.reject(new Error(reason));
+        });
+        this.pending = {};
+    },
+
+    encodeFrame(type, data) {
+        const [code, fields] = WIRE_SCHEMA.client[type];
+        return MsgPack.encode([code, ...fields.map(f => data[f])]);
+    },
+
+    decodeFrame(buffer) {
+        const frame = MsgPack.decode(buffer);
+        // Frame types without a code arrive as [0, seq, {...}]
+        if (frame[0] === 0) return frame[2];
+        const [type, fields] = WIRE_SCHEMA.server[frame[0]];
+        const data = { type, seq: frame[1] };
+        fields.forEach((f, i) => { data[f] = frame[i + 2]; });
+        // Relayed messages are always from the partner; timestamps are epoch ms
+        if (type === 'message') data.from = 'partner';
+        return data;
+    },
+
     joinQueue(lookingFor = 'any') { return this.send('join_queue', { looking_for: lookingFor }); },
     leaveQueue() { return this.send('leave_queue'); },
-    sendMessage(content) { return this.send('send_message', { content }); },
+    sendMessage(content, clientId) { return this.send('send_message', { content, client_id: clientId }); },
+    sendTyping(isTyping) { return this.send('typing', { is_typing: isTyping }); },
+    markRead(messageId) { return this.send('read', { message_id: messageId }); },
     leaveChat() { return this.send('leave_chat'); },
     nextMatch(lookingFor = 'any') { return this.send('next_match', { looking_for: lookingFor }); },
 
@@ -142,6 +384,15 @@ const WebSocketManager = {
         if (this.handlers[event]) this.handlers[event].forEach(h => h(data));
     },
     handleMessage(data) {
+        if (data.type === 'connected') {
+            this.resumeToken = data.resume_token;
+            this.lastSeq = 0;
+        }
+        if (data.seq > this.lastSeq) this.lastSeq = data.seq;
+        if (data.type === 'rpc_result' || data.type === 'rpc_error') {
+            this.settleRpc(data);
+            return;
+        }
         const { type, ...payload } = data;
         this.triggerHandler(type, payload);
     },
@@ -11,6 +11,11 @@ const App = {
     queueTimer: null,
     queueStartTime: null,
     cameraStream: null,
+    isTyping: false,
+    typingTimer: null,
+    readTimer: null,
+    lastReceivedId: 0,
+    sentCount: 0,
 
     // Initialize app
     async init() {
@@ -67,6 +72,7 @@ const App = {
         document.getElementById('message-input').addEventListener('keypress', (e) => {
             if (e.key === 'Enter') this.sendMessage();
         });
+        document.getElementById('message-input').addEventListener('input', () => this.handleTyping());
         document.getElementById('send-btn').addEventListener('click', () => this.sendMessage());
         document.getElementById('leave-btn').addEventListener('click', () => this.leaveChat());
         document.getElementById('next-btn').addEventListener('click', () => this.nextMatch());
@@ -234,7 +240,14 @@ const App = {
 
     // WebSocket event handlers
     setupWebSocketHandlers() {
-        WebSocketManager.on('connected', () => console.log('WS Connected'));
+        WebSocketManager.on('connected', () => {
+            console.log('WS Connected');
+            // A fresh session means any chat we were in could not be resumed
+            if (this.currentScreen === 'chat') {
+                this.showScreen('dashboard');
+                this.updateDashboard();
+            }
+        });
 
         WebSocketManager.on('queued', () => {
             console.log('Added to queue');
@@ -247,6 +260,9 @@ const App = {
             }
 
             this.partnerData = data.partner;
+            this.sentCount = 0;
+            this.lastReceivedId = 0;
+            this.setPartnerTyping(false);
             document.getElementById('partner-nickname').textContent = data.partner.nickname;
             document.getElementById('chat-partner-name').textContent = data.partner.nickname;
             document.getElementById('chat-start-time').textContent = new Date().toLocaleTimeString();
@@ -262,7 +278,35 @@ const App = {
         });
 
         WebSocketManager.on('message', (data) => {
+            this.setPartnerTyping(false);
             this.appendMessage(data.content, 'received', data.timestamp);
+            this.scheduleReadReceipt(data.id);
+        });
+
+        WebSocketManager.on('partner_typing', (data) => this.setPartnerTyping(data.is_typing));
+
+        WebSocketManager.on('read_receipt', (data) => this.markSeen(data.message_id));
+
+        WebSocketManager.on('message_sent', (data) => this.confirmSent(data.client_id, data.id));
+
+        WebSocketManager.on('message_not_sent', (data) => {
+            this.markNotSent(data.client_id);
+            this.showToast('error', data.message);
+        });
+
+        WebSocketManager.on('partner_reconnecting', () => {
+            this.showToast('warning', 'Partner lost connection, waiting for them...');
+        });
+
+        WebSocketManager.on('partner_resumed', () => {
+            this.showToast('success', 'Partner is back');
+        });
+
+        WebSocketManager.on('resumed', (data) => {
+            if (!data.in_chat && this.currentScreen === 'chat') {
+                this.showScreen('dashboard');
+                this.updateDashboard();
+            }
         });
 
         WebSocketManager.on('partner_left', () => {
@@ -288,17 +332,78 @@ const App = {
 
         if (!content) return;
 
-        WebSocketManager.sendMessage(content);
-        this.appendMessage(content, 'sent');
+        // Shown as pending until the server confirms it with the id the
+        // partner's read receipts will use; sending ends our typing state
+        this.sentCount++;
+        WebSocketManager.sendMessage(content, this.sentCount);
+        this.appendMessage(content, 'sent', null, this.sentCount);
         input.value = '';
+        clearTimeout(this.typingTimer);
+        this.isTyping = false;
     },
 
-    appendMessage(content, type, timestamp) {
+    // Typing state is coalesced server-side; only send edges and an idle timeout
+    handleTyping() {
+        if (!this.isTyping) {
+            this.isTyping = true;
+            WebSocketManager.sendTyping(true);
+        }
+        clearTimeout(this.typingTimer);
+        this.typingTimer = setTimeout(() => {
+            this.isTyping = false;
+            WebSocketManager.sendTyping(false);
+        }, 3000);
+    },
+
+    setPartnerTyping(isTyping) {
+        document.getElementById('partner-status').textContent = isTyping ? 'typing…' : 'Connected';
+    },
+
+    // Acknowledge only the latest message, once the burst settles
+    scheduleReadReceipt(messageId) {
+        if (!messageId) return;
+        this.lastReceivedId = Math.max(this.lastReceivedId, messageId);
+        clearTimeout(this.readTimer);
+        this.readTimer = setTimeout(() => WebSocketManager.markRead(this.lastReceivedId), 300);
+    },
+
+    confirmSent(clientId, messageId) {
+        const container = document.getElementById('chat-messages');
+        container.querySelectorAll('.message.sent.message-pending').forEach(el => {
+            const id = Number(el.dataset.clientId);
+            if (id === clientId) {
+                el.dataset.seq = messageId;
+                el.classList.remove('message-pending');
+            } else if (id < clientId) {
+                // Frames are handled in order: no answer by now means the
+                // rate limiter dropped it
+                el.classList.replace('message-pending', 'message-not-sent');
+            }
+        });
+    },
+
+    markNotSent(clientId) {
+        const msg = document.querySelector(`.message.sent[data-client-id="${clientId}"]`);
+        if (msg) msg.classList.replace('message-pending', 'message-not-sent');
+    },
+
+    markSeen(messageId) {
+        const container = document.getElementById('chat-messages');
+        container.querySelectorAll('.message-seen').forEach(el => el.classList.remove('message-seen'));
+        const msg = container.querySelector(`.message.sent[data-seq="${messageId}"] .message-time`);
+        if (msg) msg.classList.add('message-seen');
+    },
+
+    appendMessage(content, type, timestamp, clientId) {
         const container = document.getElementById('chat-messages');
         const time = timestamp ? new Date(timestamp).toLocaleTimeString() : new Date().toLocaleTimeString();
 
         const msgDiv = document.createElement('div');
         msgDiv.className = `message ${type}`;
+        if (clientId) {
+            msgDiv.classList.add('message-pending');
+            msgDiv.dataset.clientId = clientId;
+        }
         msgDiv.innerHTML = `
             ${content}
             <span class="message-time">${time}</span>
@@ -175,6 +175,14 @@ export class WebSocketManager {
         return this.send('send_message', { content });
     }
 
+    sendTyping(isTyping: boolean) {
+        return this.send('typing', { is_typing: isTyping });
+    }
+
+    markRead(messageId: number) {
+        return this.send('read', { message_id: messageId });
+    }
+
     leaveChat() {
         return this.send('leave_chat');
     }